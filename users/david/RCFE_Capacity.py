@@ -13,44 +13,127 @@ Purpose:
             Answer stored in count_RCFEs dictionary
         2) What is the capacity (by licensed bed) in a given community?
             Answer stored in capacity_RCFEs dictionary
+        Both are computed in a single grouped pass by rcfe_capacity(), which returns the
+        count and capacity per zipcode for any status filter
+        (python RCFE_Capacity.py --benchmark compares it with the original loop)
 
 Notes:
     1) Manually deleted columns V and onward since they created errors when reading into a df and are not relevant
     2) Filtered the df to exclude any facility that is in closed, pending, or unlicensed status
+       (any other status filter can be passed to rcfe_capacity)
     3) INFO: Zillow lists 132 different zip codes in San Diego County
 """
 
 #import necessary libraries
-import pandas as pd
 import os
+import sys
+import timeit
+import pandas as pd
+
+#data file (in the directory of this script)
+DATA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         'ResidentialElderCareFacility01012017.csv')
+
+#facilities in these statuses are excluded by default
+EXCLUDED_STATUSES = ['CLOSED', 'PENDING', 'UNLICENSED']
+
+
+def load_rcfes(fname=DATA_FILE, county='SAN DIEGO'):
+    """Read the CDSS RCFE list and keep the facilities in county (all
+    counties, i.e. the statewide extract, if county is None)."""
+    df = pd.read_csv(fname)
+    if county is not None:
+        df = df[df['County Name'] == county]
+    return df
+
+
+def filter_status(df, include=None, exclude=EXCLUDED_STATUSES):
+    """Keep the facilities whose status is in include (any status if None)
+    and not in exclude."""
+    mask = pd.Series(True, index=df.index)
+    if include is not None:
+        mask &= df['Facility Status'].isin(include)
+    if exclude:
+        mask &= ~df['Facility Status'].isin(exclude)
+    return df[mask]
+
+
+def rcfe_capacity(df, include=None, exclude=EXCLUDED_STATUSES):
+    """Number of RCFEs and their capacity (by licensed bed) per zipcode for
+    the facilities passing the status filter (see filter_status), computed in
+    a single grouped pass. Returns a dataframe indexed by 'Facility Zip' with
+    'count' and 'capacity' columns, zipcodes in order of first appearance."""
+    df = filter_status(df, include, exclude)
+    result = df.groupby('Facility Zip', sort=False)['Facility Capacity'] \
+               .agg(['size', 'sum'])
+    result.columns = ['count', 'capacity']
+    return result
+
+
+def legacy_capacity(q1_df):
+    """Original nested loop version of rcfe_capacity (q1_df already
+    filtered); kept as the reference for benchmark()."""
+    unique_zips = list(q1_df['Facility Zip'].unique())
+
+    count_RCFEs = {}
+    capacity_RCFEs = {}
+    for unique_zipcode in unique_zips:
+        count_RCFEs[unique_zipcode] = 0
+        capacity_RCFEs[unique_zipcode] = 0
+
+    for unique_zipcode in unique_zips:
+        for all_zipcode in q1_df['Facility Zip']:
+            if unique_zipcode == all_zipcode:
+
+                count_RCFEs[unique_zipcode] += 1
+
+                temp_df = q1_df[q1_df['Facility Zip'] == unique_zipcode]
+                capacity_RCFEs[unique_zipcode] = temp_df['Facility Capacity'].sum()
+
+    return count_RCFEs, capacity_RCFEs
+
+
+def benchmark(fname=DATA_FILE, repeat=3):
+    """Time rcfe_capacity against the legacy loop on San Diego County and
+    rcfe_capacity on the statewide extract; checks that both versions agree.
+    Returns the best times in seconds."""
+    times = {}
+
+    sd_df = load_rcfes(fname)
+    q1_df = filter_status(sd_df)
+    count_RCFEs, capacity_RCFEs = legacy_capacity(q1_df)
+    result = rcfe_capacity(sd_df)
+    assert result['count'].to_dict() == count_RCFEs
+    assert result['capacity'].to_dict() == capacity_RCFEs
+
+    times['legacy (San Diego)'] = min(timeit.repeat(
+        lambda: legacy_capacity(filter_status(sd_df)), number=1, repeat=repeat))
+    times['rcfe_capacity (San Diego)'] = min(timeit.repeat(
+        lambda: rcfe_capacity(sd_df), number=1, repeat=repeat))
+
+    state_df = load_rcfes(fname, county=None)
+    times['rcfe_capacity (statewide)'] = min(timeit.repeat(
+        lambda: rcfe_capacity(state_df), number=1, repeat=repeat))
+
+    return times
+
+
+if __name__ == '__main__':
+
+    #python RCFE_Capacity.py --benchmark: compare against the legacy loop
+    if '--benchmark' in sys.argv[1:]:
+        for name, seconds in sorted(benchmark().items()):
+            print('{0:<28} {1:.4f}s'.format(name, seconds))
+        sys.exit(0)
+
+    #create dataframe and filter for RCFEs only in San Diego County
+    q1_df = filter_status(load_rcfes())
+
+    #create a list of unique zipcodes within San Diego County
+    unique_zips = list(q1_df['Facility Zip'].unique())
 
-#change working directory
-os.chdir('')
-
-#create dataframe and filter for RCFEs only in San Diego County
-q1_df = pd.read_csv('ResidentialElderCareFacility01012017.csv')
-q1_df = q1_df[q1_df['County Name'] == 'SAN DIEGO']
-q1_df = q1_df[q1_df['Facility Status'] != 'CLOSED']
-q1_df = q1_df[q1_df['Facility Status'] != 'PENDING']
-q1_df = q1_df[q1_df['Facility Status'] != 'UNLICENSED']
-
-#create a list of unique zipcodes within San Diego County
-unique_zips = list(q1_df['Facility Zip'].unique())
-
-#create two empty dictionaries using the list of unique zipcodes
-count_RCFEs = {}
-capacity_RCFEs = {}
-for unique_zipcode in unique_zips:
-    count_RCFEs[unique_zipcode] = 0
-    capacity_RCFEs[unique_zipcode] = 0
-
-#find the number of RCFEs in each zipcode: count_RCFEs
-#find the capacity within each zipcode: capacity_RCFEs
-for unique_zipcode in unique_zips:
-    for all_zipcode in q1_df['Facility Zip']:
-        if unique_zipcode == all_zipcode:
-            
-            count_RCFEs[unique_zipcode] += 1
-            
-            temp_df = q1_df[q1_df['Facility Zip'] == unique_zipcode]
-            capacity_RCFEs[unique_zipcode] = temp_df['Facility Capacity'].sum()
+    #find the number of RCFEs in each zipcode: count_RCFEs
+    #find the capacity within each zipcode: capacity_RCFEs
+    capacity_df = rcfe_capacity(q1_df)
+    count_RCFEs = capacity_df['count'].to_dict()
+    capacity_RCFEs = capacity_df['capacity'].to_dict()
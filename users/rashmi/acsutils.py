@@ -0,0 +1,239 @@
+#! /usr/bin/env python
+
+#
+# acsutils.py
+#
+# Script with utility functions for describing the cols of ACS (American
+# Community Survey) detailed tables (e.g.: B17024, B19049, B01001)
+#
+# The metadata of a table (a col ID and a label per col, e.g.: HD01_VD94,
+# "Estimate; 55 to 64 years: - Under .50") is compiled once into a schema
+# that holds the kind of each col (estimate, margin of error etc.), its
+# position in the data file, the age band and ratio band it covers (if any)
+# and the margin of error col paired with each estimate. Cols can then be
+# selected by what they hold rather than by their position or ID, e.g.:
+#
+# schema.select(kind=KIND_ESTIMATE,age_min=lambda age: age >= 55)
+#
+
+import os
+import re
+import sys
+import numpy as np
+import pandas as pd
+from collections import OrderedDict
+import genutils as genpy
+
+# col kinds (the part of the label before the first "; ")
+KIND_GEO = 'Geography'
+KIND_ESTIMATE = 'Estimate'
+KIND_MOE = 'Margin of Error'
+
+# prefix of the col IDs of geography cols (GEO.id, GEO.id2 etc.)
+GEO_COL_PREFIX = 'GEO.'
+
+# ratio band of the cols that are not broken down by ratio (in tables that
+# are, e.g.: "Estimate; 55 to 64 years:" in B17024)
+RATIO_TOTAL = 'Total'
+
+# separator of the levels of a label, e.g.: "55 to 64 years: - Under .50"
+LEVEL_REGEX = re.compile(r':\s+-\s+')
+# age bands, e.g.: "Under 6 years", "55 to 64 years", "75 years and over"
+AGE_REGEX = re.compile(r'\byears?\b')
+# ratio bands, e.g.: "Under .50", "1.85 to 1.99", "5.00 and over"
+RATIO_REGEX = re.compile(r'^(Under \d*\.\d+|\d*\.\d+ to \d*\.\d+|' +
+						r'\d*\.\d+ and over)$')
+
+# schema cols
+SCHEMA_COLS = ['pos','kind','label','levels','group','age','age_min',
+				'age_max','ratio','ratio_min','moe']
+
+# compiled schemas, keyed by the metadata they were compiled from
+_SCHEMAS = {}
+
+#
+# parseAge
+#
+# returns the (age, min, max) of the specified age band label, e.g.: "55 to 64
+# years" -> ("55 to 64", 55, 64); max is inf for open ended bands
+#
+def parseAge(level):
+
+	age = AGE_REGEX.sub('',level).replace('  ',' ').strip()
+	bounds = [int(n) for n in re.findall(r'\d+',age)]
+
+	if not bounds:
+		return age, np.nan, np.nan
+	if age.startswith('Under'):
+		return age, 0, bounds[0] - 1
+	if age.endswith('and over'):
+		return age, bounds[0], np.inf
+
+	return age, bounds[0], bounds[-1]
+
+#
+# parseRatio
+#
+# returns the lower bound of the specified ratio band label, e.g.: "1.85 to 
+# 1.99" -> 1.85 and "Under .50" -> 0
+#
+def parseRatio(ratio):
+
+	if ratio.startswith('Under'):
+		return 0.0
+
+	return float(re.findall(r'\d*\.\d+',ratio)[0])
+
+#
+# parseLabel
+#
+# returns the (kind, label, levels) of the specified ACS col label, e.g.:
+# "Estimate; 55 to 64 years: - Under .50" -> ("Estimate", "55 to 64 years: -
+# Under .50", ("55 to 64 years", "Under .50"))
+#
+def parseLabel(col,label):
+
+	if col.startswith(GEO_COL_PREFIX):
+		return KIND_GEO, label, ()
+
+	kind, sep, rest = label.partition('; ')
+	if not sep:
+		return kind, label, ()
+
+	levels = tuple(level.strip().rstrip(':').strip()
+				for level in LEVEL_REGEX.split(rest))
+
+	return kind, rest, levels
+
+#
+# ACSTableSchema
+#
+# compiled description of the cols of an ACS table; frame holds a row per col
+# (indexed by col ID, in data file order) with the SCHEMA_COLS
+#
+class ACSTableSchema(object):
+
+	def __init__(self,frame):
+		self.frame = frame
+
+	#
+	# select
+	#
+	# returns the IDs of the cols (in data file order) matching all of the
+	# specified criteria (schema col -> value, list of values or predicate)
+	#
+	def select(self,**criteria):
+
+		rows = np.ones(len(self.frame.index),bool)
+		for name, value in criteria.iteritems():
+			values = self.frame[name]
+			if callable(value):
+				match = values.map(lambda v: v == v and v is not None and
+								bool(value(v)))
+			elif isinstance(value,(list,tuple,set)):
+				match = values.isin(list(value))
+			else:
+				match = values == value
+			rows &= match.values.astype(bool)
+
+		return self.frame.index[rows].tolist()
+
+	#
+	# describe
+	#
+	# returns the schema row of the specified col as a dictionary
+	#
+	def describe(self,col):
+		return self.frame.loc[col].to_dict()
+
+	#
+	# moeCol
+	#
+	# returns the margin of error col paired with the specified estimate col
+	# (None if there is none)
+	#
+	def moeCol(self,col):
+		moe = self.frame.at[col,'moe']
+		return None if pd.isnull(moe) else moe
+
+#
+# compileSchema
+#
+# compiles the specified ACS table metadata (a data frame with col IDs in the
+# first col and their labels in the second, as in the metadata file of an ACS
+# archive) into an ACSTableSchema; compiled once per process per metadata
+#
+def compileSchema(df_fields):
+
+	cols = tuple(df_fields.iloc[:,0].astype(str))
+	labels = tuple(df_fields.iloc[:,1].astype(str))
+
+	key = (cols,labels)
+	if key in _SCHEMAS:
+		return _SCHEMAS[key]
+
+	rows = []
+	for pos, (col, label) in enumerate(zip(cols,labels)):
+		kind, rest, levels = parseLabel(col,label)
+
+		age = np.nan; ageMin = np.nan; ageMax = np.nan
+		ratio = np.nan; ratioMin = np.nan
+		group = []
+		for level in levels:
+			if RATIO_REGEX.match(level):
+				ratio = level; ratioMin = parseRatio(level)
+			elif AGE_REGEX.search(level):
+				age, ageMin, ageMax = parseAge(level)
+			else:
+				group.append(level)
+
+		rows.append([pos,kind,rest,levels," - ".join(group) or np.nan,age,
+					ageMin,ageMax,ratio,ratioMin,np.nan])
+
+	frame = pd.DataFrame(index=pd.Index(cols,name='col'),columns=SCHEMA_COLS,
+						data=rows)
+
+	# tables broken down by ratio: cols of an age band that are not are the
+	# band totals
+	if frame['ratio'].notnull().any():
+		totals = frame['ratio'].isnull() & frame['age'].notnull()
+		frame.loc[totals,'ratio'] = RATIO_TOTAL
+
+	# estimates are paired with the margin of error col of the same label
+	moes = frame[frame['kind'] == KIND_MOE]
+	moeCols = dict(zip(moes['label'],moes.index))
+	estimates = frame['kind'] == KIND_ESTIMATE
+	frame.loc[estimates,'moe'] = frame.loc[estimates,'label'].map(moeCols)
+
+	schema = ACSTableSchema(frame)
+	_SCHEMAS[key] = schema
+
+	return schema
+
+#
+# loadSchema
+#
+# compiles the schema of the ACS table described by the specified metadata
+# file (a member of archive, if specified)
+#
+def loadSchema(metafile,archive=None):
+
+	with genpy.openDataFile(metafile,archive) as f:
+		df_fields = pd.read_csv(f,header=None)
+
+	return compileSchema(df_fields)
+
+#
+# loadDataSchema
+#
+# compiles the schema of the ACS table in the specified data file (a member of
+# archive, if specified) from its header rows; ACS data files with annotations
+# hold the col IDs in the first row and their labels in the second
+#
+def loadDataSchema(datafile,archive=None):
+
+	with genpy.openDataFile(datafile,archive) as f:
+		header = pd.read_csv(f,nrows=1,dtype=str)
+
+	return compileSchema(pd.DataFrame({0: header.columns,
+									1: header.iloc[0].values}))
@@ -13,22 +13,42 @@
 # Usage: 
 #
 # python afc_aggregate.py
+# python afc_aggregate.py --registry county_registry.json [--processes N]
+# python afc_aggregate.py --panel 2012,2015,2030 [--panel-format long|wide]
+#
+# --rollups additionally writes the counts rolled up to SRA, Region, County 
+# (and, in multi-county mode, statewide) level
+#
+# Parsed data files are cached (by content) under .afc_cache in the current 
+# working directory; use --no-cache to parse all data files from scratch
+#
+# Per-stage metrics (timings, row counts, memory) are written as JSON lines to
+# the file named by AFC_METRICS and stages matching AFC_PROFILE are profiled
+# (see instrutils.py)
 #  
 # Dependencies: 
 #
 # Required intermediary data files are under the current working directory
+# (or, in multi-county mode, as specified in the county registry)
 #
 ################################################################################
 
 import os
 import sys
 import csv
+import json
+import argparse
+import multiprocessing
+from multiprocessing.pool import ThreadPool
 import pandas as pd
 import numpy as np
 import pprint
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 import genutils as genpy
 import sdpyutils as sdpy  
+import cacheutils as cachepy
+import instrutils as instrpy
+import schemautils as schemapy
 
 #
 # GLOBALS 
@@ -40,6 +60,15 @@ CWD = os.getcwd()
 # output data file
 OUT_VERSION = '20170321'
 OUT_CSV = 'afc' + '_' + OUT_VERSION + ".csv"
+# output data file in multi-county mode
+OUT_CSV_MULTI_COUNTY = 'afc_multi_county' + '_' + OUT_VERSION + ".csv"
+# output data file in panel mode
+OUT_CSV_PANEL = 'afc_panel' + '_' + OUT_VERSION + ".csv"
+# rollups (SRA, Region, County, State) output data file
+OUT_CSV_ROLLUPS = 'afc_rollups' + '_' + OUT_VERSION + ".csv"
+
+# output col names (multi-county mode only)
+OUT_COL_County = 'County'
 
 # output col names
 OUT_COL_SRA = 'SRA'
@@ -76,21 +105,62 @@ OUT_COL_PopMinorityPerRCFE = 'PopMinorityPerRCFE'
 OUT_COL_2012MedianHHIncome = '2012MedianHHIncome'
 OUT_COL_2012MedianHHIncome65Over = '2012MedianHHIncome65Over'
 
-# FIX ME: Make these fields available at some point
-'''
-OUT_COL_2015Pop65Over = '2015Pop65Over'
-OUT_COL_2015Pop55Over = '2015Pop55Over'
-OUT_COL_2015PopADOD55Over = '2015PopADOD55Over'
-OUT_COL_2015ADODPerRCFE = '2015ADODPerRCFE'
-OUT_COL_2015PopLowIncome65Over = '2015PopLowIncome65Over'
-OUT_COL_2015PopLowIncome55Over = '2015PopLowIncome55Over'
-OUT_COL_2015LowIncome65OverPercentage = "2015PercentLowIncome65Over"
-OUT_COL_2015LowIncome55OverPercentage = "2015PercentLowIncome55Over"
-OUT_COL_2015LowIncome65OverPerRCFE = '2015LowIncome65OverPerRCFE'
-OUT_COL_2015PopMinority = '2015PopMinority'
-OUT_COL_2015MedianHHIncome = '2015MedianHHIncome'
-OUT_COL_2015MedianHHIncome65Over = '2015MedianHHIncome65Over'
-'''
+# panel (multi-vintage) mode measures; in wide format output col names are 
+# prefixed with the year (e.g.: 2015Pop65Over, 2015PercentLowIncome65Over) 
+# while in long format the year is held in its own col
+OUT_COL_Year = 'Year'
+
+PANEL_Pop65Over = 'Pop65Over'
+PANEL_Pop55Over = 'Pop55Over'
+PANEL_PopADOD55Over = 'PopADOD55Over'
+PANEL_PopLowIncome55Over = 'PopLowIncome55Over'
+PANEL_PopLowIncome65Over = 'PopLowIncome65Over'
+PANEL_PopMinority = 'PopMinority'
+PANEL_MedianHHIncome = 'MedianHHIncome'
+PANEL_MedianHHIncome65Over = 'MedianHHIncome65Over'
+
+PANEL_ADODPerRCFE = 'ADODPerRCFE'
+PANEL_LowIncome65OverPercentage = 'PercentLowIncome65Over'
+PANEL_LowIncome55OverPercentage = 'PercentLowIncome55Over'
+PANEL_LowIncome65OverPerRCFE = 'LowIncome65OverPerRCFE'
+PANEL_PopMinorityPerRCFE = 'PopMinorityPerRCFE'
+
+PANEL_MEASURES = [PANEL_Pop65Over,PANEL_Pop55Over,PANEL_PopADOD55Over,
+				PANEL_PopLowIncome55Over,PANEL_PopLowIncome65Over,
+				PANEL_PopMinority,PANEL_MedianHHIncome,
+				PANEL_MedianHHIncome65Over]
+PANEL_DERIVED = [PANEL_ADODPerRCFE,PANEL_LowIncome65OverPercentage,
+				PANEL_LowIncome55OverPercentage,PANEL_LowIncome65OverPerRCFE,
+				PANEL_PopMinorityPerRCFE]
+
+# counts rolled up to every level of the geo hierarchy (see createRollups);
+# ratios and medians do not add up and are left out
+ROLLUP_COLS = [OUT_COL_NumRCFELicensed,OUT_COL_NumRCFEBedsLicensed,
+			OUT_COL_NumRCFEPending,OUT_COL_NumRCFEBedsPending,
+			OUT_COL_NumRCFEInALWP,OUT_COL_2012Pop65Over,OUT_COL_2012Pop55Over,
+			OUT_COL_2030Pop65Over,OUT_COL_2030Pop55Over,
+			OUT_COL_2012PopADOD55Over,OUT_COL_2030PopADOD55Over,
+			OUT_COL_2012PopLowIncome65Over,OUT_COL_2012PopLowIncome55Over,
+			OUT_COL_2012PopMinority]
+
+# derived fields (ratios) computed for the SRA aggregate rows (see 
+# addDerivedFields); DERIVED_NA where they cannot be computed
+DERIVED_COLS = [OUT_COL_2012ADODPerRCFE,OUT_COL_2030ADODPerRCFE,
+			OUT_COL_PopMinorityPerRCFE,OUT_COL_2012LowIncome65OverPerRCFE,
+			OUT_COL_2012LowIncome55OverPercentage,
+			OUT_COL_2012LowIncome65OverPercentage]
+
+# county name of the (default) single county data set and the name of the
+# statewide rollup in multi-county mode
+ROLLUP_COUNTY = 'San Diego'
+ROLLUP_STATE = 'California'
+
+# parse task kinds (see runParseTasks)
+PARSE_IO = 'io'
+PARSE_CPU = 'cpu'
+
+# value of derived fields (ratios) that cannot be computed for an SRA
+DERIVED_NA = float(999)
 
 # field names mapping to the geoid dictionary
 GEOID_PARAMS = ['sra','region','zipcodes','zctas']
@@ -104,6 +174,15 @@ out_df = pd.DataFrame()
 DATAFILE_SD_GEOIDS = 'sd_county_sra_zip_zcta.txt'
 # SD county RCFE list
 DATAFILE_SD_RCFE = 'rcfe_sd_county_01012017.csv'
+# fields of interest in the (CDSS) RCFE list
+RCFE_FACZIP = 'Facility Zip'
+RCFE_FACCAP = 'Facility Capacity'
+RCFE_FACSTATUS = 'Facility Status'
+RCFE_FACCOUNTY = 'County Name'
+# number of rows of the RCFE list processed at a time
+RCFE_CHUNKSIZE = 50000
+# county registry key for the county name to filter the RCFE list on
+RCFE_COUNTY = 'rcfe_county'
 # SD county RCFEs in ALWP 
 DATAFILE_SD_RCFE_IN_ALWP = 'rcfe_in_alwp_sd_county_12302016.csv'
 
@@ -126,26 +205,141 @@ DATAFILE_SD_2012_LOW_INCOME_POP_55_OVER = 'low_income_data_sd_county_2012.csv'
 # SD county median house-hold income by age
 DATAFILE_SD_2012_MEDIAN_HH_INCOME = 'ACS_12_5YR_B19049_with_ann.csv'
 
+# data files per vintage (year) used in panel mode; measures for which a 
+# vintage has no data file are left empty (with a warning) and years that are
+# not listed are rejected (see checkVintages). Keys:
+#
+#     pop_55_over - general population 55 and over (SD HHSA)
+# adod_pop_55_over - ADOD population 55 and over (SD HHSA); the file holds one
+#                    col per year
+#  low_income_pop - low income population (see income_stats.py)
+#             pop - population estimate by ethnicity (see demographics.py)
+# median_hh_income - median household income (ACS B19049)
+#
+VINTAGES = OrderedDict([
+	('2012', {
+		'pop_55_over': DATAFILE_SD_2012_POP_55_OVER,
+		'adod_pop_55_over': DATAFILE_SD_ADOD_POP_55_OVER,
+		'low_income_pop': DATAFILE_SD_2012_LOW_INCOME_POP_55_OVER,
+		'pop': DATAFILE_SD_2012_POP,
+		'median_hh_income': DATAFILE_SD_2012_MEDIAN_HH_INCOME
+	}),
+	('2015', {
+		'low_income_pop': 'low_income_data_sd_county_2015.csv',
+		'pop': DATAFILE_SD_2015_POP
+	}),
+	('2030', {
+		'pop_55_over': DATAFILE_SD_2030_POP_55_OVER,
+		'adod_pop_55_over': DATAFILE_SD_ADOD_POP_55_OVER
+	})
+])
+
+# data file keys of a vintage (see VINTAGES)
+VINTAGE_KEYS = ['pop_55_over','adod_pop_55_over','low_income_pop','pop',
+				'median_hh_income']
+
+# data files used to create the AFC data set for a county (defaults to SD 
+# county); in multi-county mode each county in the registry specifies its own
+DATAFILES = {
+	'geoids': DATAFILE_SD_GEOIDS,
+	'rcfe': DATAFILE_SD_RCFE,
+	'rcfe_in_alwp': DATAFILE_SD_RCFE_IN_ALWP,
+	'pop_55_over_2012': DATAFILE_SD_2012_POP_55_OVER,
+	'pop_55_over_2030': DATAFILE_SD_2030_POP_55_OVER,
+	'adod_pop_55_over': DATAFILE_SD_ADOD_POP_55_OVER,
+	'low_income_pop_2012': DATAFILE_SD_2012_LOW_INCOME_POP_55_OVER,
+	'pop_2012': DATAFILE_SD_2012_POP,
+	'median_hh_income_2012': DATAFILE_SD_2012_MEDIAN_HH_INCOME
+}
+
+#
+# aggregateRCFEs
+#
+# computes the number of facilities and the total facility capacity (beds) per 
+# zipcode for each of the specified facility statuses in a single grouped pass 
+# over the facility list
+#
+# Returns a data frame indexed by (integer) zipcode with a pair of cols 
+# (count, beds) per status, ordered as per the specified statuses
+#
+def aggregateRCFEs(csvdata,statuses,zipcol,capcol,statuscol):
+
+	# order cols as (count, beds) per status; statuses with no facilities are
+	# added with zero counts
+	cols = [(stat,status) for status in statuses for stat in ['size','sum']]
+	names = [str(status) + '_' + stat for stat,status in cols]
+
+	df = csvdata[csvdata[statuscol].isin(statuses)]
+	if df.empty:
+		return pd.DataFrame(columns=names,dtype=float)
+
+	zipcodes = pd.to_numeric(df[zipcol],errors='coerce')
+
+	grouped = df[capcol].groupby([zipcodes,df[statuscol]]).agg(['size','sum'])
+	grouped = grouped.unstack(statuscol)
+
+	df_agg = grouped.reindex(columns=cols).fillna(0)
+	df_agg.columns = names
+	df_agg.index.name = zipcol
+
+	return df_agg
+
+#
+# streamRCFEAggregates
+#
+# reads the facility list in chunks, filters each chunk by county (if one is 
+# specified) and status, and folds the per-zipcode aggregates of the chunk 
+# (see aggregateRCFEs) into the running totals. Memory use is bounded by the 
+# chunk size rather than by the size of the facility list
+#
+# Returns the aggregates and whether the capacity field is integer valued in 
+# all chunks
+#
+def streamRCFEAggregates(datafile,statuses,county=None,
+						chunksize=RCFE_CHUNKSIZE):
+
+	usecols = [RCFE_FACZIP,RCFE_FACCAP,RCFE_FACSTATUS]
+	if county is not None:
+		usecols.append(RCFE_FACCOUNTY)
+
+	df_agg = None
+	capIsInt = True
+
+	reader = pd.read_csv(datafile,skipinitialspace=True,usecols=usecols,
+						chunksize=chunksize)
+	for chunk in reader:
+		capIsInt = capIsInt and (chunk[RCFE_FACCAP].dtype.kind in 'iu')
+
+		if county is not None:
+			chunk = chunk[chunk[RCFE_FACCOUNTY] == county]
+
+		chunk_agg = aggregateRCFEs(chunk,statuses,RCFE_FACZIP,RCFE_FACCAP,
+						RCFE_FACSTATUS)
+		if df_agg is None:
+			df_agg = chunk_agg
+		else:
+			df_agg = df_agg.add(chunk_agg,fill_value=0)
+
+	if df_agg is None:
+		# empty facility list
+		df_agg = aggregateRCFEs(pd.DataFrame(columns=usecols),statuses,
+						RCFE_FACZIP,RCFE_FACCAP,RCFE_FACSTATUS)
+
+	return df_agg, capIsInt
+
 #
 # parseRCFEList
 #
 # parses the list of RCFEs and adds relevant data to the data frame that is 
-# returned
+# returned. If a county is specified, only facilities in that county are 
+# counted (e.g.: when parsing the statewide facility list)
 #
-def parseRCFEList(zipdf):
+@instrpy.instrument()
+def parseRCFEList(zipdf,datafile=DATAFILE_SD_RCFE,county=None):
 
-	# these are the fields we are interested in
-	FACZIP = 'Facility Zip'
-	FACCAP = 'Facility Capacity'
-	FACSTATUS = 'Facility Status'
-	
-	csvdata = pd.read_csv(DATAFILE_SD_RCFE,skipinitialspace=True, 
-						usecols=[FACZIP,FACCAP,FACSTATUS])
-	#print csvdata.head()
-	print("parsing data file: " + DATAFILE_SD_RCFE)
+	print("parsing data file: " + datafile)
 
-	# iterate through facility zipcode list and total number of rcfe
-	# and facility capacity for each unique zipcode
+	# total number of rcfe and facility capacity for each unique zipcode
 	#
 	# NOTE: Only facilities with status 'Licensed' OR 'Pending' are counted
 	# Further, seperate counts for only licensed and only pending facilities 
@@ -157,43 +351,25 @@ def parseRCFEList(zipdf):
 	# actual capacity available (or would be available) while the pending-only 
 	# RCFE count is an optimistic estimate of the same. 
 	#
-	rcfe_dict = {}
-	for index,row in csvdata.iterrows():
-		
-		zipcode = row[FACZIP]; capacity = row[FACCAP]
-		status = row[FACSTATUS]
-
-		#print "zipcode: {} capacity: {} status: {}".format(zipcode,capacity,status)
-
-		if zipcode in rcfe_dict:
-			if status == 'LICENSED':
-				rcfe_dict[zipcode][0] += 1
-				rcfe_dict[zipcode][1] += capacity
-			elif status == 'PENDING':
-				rcfe_dict[zipcode][2] += 1
-				rcfe_dict[zipcode][3] += capacity	
-			else: pass	
-		else:
-			if status == 'LICENSED':
-				rcfe_dict[zipcode] = [1,capacity,0,0]				
-			elif status == 'PENDING':
-				rcfe_dict[zipcode] = [0,0,1,capacity]
-			else: pass
-			
-
-	#pprint.pprint(rcfe_dict)
-			
-	data = []		
-	for zipcode in zipdf:
-		if int(zipcode) in rcfe_dict:
-			data.append([rcfe_dict[int(zipcode)][0],rcfe_dict[int(zipcode)][1],
-						rcfe_dict[int(zipcode)][2],rcfe_dict[int(zipcode)][3]])
-		else:
-			data.append([0,0,0,0])
-	
+	df_agg, capIsInt = streamRCFEAggregates(datafile,['LICENSED','PENDING'],
+						county)
+	#print df_agg.head()
+
+	# join the aggregates onto the zipcodes of the geo frame (zipcodes with no 
+	# facilities get zero counts)
 	out_cols = [OUT_COL_NumRCFELicensed,OUT_COL_NumRCFEBedsLicensed,
-				OUT_COL_NumRCFEPending,OUT_COL_NumRCFEBedsPending]		
+				OUT_COL_NumRCFEPending,OUT_COL_NumRCFEBedsPending]
+	data = df_agg.reindex(sdpy.codeZipcodes(zipdf)).fillna(0).values
+
 	df = pd.DataFrame(columns=out_cols,data=data)
+
+	# facility counts are integers; bed totals retain the type of the capacity
+	# field
+	countCols = out_cols[0::2]; bedCols = out_cols[1::2]
+	df[countCols] = df[countCols].astype(int)
+	if capIsInt:
+		df[bedCols] = df[bedCols].astype(int)
+
 	#print df.head()
 	return df				
 
@@ -203,15 +379,16 @@ def parseRCFEList(zipdf):
 # parses the data file listing RCFEs in the ALWP program and adds a column 
 # indicating the same 
 #
-def parseRCFEInALWP(zipdf):
+@instrpy.instrument()
+def parseRCFEInALWP(zipdf,datafile=DATAFILE_SD_RCFE_IN_ALWP):
 
 	# these are the fields we are interested in
 	ZIPCODE = 'Zip Code'
 
-	csvdata = pd.read_csv(DATAFILE_SD_RCFE_IN_ALWP,skipinitialspace=True, 
+	csvdata = pd.read_csv(datafile,skipinitialspace=True, 
 						usecols=[ZIPCODE])
 	#print csvdata
-	print("parsing data file: " + DATAFILE_SD_RCFE_IN_ALWP)
+	print("parsing data file: " + datafile)
 
 	# iterate through the zipcodes
 	alwp_dict = {}
@@ -243,6 +420,7 @@ def parseRCFEInALWP(zipdf):
 #
 # this version extracts data from the SANDAG dataset. 
 # 
+@instrpy.instrument()
 def parsePopulation(srazipdf,datafile,out_cols):
 	
 	# these are the fields we are interested in
@@ -288,6 +466,7 @@ def parsePopulation(srazipdf,datafile,out_cols):
 # consistent - resulting in an accurate representaton of the percentage of ADOD
 # in the general population
 #
+@instrpy.instrument()
 def parsePopulation_v2(srazipdf,datafile,cols):
 
 	USECOLS = ['SRA','55-64','65-74','75-84','85 and Over','55 and Over']
@@ -297,63 +476,52 @@ def parsePopulation_v2(srazipdf,datafile,cols):
 	#print csvdata
 	print("parsing data file: " + datafile)
 
-	pop_dict = {}
-	for index, row in csvdata.iterrows():
-		sra = row['SRA']
-		
-		pop_65_over = int(row['65-74'].replace(",","")) + \
-					int(row['75-84'].replace(",","")) + \
-					int(row['85 and Over'].replace(",",""))
-	
-		pop_55_over = int(row['55 and Over'].replace(",","")) 
-		
-		pop_dict[sra] = [pop_65_over,pop_55_over]
-	
-	#pprint.pprint(pop_dict)							
+	def toCounts(col):
+		counts, imputed = genpy.cleanNumeric(csvdata[col],errors='raise')
+		return pd.Series(counts).astype(np.int64)
 
-	data = []
-	for sra,zipcode in srazipdf.itertuples(index=False):
-		if ((int(zipcode) == 0) and (sra in pop_dict)):
-			data.append([pop_dict[sra][0],pop_dict[sra][1]])
-		else:
-			data.append([0,0])
-				
-	df = pd.DataFrame(columns=cols,data=data)
+	pop_df = pd.DataFrame(index=csvdata['SRA'].values)
+	pop_df[cols[0]] = (toCounts('65-74') + toCounts('75-84') + 
+					toCounts('85 and Over')).values
+	pop_df[cols[1]] = toCounts('55 and Over').values
+
+	df = sdpy.joinSRAData(srazipdf,pop_df,cols)
 	return df
 
 #
 # parseADODPopulation
 #
-# Extracts ADOD population data for 55 Over from San Diego HHSA dataset
+# Extracts ADOD population data for 55 Over from San Diego HHSA dataset for 
+# the specified years (cols of the dataset) into the specified out_cols
 #
-def parseADODPopulation(srazipdf):
+@instrpy.instrument()
+def parseADODPopulation(srazipdf,datafile=DATAFILE_SD_ADOD_POP_55_OVER,
+						years=('2012','2030'),out_cols=None):
   
-  	USECOLS = ['SRA','2012','2030']
-	out_cols = [OUT_COL_2012PopADOD55Over,OUT_COL_2030PopADOD55Over]
+	USECOLS = ['SRA'] + list(years)
+	if out_cols is None:
+		out_cols = [OUT_COL_2012PopADOD55Over,OUT_COL_2030PopADOD55Over]
 
 	#FIXME: results in XLRD Error
   	#sheet = "Page_1_1"    
 	#xl = pd.ExcelFile(DATAFILE_SD_ADOD_POP_55_OVER)
 	#xldata = xl.parse(sheet) 
 
-	csvdata  = pd.read_csv(DATAFILE_SD_ADOD_POP_55_OVER,skipinitialspace=True,
+	csvdata  = pd.read_csv(datafile,skipinitialspace=True,
 					skiprows=1,usecols=USECOLS)
 	#print csvdata
-	print("parsing data file: " + DATAFILE_SD_ADOD_POP_55_OVER)
+	print("parsing data file: " + datafile)
 
-	adod_dict = csvdata.set_index('SRA').T.to_dict('list')	
-	#pprint.pprint(adod_dict)
-		
-	data = []
-	for sra,zipcode in srazipdf.itertuples(index=False):
-		if ((int(zipcode) == 0) and (sra in adod_dict)):
-			adod_pop_curr = (adod_dict[sra][0]).replace(",","")
-			adod_pop_2030 = (adod_dict[sra][1]).replace(",","")
-			data.append([adod_pop_curr,adod_pop_2030]) 
-		else:
-			data.append([0,0])	
+	# usecols does not reorder cols
+	csvdata = csvdata[USECOLS]
 
-	df = pd.DataFrame(columns=out_cols,data=data)
+	# counts are kept as written (sans thousands separators) so that suppressed
+	# counts (e.g.: "<5") are reported as such
+	adod_df = csvdata.set_index('SRA').apply(
+					lambda col: col.astype(str).str.replace(",",""))
+	adod_df.columns = out_cols
+
+	df = sdpy.joinSRAData(srazipdf,adod_df,out_cols)
 	return df	
 
 #
@@ -361,6 +529,7 @@ def parseADODPopulation(srazipdf):
 #
 # extracts low income senior population counts from the specified data file
 # 
+@instrpy.instrument()
 def parseLowIncomePopulation(srazipdf,datafile,cols):
 
 	USECOLS = ['SRA','Zipcode','55 and Over (Low Income)','65 and Over (Low Income)']
@@ -369,26 +538,17 @@ def parseLowIncomePopulation(srazipdf,datafile,cols):
 	#print csvdata
 	print("parsing data file: " + datafile)
 
-	# we need a nested dictionary for lookup since there is no single unique key
-	# rather, the key is a combination of SRA and zipcode
-	income_dict = defaultdict(lambda: defaultdict(dict))
-	
-	for index, row in csvdata.iterrows():
-		income_dict[row['SRA']][int(row['Zipcode'])] = \
-				[row['55 and Over (Low Income)'],row['65 and Over (Low Income)']]
-
-	#pprint.pprint(income_dict)
-		
-	data = []
-	for sra,zipcode in srazipdf.itertuples(index=False):
-		if ((sra in income_dict) and (int(zipcode) in income_dict[sra])):
-			pop_55_over = (income_dict[sra][int(zipcode)][0])
-			pop_65_over = (income_dict[sra][int(zipcode)][1])
-			data.append([int(pop_55_over),int(pop_65_over)]) 
-		else:
-			data.append([0,0])	
-
-	df = pd.DataFrame(columns=cols,data=data)
+	# there is no single unique key; rather, the key is a combination of SRA 
+	# and zipcode
+	income_df = pd.DataFrame(index=pd.MultiIndex.from_arrays(
+						[csvdata['SRA'].values,
+						sdpy.codeZipcodes(csvdata['Zipcode'])]))
+	income_df[cols[0]] = csvdata['55 and Over (Low Income)'].astype(
+						np.int64).values
+	income_df[cols[1]] = csvdata['65 and Over (Low Income)'].astype(
+						np.int64).values
+
+	df = sdpy.joinSRAZipData(srazipdf,income_df,cols)
 	return df	
 
 #
@@ -397,6 +557,7 @@ def parseLowIncomePopulation(srazipdf,datafile,cols):
 # extracts population counts for minorities from the SANDAG population estimate
 # dataset
 #
+@instrpy.instrument()
 def parseMinorityPopulation(srazipdf,datafile,cols):
 
 	USECOLS=['SRA','TYPE','Two or More','Other','Pacific Islander','Asian',
@@ -409,31 +570,17 @@ def parseMinorityPopulation(srazipdf,datafile,cols):
 
 	nonWhiteCols = USECOLS[2:-2] + [USECOLS[-1]]
 	
-	pop_dict = {}
-	for index, row in csvdata.iterrows():
-		sra = row['SRA']
-		if row['TYPE'] != 'Total':
-			continue
-		else:		
-			# for now we are only considering non-white populations of single ethnicity
-			# i.e.: populations with two or more ethnicities (one of which may be white)
-			# are not accounted for in minority_pop
-			minority_pop = (row[nonWhiteCols[1:]].apply(pd.to_numeric)).sum()
-			#minority_pop_multi_ethnic = (row[nonWhiteCols].apply(pd.to_numeric)).sum()
-
-			pop_dict[sra] = minority_pop
-			#pop_dict[sra] = [minority_pop,minority_pop_multi_ethnic]
-	
-	#pprint.pprint(pop_dict)
+	# we only care about total counts not splits by gender
+	csvdata = csvdata[csvdata['TYPE'] == 'Total']
 
-	data = []
-	for sra,zipcode in srazipdf.itertuples(index=False):
-		if ((int(zipcode) == 0) and (sra in pop_dict)):
-			data.append(pop_dict[sra])
-		else:
-			data.append(0)
-				
-	df = pd.DataFrame(columns=cols,data=data)
+	# for now we are only considering non-white populations of single ethnicity
+	# i.e.: populations with two or more ethnicities (one of which may be white)
+	# are not accounted for in minority_pop
+	pop_df = pd.DataFrame(index=csvdata['SRA'].values)
+	pop_df[cols[0]] = csvdata[nonWhiteCols[1:]].apply(pd.to_numeric).sum(
+						axis=1).values
+
+	df = sdpy.joinSRAData(srazipdf,pop_df,cols)
 	#print df.head()
 	return df
 
@@ -442,6 +589,7 @@ def parseMinorityPopulation(srazipdf,datafile,cols):
 # 
 # extracts the median household income information from the specified datafile
 # 
+@instrpy.instrument()
 def parseMedianHHIncome(df_geoids,datafile,cols):
 
 	# index of GEO.id2 which contains ZCTA as numbers
@@ -461,12 +609,18 @@ def parseMedianHHIncome(df_geoids,datafile,cols):
 	
 	# merge data as per SRA/Zipcodes specified in df_geoids
 	df_mi = pd.merge(left=df_geoids,right=csvdata[1:],left_on='ZCTA',
-					right_on=COL_ZCTA,how='left').fillna(0)
+					right_on=COL_ZCTA,how='left')
+	# (only the merged cols are filled; geoID cols are categoricals)
+	df_mi = df_mi.fillna(dict.fromkeys(csvdata.columns,0))
 	df_mi.drop(COL_ZCTA,axis=1,inplace=True)
 
 	# convert the cols to numeric (needed for aggregation) 
-	tmp_df = df_mi[cols].applymap(genpy.to_stringnum)
-	tmp_df = tmp_df.applymap(pd.to_numeric)
+	# medians that are not available (e.g.: "-") are set to 0 and top/bottom
+	# coded medians (e.g.: "250,000+") to the coding limit
+	tmp_df = pd.DataFrame(index=df_mi.index)
+	for col in cols:
+		values, imputed = genpy.cleanNumeric(df_mi[col],errors='raise')
+		tmp_df[col] = np.nan_to_num(values).astype(np.int64)
 	df_mi = pd.concat([df_geoids,tmp_df],axis=1)
 
 	# aggregate numbers for each SRA
@@ -475,195 +629,671 @@ def parseMedianHHIncome(df_geoids,datafile,cols):
 
 	#print df_mi
 	
-	# we need a nested dictionary for lookup since there is no single unique key
-	# rather, the key is a combination of SRA and zipcode
-	mi_dict = defaultdict(lambda: defaultdict(dict))
+	# there is no single unique key; rather, the key is a combination of SRA 
+	# and zipcode
+	mi_df = pd.DataFrame(index=pd.MultiIndex.from_arrays(
+						[df_mi['SRA'].values,
+						sdpy.codeZipcodes(df_mi['Zipcode'])]))
+	for col in cols:
+		mi_df[col] = df_mi[col].astype(np.int64).values
+
+	df = sdpy.joinSRAZipData(df_geoids[['SRA','Zipcode']],mi_df,cols)
+	#print df.head()
+	
+	return df
+	
+#
+# roundHalf
+#
+# rounds the values to the specified number of decimals exactly as python's 
+# round() does (ties away from zero, on the exact value of the float); 
+# np.round and floor(x * 100 + 0.5) / 100 scale the values first and so 
+# differ from round() on some values that are not ties
+#
+def roundHalf(values,decimals=0):
+	return np.array([round(v,decimals) for v in values],dtype=np.float64)
 
-	for index, row in df_mi.iterrows():
-		mi_dict[row['SRA']][int(row['Zipcode'])] = \
-				[int(row[cols[0]]),int(row[cols[1]])]
+#
+# computeRatio
+#
+# computes num/den (scaled by the specified factor and rounded to 2 decimals,
+# see roundHalf)
+# for all rows at once; suppressed counts (e.g.: "<5") are imputed (see 
+# genutils.cleanNumeric) and rows where either value is not available or where 
+# den is not positive are set to DERIVED_NA. Returns (ratios, mask) where mask
+# flags the ratios computed from imputed values
+#
+def computeRatio(num,den,scale=1):
 
-	#pprint.pprint(mi_dict)
-	
+	num, numImputed = genpy.cleanNumeric(num)
+	den, denImputed = genpy.cleanNumeric(den)
+
+	ratio = np.full(len(num),DERIVED_NA)
+	valid = ~np.isnan(num) & (np.nan_to_num(den) > 0)
+	ratio[valid] = roundHalf((num[valid] / den[valid]) * scale,2)
+
+	return ratio, valid & (numImputed | denImputed)
+
+#
+# aggregateRCFECounts
+#
+# aggregates RCFE counts across the zipcodes of each SRA into the SRA 
+# aggregate row (last row of the SRA) and returns the mask of SRA aggregate 
+# rows
+#
+def aggregateRCFECounts(out_df):
+
+	countCols = [OUT_COL_NumRCFELicensed,OUT_COL_NumRCFEBedsLicensed,
+				OUT_COL_NumRCFEPending,OUT_COL_NumRCFEBedsPending,
+				OUT_COL_NumRCFEInALWP]
+
+	sdpy.addSRAaggregates(out_df,countCols)
+
+	return ~out_df.duplicated(OUT_COL_SRA,keep='last')
+
+#
+# addRatios
+#
+# computes the specified ratios, a list of (col, numerator col, denominator 
+# col, scale) tuples, for the SRA aggregate rows; ratios for zipcode rows are 
+# left as is
+#
+def addRatios(out_df,aggRows,ratios):
+
+	agg_df = out_df[aggRows]
+
+	# note: population counts may be suppressed (e.g.: "<5"); ratios that
+	# depend on such a count are computed from an imputed value
+	for col, numCol, denCol, scale in ratios:
+		ratio, imputed = computeRatio(agg_df[numCol],agg_df[denCol],scale)
+		out_df.loc[aggRows,col] = ratio
+		if imputed.any():
+			print("note: " + col + " computed from imputed counts for " +
+				str(imputed.sum()) + " SRA(s)")
+
+	return out_df
+
+#
+# addDerivedFields
+#
+# aggregates RCFE counts per SRA and computes the derived fields for the SRA 
+# aggregate rows
+#
+@instrpy.instrument()
+def addDerivedFields(out_df):
+
+	aggRows = aggregateRCFECounts(out_df)
+
+	ratios = [
+		(OUT_COL_2012ADODPerRCFE,OUT_COL_2012PopADOD55Over,
+			OUT_COL_NumRCFELicensed,1),
+		(OUT_COL_2030ADODPerRCFE,OUT_COL_2030PopADOD55Over,
+			OUT_COL_NumRCFELicensed,1),
+		(OUT_COL_PopMinorityPerRCFE,OUT_COL_2012PopMinority,
+			OUT_COL_NumRCFELicensed,1),
+		(OUT_COL_2012LowIncome65OverPerRCFE,OUT_COL_2012PopLowIncome65Over,
+			OUT_COL_NumRCFELicensed,1),
+		(OUT_COL_2012LowIncome55OverPercentage,OUT_COL_2012PopLowIncome55Over,
+			OUT_COL_2012Pop55Over,100),
+		(OUT_COL_2012LowIncome65OverPercentage,OUT_COL_2012PopLowIncome65Over,
+			OUT_COL_2012Pop65Over,100)]
+
+	return addRatios(out_df,aggRows,ratios)
+
+#
+# callParser
+#
+# calls parser func with the specified args, where datafile is the file that
+# func parses; results are served from (and added to) the parse cache if one 
+# is specified
+#
+def callParser(cache,datafile,func,*args):
+
+	if cache is None:
+		return schemapy.applySchema(func(*args))
+
+	return schemapy.applySchema(cache.call(datafile,func,*args))
+
+#
+# runParseTasks
+#
+# runs the specified parse tasks and returns their results (in task order).
+# In parallel mode, I/O bound parsers are run in a thread pool and CPU bound
+# ones in a process pool; the results are identical to those of a serial run
+#
+def runParseTasks(tasks,cache,parallel=False):
+
+	if not parallel:
+		return [callParser(cache,datafile,func,*args) 
+				for datafile, func, args, kind in tasks]
+
+	numIO = len([task for task in tasks if task[3] == PARSE_IO])
+	numCPU = len(tasks) - numIO
+
+	threads = ThreadPool(processes=max(1,numIO))
+	procs = multiprocessing.Pool(processes=max(1,min(numCPU,
+									multiprocessing.cpu_count())))
+	try:
+		results = []
+		for datafile, func, args, kind in tasks:
+			pool = threads if kind == PARSE_IO else procs
+			results.append(pool.apply_async(callParser,
+							(cache,datafile,func) + tuple(args)))
+		dfs = [result.get() for result in results]
+	finally:
+		threads.terminate()
+		procs.terminate()
+		threads.join()
+		procs.join()
+
+	return dfs
+
+#
+# createParseTasks
+#
+# returns the parse tasks (see runParseTasks) that extract the AFC fields from
+# the specified data files for the geoIds in df_geoids; results are in the
+# order expected by createAFCData
+#
+def createParseTasks(df_geoids,datafiles):
+
+	# extract the zipcodes and SRAs for which we need to parse additional 
+	# data
+	zipdf = df_geoids['Zipcode']
+	sradf = df_geoids['SRA'].where(df_geoids['Zipcode'] == 0)
 	srazipdf = df_geoids[['SRA','Zipcode']]
-	data = []
-	for sra,zipcode in srazipdf.itertuples(index=False):
-		if ((sra in mi_dict) and (int(zipcode) in mi_dict[sra])):
-			mi_hh = (mi_dict[sra][int(zipcode)][0])
-			mi_hh_65_over = (mi_dict[sra][int(zipcode)][1])
-			data.append([int(mi_hh),int(mi_hh_65_over)]) 
-		else:
-			data.append([0,0])
-				
-	df = pd.DataFrame(columns=cols,data=data)
-	#print df.head()
+
+	# add data pertaining to specified cols
+	#
+	# each parse task is a (datafile, parser, args, kind) tuple where kind 
+	# indicates whether the parser is I/O or CPU bound (see runParseTasks)
+	tasks = []
+
+	# NumRCFELicensed, NumRCFEBedsLicensed,
+	# NumRCFEPending, NumRCFEBedsPending
+	tasks.append((datafiles['rcfe'],parseRCFEList,
+				(zipdf,datafiles['rcfe'],datafiles.get(RCFE_COUNTY)),PARSE_CPU))
+
+	# NumRCFEInALWP
+	tasks.append((datafiles['rcfe_in_alwp'],parseRCFEInALWP,
+				(zipdf,datafiles['rcfe_in_alwp']),PARSE_IO))
+
+	# 2012Pop65Over, 2012Pop55Over
+	out_cols = [OUT_COL_2012Pop65Over,OUT_COL_2012Pop55Over]
+	tasks.append((datafiles['pop_55_over_2012'],parsePopulation_v2,
+				(srazipdf,datafiles['pop_55_over_2012'],out_cols),PARSE_IO))
+
+	# 2030Pop65Over, 2030Pop55Over
+	out_cols = [OUT_COL_2030Pop65Over,OUT_COL_2030Pop55Over] 
+	tasks.append((datafiles['pop_55_over_2030'],parsePopulation_v2,
+				(srazipdf,datafiles['pop_55_over_2030'],out_cols),PARSE_IO))
+
+	# 2012PopADOD55Over, 2030PopADOD55Over
+	tasks.append((datafiles['adod_pop_55_over'],parseADODPopulation,
+				(srazipdf,datafiles['adod_pop_55_over']),PARSE_IO))
+
+	# 2012PopLowIncome55Over, 2012PopLowIncome65Over
+	out_cols = [OUT_COL_2012PopLowIncome55Over,OUT_COL_2012PopLowIncome65Over]
+	tasks.append((datafiles['low_income_pop_2012'],parseLowIncomePopulation,
+				(srazipdf,datafiles['low_income_pop_2012'],out_cols),PARSE_IO))
+
+	# 2012PopMinority
+	out_cols = [OUT_COL_2012PopMinority]
+	tasks.append((datafiles['pop_2012'],parseMinorityPopulation,
+				(srazipdf,datafiles['pop_2012'],out_cols),PARSE_IO))
+
+	# 2012MedianHHIncome, 2012MedianHHIncome65Over 
+	out_cols = [OUT_COL_2012MedianHHIncome, OUT_COL_2012MedianHHIncome65Over]	
+	tasks.append((datafiles['median_hh_income_2012'],parseMedianHHIncome,
+				(df_geoids,datafiles['median_hh_income_2012'],out_cols),
+				PARSE_CPU))
+
+	return tasks
+
+#
+# createAFCData
+#
+# creates the AFC data set for a single county using the specified data files
+# (see DATAFILES for the expected keys) and returns it as a data frame. Parsed
+# data files are cached in the specified parse cache (if any) and are parsed
+# concurrently if parallel is set
+#
+@instrpy.instrument()
+def createAFCData(datafiles=None,cache=None,parallel=False):
+
+	if datafiles is None:
+		datafiles = DATAFILES
+
+	# create geoIds (SRA, Region, Zipcode,ZCTA) data set relevant to the 
+	# county
+	df_geoids = sdpy.createGeoidsData(datafiles['geoids'])
+	#print df_geoids
+	geoCols = df_geoids.columns.tolist()
 	
+	tasks = createParseTasks(df_geoids,datafiles)
+
+	df_rcfe, df_alwp, df_pop_sr_2012, df_pop_sr_2030, df_pop_adod, \
+		df_pop_li, df_pop_min_2012, df_hh_mi = runParseTasks(tasks,cache,
+														parallel)
+
+	# add following fields (data to be derived later)
+	# 2012PercentLowIncome65Over, 2012PercentLowIncome55Over
+	# 2012ADODPerRCFE, 2030ADODPerRCFE
+	# 2012LowIncome65OverPerRCFE, 2012LowIncome55OverADODRatio
+	# PopMinorityPerRCFE, PopMinorityADODRatio
+	df_derived = pd.DataFrame(columns=[OUT_COL_2012ADODPerRCFE,
+					OUT_COL_2030ADODPerRCFE,
+					OUT_COL_2012LowIncome65OverPercentage,
+					OUT_COL_2012LowIncome55OverPercentage,
+					OUT_COL_2012LowIncome65OverPerRCFE,
+					OUT_COL_PopMinorityPerRCFE],
+					data=np.zeros(shape=(len(df_geoids.index),6))) 
+
+	# concatenate the intermediate results into a single dataframe
+	out_df = pd.concat([df_geoids,df_rcfe,df_alwp,df_pop_sr_2012, 
+					df_pop_sr_2030, df_pop_adod, df_pop_li, 
+					df_pop_min_2012, df_derived, df_hh_mi],axis=1)
+
+	#print(out_df.head())
+
+	# Add aggregated counts (per SRA) for derived fields 
+	out_df = addDerivedFields(out_df)
+
+	return out_df
+
+#
+# createCountyData
+#
+# process pool worker; creates the AFC data set for the specified (county, 
+# datafiles, cache) tuple and tags each row with the county name
+#
+def createCountyData(county_datafiles):
+
+	county, datafiles, cache = county_datafiles
+
+	df = createAFCData(datafiles,cache)
+	df.insert(0,OUT_COL_County,county)
+
 	return df
-	
+
+#
+# loadCountyRegistry
+#
+# reads the (JSON) registry of per-county crosswalks and data files and returns
+# it as an ordered dictionary of county name to data files. Every county must
+# specify all the keys in DATAFILES (i.e.: no county silently falls back to 
+# the SD county data files) and relative paths are resolved against the 
+# location of the registry. A county may also specify
+# the county name to filter the RCFE list on (see RCFE_COUNTY), which allows
+# all counties to share the statewide RCFE list
+#
+def loadCountyRegistry(registry_file):
+
+	with open(registry_file) as f:
+		registry = json.load(f,object_pairs_hook=OrderedDict)
+
+	basedir = os.path.dirname(os.path.abspath(registry_file))
+
+	counties = OrderedDict()
+	for county, files in registry.items():
+		datafiles = {}
+		for key, fname in files.items():
+			if key == RCFE_COUNTY:
+				# county name (not a file); used to filter the RCFE list
+				datafiles[key] = fname
+				continue
+			if key not in DATAFILES:
+				raise ValueError("unknown data file key '" + key + 
+								"' for county: " + county)
+			datafiles[key] = os.path.join(basedir,fname)
+		missing = [key for key in sorted(DATAFILES) if key not in datafiles]
+		if missing:
+			raise ValueError("missing data file key(s) " + ", ".join(missing) +
+							" for county: " + county)
+		counties[county] = datafiles
+
+	return counties
+
+#
+# createMultiCountyData
+#
+# creates the AFC data set for every county in the registry, with each county 
+# processed in its own worker process, and returns the combined data frame 
+# (in registry order)
+#
+@instrpy.instrument()
+def createMultiCountyData(counties,processes=None,cache=None):
+
+	if processes is None:
+		processes = multiprocessing.cpu_count()
+	processes = max(1,min(processes,len(counties)))
+
+	pool = multiprocessing.Pool(processes=processes)
+	try:
+		# one county per task so that a large county does not hold up the 
+		# counties queued behind it on the same worker
+		tasks = [(county,datafiles,cache) for county, datafiles in counties.items()]
+		df_list = pool.map(createCountyData,tasks,chunksize=1)
+		pool.close()
+	except:
+		pool.terminate()
+		raise
+	finally:
+		pool.join()
+
+	return pd.concat(df_list,axis=0,ignore_index=True)
+
+#
+# loadVintages
+#
+# reads the (JSON) registry of per-vintage data files (see VINTAGES) and 
+# returns it as an ordered dictionary of year to data files; relative paths 
+# are resolved against the location of the registry
+#
+def loadVintages(vintages_file):
+
+	with open(vintages_file) as f:
+		registry = json.load(f,object_pairs_hook=OrderedDict)
+
+	basedir = os.path.dirname(os.path.abspath(vintages_file))
+
+	vintages = OrderedDict()
+	for year, files in registry.items():
+		vintages[str(year)] = dict((key,os.path.join(basedir,fname)) 
+								for key, fname in files.items())
+
+	return vintages
+
+#
+# checkVintages
+#
+# raises ValueError, listing them, if any of the specified years (vintages) 
+# has no data files in the vintage registry
+#
+def checkVintages(years,vintages):
+
+	unknown = [str(year) for year in years if str(year) not in vintages]
+	if unknown:
+		raise ValueError("unknown vintage(s): " + ", ".join(unknown) +
+						" (known vintages: " + ", ".join(vintages) + ")")
+
+#
+# PanelLoader
+#
+# parses data files for panel mode; each (parser, data file, params) 
+# combination is parsed once per run no matter how many vintages use it
+#
+class PanelLoader(object):
+
+	def __init__(self,cache=None):
+		self.cache = cache
+		self.parsed = {}
+
+	def load(self,datafile,func,*args):
+
+		key = (func.__name__,datafile) + tuple(repr(arg) for arg in args 
+									if not isinstance(arg,pd.DataFrame))
+		if key not in self.parsed:
+			self.parsed[key] = callParser(self.cache,datafile,func,*args)
+
+		return self.parsed[key]
+
+#
+# createVintageData
+#
+# creates the per-vintage measures (PANEL_MEASURES and PANEL_DERIVED) for the
+# specified year and returns them as a data frame aligned with df_geoids
+#
+def createVintageData(loader,df_geoids,df_rcfe,aggRows,year,vintages):
+
+	files = vintages[year]
+	for key in VINTAGE_KEYS:
+		if key not in files:
+			print("Warning: no " + key + " data file for vintage " + year +
+				"; its measures are left empty")
+	srazipdf = df_geoids[['SRA','Zipcode']]
+
+	# parsed data frames for the measures available for the vintage
+	df_list = []
+
+	if 'pop_55_over' in files:
+		df_list.append(loader.load(files['pop_55_over'],parsePopulation_v2,
+							srazipdf,files['pop_55_over'],
+							[PANEL_Pop65Over,PANEL_Pop55Over]))
+
+	if 'adod_pop_55_over' in files:
+		# parse the cols of all vintages sharing the same file at once
+		datafile = files['adod_pop_55_over']
+		years = tuple(y for y in sorted(vintages) 
+					if vintages[y].get('adod_pop_55_over') == datafile)
+		df_adod = loader.load(datafile,parseADODPopulation,srazipdf,datafile,
+						years,[y + PANEL_PopADOD55Over for y in years])
+		df_list.append(df_adod[[year + PANEL_PopADOD55Over]].rename(
+						columns={year + PANEL_PopADOD55Over: PANEL_PopADOD55Over}))
+
+	if 'low_income_pop' in files:
+		df_list.append(loader.load(files['low_income_pop'],
+							parseLowIncomePopulation,srazipdf,
+							files['low_income_pop'],
+							[PANEL_PopLowIncome55Over,PANEL_PopLowIncome65Over]))
+
+	if 'pop' in files:
+		df_list.append(loader.load(files['pop'],parseMinorityPopulation,
+							srazipdf,files['pop'],[PANEL_PopMinority]))
+
+	if 'median_hh_income' in files:
+		df_list.append(loader.load(files['median_hh_income'],
+							parseMedianHHIncome,df_geoids,
+							files['median_hh_income'],
+							[PANEL_MedianHHIncome,PANEL_MedianHHIncome65Over]))
+
+	# measures with no data file for the vintage are left empty
+	df = pd.concat([pd.DataFrame(index=df_geoids.index)] + df_list,axis=1)
+	df = df.reindex(columns=PANEL_MEASURES)
+
+	# derived fields (for SRA aggregate rows)
+	df[OUT_COL_NumRCFELicensed] = df_rcfe[OUT_COL_NumRCFELicensed].values
+	ratios = [
+		(PANEL_ADODPerRCFE,PANEL_PopADOD55Over,OUT_COL_NumRCFELicensed,1),
+		(PANEL_PopMinorityPerRCFE,PANEL_PopMinority,OUT_COL_NumRCFELicensed,1),
+		(PANEL_LowIncome65OverPerRCFE,PANEL_PopLowIncome65Over,
+			OUT_COL_NumRCFELicensed,1),
+		(PANEL_LowIncome55OverPercentage,PANEL_PopLowIncome55Over,
+			PANEL_Pop55Over,100),
+		(PANEL_LowIncome65OverPercentage,PANEL_PopLowIncome65Over,
+			PANEL_Pop65Over,100)]
+	for col in PANEL_DERIVED:
+		df[col] = float(0)
+	df = addRatios(df,aggRows,ratios)
+
+	return df[PANEL_MEASURES + PANEL_DERIVED]
+
+#
+# createPanelData
+#
+# creates the AFC data set for the specified vintages (years) in a single run;
+# the geo frame and the RCFE counts are created once and every data file is 
+# parsed once no matter how many vintages use it. 
+#
+# Returns the data set in long format (one row per geography and year) or in 
+# wide format (one row per geography, measures prefixed with the year); raises
+# ValueError if any of the years is not in the vintage registry
+#
+@instrpy.instrument()
+def createPanelData(years,vintages=None,datafiles=None,cache=None,
+					fmt='long'):
+
+	if vintages is None:
+		vintages = VINTAGES
+	if datafiles is None:
+		datafiles = DATAFILES
+
+	checkVintages(years,vintages)
+
+	loader = PanelLoader(cache)
+
+	df_geoids = sdpy.createGeoidsData(datafiles['geoids'])
+	zipdf = df_geoids['Zipcode']
+
+	# RCFE counts (current) are the same for all vintages
+	df_rcfe = pd.concat([
+		loader.load(datafiles['rcfe'],parseRCFEList,zipdf,datafiles['rcfe'],
+					datafiles.get(RCFE_COUNTY)),
+		loader.load(datafiles['rcfe_in_alwp'],parseRCFEInALWP,zipdf,
+					datafiles['rcfe_in_alwp'])],axis=1)
+	df_base = pd.concat([df_geoids,df_rcfe],axis=1)
+	aggRows = aggregateRCFECounts(df_base)
+
+	df_list = []
+	for year in years:
+		df_year = createVintageData(loader,df_geoids,df_base,aggRows,str(year),
+								vintages)
+		if fmt == 'long':
+			df_year.insert(0,OUT_COL_Year,int(year))
+			df_list.append(pd.concat([df_base,df_year],axis=1))
+		else:
+			df_year.columns = [str(year) + col for col in df_year.columns]
+			df_list.append(df_year)
+
+	if fmt == 'long':
+		return pd.concat(df_list,axis=0,ignore_index=True)
+
+	return pd.concat([df_base] + df_list,axis=1)
+
+#
+# createRollups
+#
+# rolls the counts (ROLLUP_COLS) of the specified AFC data set up to SRA, 
+# Region and County (and statewide if state is specified) level
+#
+# Note: non-numeric counts (e.g.: "<5" in the ADOD population) are skipped
+#
+def createRollups(out_df,state=None):
+
+	df = out_df.copy()
+	df[ROLLUP_COLS] = df[ROLLUP_COLS].apply(pd.to_numeric,errors='coerce')
+
+	# population counts are per SRA only; the SRA aggregate rows hold the SRA
+	# totals of all counts (see addDerivedFields)
+	return sdpy.computeRollups(df,ROLLUP_COLS,county=ROLLUP_COUNTY,
+							state=state,aggregated=True)
+
+#
+# writeOutput
+#
+# writes the specified data frame to the output file (replacing it 
+# atomically if it already exists)
+#
+@instrpy.instrument()
+def writeOutput(out_df,out_csv):
+
+	# written to a scratch directory next to the output file and moved in 
+	# place so that readers (e.g.: afc_server.py) never see a partially 
+	# written file
+	outdir, fname = os.path.split(os.path.abspath(out_csv))
+	with genpy.scratchDir('.afc_output_',outdir) as scratch:
+		#print(out_df.head())	
+		out_df.to_csv(os.path.join(scratch,fname), index=False)
+		genpy.publishFiles(scratch,[fname],outdir)
+	print("output: " + out_csv)
+
 ################################################################################
 # 
 # MAIN
 #
 def main():
+
+	parser = argparse.ArgumentParser(description="Aggregate AFC data; " + 
+				"defaults to San Diego county data files in the current " + 
+				"working directory")
+	parser.add_argument('--registry',help="JSON registry of per-county " + 
+				"crosswalks and data files (multi-county mode)")
+	parser.add_argument('--processes',type=int,default=None,
+				help="number of worker processes in multi-county mode " + 
+				"(defaults to the number of cores)")
+	parser.add_argument('--out',default=None,help="output CSV file")
+	parser.add_argument('--cache-dir',default=cachepy.CACHEDIR,
+				help="directory for cached parsed data files")
+	parser.add_argument('--cache-size',type=int,
+				default=cachepy.CACHE_MAX_BYTES // (1024 * 1024),
+				help="size bound of the parse cache (in MB)")
+	parser.add_argument('--no-cache',action='store_true',
+				help="parse all data files (without using the parse cache)")
+	parser.add_argument('--panel',default=None,
+				help="comma separated list of vintages (years) to create the " + 
+				"data set for (panel mode)")
+	parser.add_argument('--vintages',default=None,
+				help="JSON registry of per-vintage data files in panel mode " + 
+				"(defaults to VINTAGES)")
+	parser.add_argument('--panel-format',choices=['long','wide'],
+				default='long',help="output format in panel mode")
+	parser.add_argument('--rollups',action='store_true',
+				help="also write the counts rolled up to SRA, Region and " +
+				"County level (and statewide in multi-county mode) to " +
+				OUT_CSV_ROLLUPS + " (not supported in panel mode)")
+	parser.add_argument('--load',choices=['serial','parallel'],
+				default='serial',help="parse data files one after the other " +
+				"or concurrently (single county mode only; counties are " + 
+				"already processed concurrently in multi-county mode)")
+	args = parser.parse_args()
+
+	if args.rollups and args.panel is not None:
+		parser.error("--rollups is not supported in panel mode")
+
+	if args.panel is not None:
+		vintages = VINTAGES
+		if args.vintages is not None:
+			vintages = loadVintages(args.vintages)
+		years = [year.strip() for year in args.panel.split(",")]
+		try:
+			checkVintages(years,vintages)
+		except ValueError, e:
+			print("Error: " + str(e))
+			exit(1)
+
+	cache = None
+	if not args.no_cache:
+		cache = cachepy.ParseCache(args.cache_dir,args.cache_size * 1024 * 1024)
+
+	out_csv = args.out
 	try:
-		# create geoIds (SRA, Region, Zipcode,ZCTA) data set relevant to the 
-		# San Diego county
-		df_geoids = sdpy.createGeoidsData()
-		#print df_geoids
-		geoCols = df_geoids.columns.tolist()
-		
-		# extract the zipcodes and SRAs for which we need to parse additional 
-		# data
-		zipdf = df_geoids['Zipcode']
-		sradf = df_geoids['SRA'].where(df_geoids['Zipcode'] == 0)
-		srazipdf = df_geoids[['SRA','Zipcode']]
-
-		# add data pertaining to specified cols
-
-		# NumRCFELicensed, NumRCFEBedsLicensed,
-		# NumRCFEPending, NumRCFEBedsPending
-		df_rcfe = parseRCFEList(zipdf)  	
-
-		# NumRCFEInALWP
-		df_alwp = parseRCFEInALWP(zipdf)
-
-		# 2012Pop65Over, 2012Pop55Over
-		out_cols = [OUT_COL_2012Pop65Over,OUT_COL_2012Pop55Over]
-		df_pop_sr_2012 = parsePopulation_v2(srazipdf,DATAFILE_SD_2012_POP_55_OVER,
-							out_cols)
-
-		# 2030Pop65Over, 2030Pop55Over
-		out_cols = [OUT_COL_2030Pop65Over,OUT_COL_2030Pop55Over] 
-		df_pop_sr_2030 = parsePopulation_v2(srazipdf,DATAFILE_SD_2030_POP_55_OVER,
-							out_cols)
-
-		# 2012PopADOD55Over, 2030PopADOD55Over
-		df_pop_adod = parseADODPopulation(srazipdf)
-
-		# 2012PopLowIncome55Over, 2012PopLowIncome65Over
-		out_cols = [OUT_COL_2012PopLowIncome55Over,OUT_COL_2012PopLowIncome65Over]
-		df_pop_li = parseLowIncomePopulation(srazipdf,
-						DATAFILE_SD_2012_LOW_INCOME_POP_55_OVER,out_cols)
-
-		# 2012PopMinority
-		out_cols = [OUT_COL_2012PopMinority]
-		df_pop_min_2012 = parseMinorityPopulation(srazipdf,
-								DATAFILE_SD_2012_POP,out_cols)
-
-		# add following fields (data to be derived later)
-		# 2012PercentLowIncome65Over, 2012PercentLowIncome55Over
-		# 2012ADODPerRCFE, 2030ADODPerRCFE
-		# 2012LowIncome65OverPerRCFE, 2012LowIncome55OverADODRatio
-		# PopMinorityPerRCFE, PopMinorityADODRatio
-		df_derived = pd.DataFrame(columns=[OUT_COL_2012ADODPerRCFE,
-						OUT_COL_2030ADODPerRCFE,
-						OUT_COL_2012LowIncome65OverPercentage,
-						OUT_COL_2012LowIncome55OverPercentage,
-						OUT_COL_2012LowIncome65OverPerRCFE,
-						OUT_COL_PopMinorityPerRCFE],
-						data=np.zeros(shape=(len(zipdf.index),6))) 
-
-		# 2012MedianHHIncome, 2012MedianHHIncome65Over 
-		out_cols = [OUT_COL_2012MedianHHIncome, OUT_COL_2012MedianHHIncome65Over]	
-		df_hh_mi = parseMedianHHIncome(df_geoids,
-								DATAFILE_SD_2012_MEDIAN_HH_INCOME,out_cols)
-
-		# concatenate the intermediate results into a single dataframe
-		out_df = pd.concat([df_geoids,df_rcfe,df_alwp,df_pop_sr_2012, 
-						df_pop_sr_2030, df_pop_adod, df_pop_li, 
-						df_pop_min_2012, df_derived, df_hh_mi],axis=1)
-
-		#print(out_df.head())
-
-		# Add aggregated counts (per SRA) for derived fields 
-		for name, group in out_df.groupby(OUT_COL_SRA):
-			
-			idx = group.last_valid_index()
-			
-			#print out_df.loc[[idx]]
-
-			total_rcfe_licensed = group[OUT_COL_NumRCFELicensed].sum()
-			total_capacity_licensed = group[OUT_COL_NumRCFEBedsLicensed].sum()
-			total_rcfe_pending = group[OUT_COL_NumRCFEPending].sum()
-			total_capacity_pending = group[OUT_COL_NumRCFEBedsPending].sum()
-
-			total_in_alwp = group[OUT_COL_NumRCFEInALWP].sum()
-
-			out_df.set_value(idx,OUT_COL_NumRCFELicensed,total_rcfe_licensed)
-			out_df.set_value(idx,OUT_COL_NumRCFEBedsLicensed,total_capacity_licensed)
-			out_df.set_value(idx,OUT_COL_NumRCFEPending,total_rcfe_pending)
-			out_df.set_value(idx,OUT_COL_NumRCFEBedsPending,total_capacity_pending)
-
-			out_df.set_value(idx,OUT_COL_NumRCFEInALWP,total_in_alwp)
-
-			adod_rcfe_ratio_2012 = float(999)
-			adod_rcfe_ratio_2030 = float(999)
-			minorities_per_rcfe = float(999)
-			low_income_65_over_per_rcfe = float(999)
-			percent_low_income_55_over = float(999)
-			percent_low_income_65_over = float(999)	
-
-			# note: this try/catch is here to deal gracefully with errors 
- 			# arising from non-integer population counts (e.g.: "<5")
- 			try:
- 				adod_pop_2012 = int(out_df.get_value(idx,OUT_COL_2012PopADOD55Over))
- 				adod_pop_2030 = int(out_df.get_value(idx,OUT_COL_2030PopADOD55Over))
- 				
- 				minority_pop_2012 = int(out_df.get_value(idx,OUT_COL_2012PopMinority))
-
- 				li_65_over = out_df.get_value(idx,OUT_COL_2012PopLowIncome65Over)
- 				li_55_over = out_df.get_value(idx,OUT_COL_2012PopLowIncome55Over)
-
- 				pop_65_over = out_df.get_value(idx,OUT_COL_2012Pop65Over)
- 				pop_55_over = out_df.get_value(idx,OUT_COL_2012Pop55Over)
-
- 				if (total_rcfe_licensed > 0):
- 					adod_rcfe_ratio_2012 = float(adod_pop_2012)/total_rcfe_licensed
-					adod_rcfe_ratio_2030 = float(adod_pop_2030)/total_rcfe_licensed
-					minorities_per_rcfe = float(minority_pop_2012)/total_rcfe_licensed
-					low_income_65_over_per_rcfe = float(li_65_over)/total_rcfe_licensed
-
-				if (pop_55_over > 0):
-					percent_low_income_55_over = (float(li_55_over)/pop_55_over)*100
-				if (pop_65_over > 0):
-					percent_low_income_65_over = (float(li_65_over)/pop_65_over)*100		
-					
- 			except Exception, e:
- 				#e = sys.exc_info()[0]
-				#print("Error: " + str(e))
- 				# do nothing => ratios will default to 999.0
- 				pass
-
- 			out_df.set_value(idx,OUT_COL_2012LowIncome65OverPercentage,
- 								round(percent_low_income_65_over,2))	
- 			out_df.set_value(idx,OUT_COL_2012LowIncome55OverPercentage,
- 								round(percent_low_income_55_over,2))		
-			out_df.set_value(idx,OUT_COL_2012ADODPerRCFE,round(adod_rcfe_ratio_2012,2))
-			out_df.set_value(idx,OUT_COL_2030ADODPerRCFE,round(adod_rcfe_ratio_2030,2))
-			out_df.set_value(idx,OUT_COL_2012LowIncome65OverPerRCFE,
-								round(low_income_65_over_per_rcfe,2))
-			out_df.set_value(idx,OUT_COL_PopMinorityPerRCFE,
-								round(minorities_per_rcfe,2))
-			
-			#print out_df.loc[[idx]]
-
-		# remove output file if it already exists
-		if os.path.exists(os.path.join(CWD,OUT_CSV)):
-			os.remove(os.path.join(CWD,OUT_CSV))
+		if args.panel is not None:
+			if out_csv is None:
+				out_csv = OUT_CSV_PANEL
+			out_df = createPanelData(years,vintages,cache=cache,
+								fmt=args.panel_format)
+		elif args.registry is None:
+			if out_csv is None:
+				out_csv = OUT_CSV
+			out_df = createAFCData(cache=cache,
+								parallel=(args.load == 'parallel'))
+		else:
+			if out_csv is None:
+				out_csv = OUT_CSV_MULTI_COUNTY
+			counties = loadCountyRegistry(args.registry)
+			out_df = createMultiCountyData(counties,args.processes,cache)
 
-		#print(out_df.head())	
-		out_df.to_csv(OUT_CSV, index=False)
-		print("output: " + OUT_CSV)
+		writeOutput(out_df,out_csv)
+
+		if args.rollups:
+			out_csv = OUT_CSV_ROLLUPS
+			state = None if args.registry is None else ROLLUP_STATE
+			writeOutput(createRollups(out_df,state),out_csv)
+
+		print("peak memory (RSS): %.1f MB" % genpy.peakRSS())
+		if args.registry is not None or args.load == 'parallel':
+			print("peak memory (RSS) of worker processes: %.1f MB" % 
+					genpy.peakRSS(children=True))
 
 	except: 
 		e = sys.exc_info()[0]
-		print("Error: Failed to create " + OUT_CSV)
+		print("Error: Failed to create " + str(out_csv))
 		print("Error: " + str(e))
-		exit()
+		exit(1)
 # end: main
 
 if __name__ == "__main__":
 	main()
 else:
 	# do nothing
-	pass	
+	pass
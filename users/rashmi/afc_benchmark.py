@@ -0,0 +1,273 @@
+#! /usr/bin/env python
+
+################################################################################
+#
+# afc_benchmark.py
+#
+# Script to benchmark the AFC scripts on synthetic data (see afc_synthetic.py)
+# at one or more scales. Each stage (the afc_aggregate parsers and the full
+# aggregation, income_stats.processData, sdpyutils.createGeoidsData,
+# sdpyutils.addSRAaggregates and allocutils.allocate, if scipy is available)
+# is timed at each scale and the results are written as a JSON report tagged
+# with the current git commit so that runs can be compared across commits. The
+# memory used by the parsed data frames with and without the typed schema (see
+# schemautils.py) is reported as well
+#
+# Usage:
+#
+# python afc_benchmark.py [--scales county,state,national] [--repeat N]
+#                         [--workdir DIR] [--out REPORT]
+#
+################################################################################
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+import numpy as np
+import pandas as pd
+from collections import OrderedDict
+import genutils as genpy
+import sdpyutils as sdpy
+import afc_aggregate as afc
+import income_stats as incstats
+import afc_synthetic as synth
+import schemautils as schemapy
+
+allocpy = genpy.lazyImport('allocutils')
+
+#
+# GLOBALS
+#
+
+# directory containing the benchmarked scripts
+SCRIPTDIR = os.path.dirname(os.path.abspath(__file__))
+
+# output file(s)
+OUT_JSON = "afc_benchmark.json"
+
+# default number of timed runs per stage (the fastest run is reported)
+REPEAT = 3
+
+#
+# gitCommit
+#
+# returns the commit the benchmarked scripts are at (None if not available)
+#
+def gitCommit():
+
+	try:
+		with open(os.devnull,'w') as devnull:
+			commit = subprocess.check_output(['git','rev-parse','HEAD'],
+						cwd=SCRIPTDIR,stderr=devnull)
+		return commit.decode('utf-8').strip()
+	except Exception:
+		return None
+
+#
+# timeStage
+#
+# calls func repeat times, with the args returned by setup (called before
+# each run and not timed), and returns the timings in seconds
+#
+def timeStage(func,setup,repeat):
+
+	timings = []
+	for i in range(repeat):
+		args = setup()
+		start = time.time()
+		func(*args)
+		timings.append(time.time() - start)
+
+	return OrderedDict([('min',min(timings)),
+						('mean',sum(timings) / len(timings)),
+						('runs',len(timings))])
+
+#
+# createStages
+#
+# returns the stages to benchmark as a list of (name, func, setup) tuples;
+# data files are expected in the current working directory
+#
+def createStages():
+
+	stages = []
+
+	stages.append(('sdpyutils.createGeoidsData',sdpy.createGeoidsData,
+				lambda: (afc.DATAFILES['geoids'],)))
+
+	# each afc_aggregate parser with the arguments createAFCData passes to it
+	df_geoids = sdpy.createGeoidsData(afc.DATAFILES['geoids'])
+	for datafile, func, args, kind in afc.createParseTasks(df_geoids,
+															afc.DATAFILES):
+		stages.append(('afc_aggregate.' + func.__name__ + '[' + datafile + ']',
+					func,lambda args=args: args))
+
+	stages.append(('afc_aggregate.createAFCData',afc.createAFCData,
+				lambda: ()))
+	stages.append(('afc_aggregate.createAFCData[parallel]',
+				lambda: afc.createAFCData(parallel=True),lambda: ()))
+
+	# income_stats on the ACS B17024 archive (read in place)
+	archive = incstats.DATAZIP
+	metadataFile = genpy.findZipMembers(archive,"metadata.csv")[0]
+	dataFile = genpy.findZipMembers(archive,"ann.csv")[0]
+	df_fields = incstats.processMetaData(metadataFile,archive)
+	stages.append(('income_stats.processData',incstats.processData,
+				lambda: (df_fields,dataFile,archive)))
+
+	# SRA aggregates over all B17024 estimate cols (as in income_stats)
+	cols = df_fields[0].tolist()[3::2]
+	values = np.random.RandomState(0).randint(0,500,
+								(len(df_geoids.index),len(cols)))
+	df = pd.concat([df_geoids,pd.DataFrame(columns=cols,data=values)],axis=1)
+	stages.append(('sdpyutils.addSRAaggregates',sdpy.addSRAaggregates,
+				lambda: (df.copy(),cols)))
+
+	# all B17024 estimate cols allocated from ZCTAs to SRAs at once (the
+	# allocation engine needs scipy; the stage is skipped without it)
+	try:
+		import scipy.sparse
+	except ImportError:
+		print("Warning: scipy not available; skipping allocutils.allocate")
+		return stages
+	alloc = allocpy.createCrosswalkMatrix(afc.DATAFILES['geoids'],by='zcta')
+	df_zcta = df[~sdpy.getCrosswalk(afc.DATAFILES['geoids']).agg_rows]
+	df_zcta = df_zcta.set_index(sdpy.codeZipcodes(df_zcta['ZCTA']))[cols]
+	stages.append(('allocutils.allocate[zcta->sra]',alloc.allocate,
+				lambda: (df_zcta,)))
+
+	return stages
+
+#
+# measureMemory
+#
+# returns the memory (in bytes) used by the geoID data and the AFC data set
+# as parsed and with the typed schema applied; data files are expected in the
+# current working directory
+#
+def measureMemory():
+
+	memory = OrderedDict()
+	enabled = schemapy.ENABLED
+	try:
+		for name, func in [('geoids',lambda: sdpy.createGeoidsData(
+											afc.DATAFILES['geoids'])),
+						('afc',afc.createAFCData)]:
+			usage = OrderedDict()
+			for typed in [False,True]:
+				schemapy.ENABLED = typed
+				usage['typed' if typed else 'parsed'] = \
+							int(schemapy.memoryUsage(func()).sum())
+			usage['ratio'] = round(float(usage['typed']) / 
+									max(1,usage['parsed']),3)
+			memory[name] = usage
+	finally:
+		schemapy.ENABLED = enabled
+
+	return memory
+
+#
+# benchmarkScale
+#
+# generates synthetic data at the specified scale in workdir and times each
+# stage; returns the results for the scale
+#
+def benchmarkScale(scale,workdir,repeat):
+
+	geo = synth.generate(workdir,scale['sras'],scale['zips_per_sra'],
+						scale['facilities'])
+
+	result = OrderedDict()
+	result['params'] = scale
+	result['sras'] = len(geo)
+	result['zipcodes'] = sum(len(zipcodes) for sra, region, zipcodes in geo)
+	result['stages'] = OrderedDict()
+
+	# the scripts read (and write) data files in the current working directory
+	cwd = os.getcwd()
+	os.chdir(workdir)
+	try:
+		for name, func, setup in createStages():
+			print("timing stage: " + name)
+			result['stages'][name] = timeStage(func,setup,repeat)
+		result['memory_bytes'] = measureMemory()
+	finally:
+		os.chdir(cwd)
+
+	# (high-water mark of the benchmark process, see genutils.peakRSS)
+	result['process_peak_rss_mb'] = genpy.peakRSS()
+
+	return result
+
+#
+# run
+#
+# benchmarks the specified scales (names in synth.SCALES) and returns the
+# report
+#
+def run(scales,repeat=REPEAT,workdir=None):
+
+	report = OrderedDict()
+	report['commit'] = gitCommit()
+	report['timestamp'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+	report['python'] = platform.python_version()
+	report['pandas'] = pd.__version__
+	report['numpy'] = np.__version__
+	report['repeat'] = repeat
+	report['scales'] = OrderedDict()
+
+	basedir = tempfile.mkdtemp(prefix="afc_benchmark_") if workdir is None \
+				else workdir
+	try:
+		for name in scales:
+			print("benchmarking scale: " + name)
+			report['scales'][name] = benchmarkScale(dict(synth.SCALES[name]),
+									os.path.join(basedir,name),repeat)
+	finally:
+		if workdir is None:
+			shutil.rmtree(basedir,ignore_errors=True)
+
+	return report
+
+################################################################################
+#
+# main
+#
+def main():
+
+	parser = argparse.ArgumentParser(description="Benchmark the AFC scripts " +
+				"on synthetic data")
+	parser.add_argument('--scales',default='county',
+				help="comma separated list of scales (" +
+				", ".join(synth.SCALES.keys()) + ")")
+	parser.add_argument('--repeat',type=int,default=REPEAT,
+				help="number of timed runs per stage")
+	parser.add_argument('--workdir',default=None,
+				help="directory to generate the data files in (kept)")
+	parser.add_argument('--out',default=OUT_JSON,help="report file")
+	args = parser.parse_args()
+
+	scales = [s.strip() for s in args.scales.split(",") if s.strip()]
+	for name in scales:
+		if name not in synth.SCALES:
+			print("Error: unknown scale: " + name)
+			exit(1)
+
+	report = run(scales,max(1,args.repeat),args.workdir)
+
+	with open(args.out,'w') as f:
+		json.dump(report,f,indent=2)
+	print("output: " + args.out)
+# end: main
+
+if __name__ == "__main__":
+	main()
+else:
+	# do nothing
+	pass
@@ -0,0 +1,255 @@
+#! /usr/bin/env python
+
+################################################################################
+#
+# afc_jobs.py
+#
+# Script to run many income_stats and demographics jobs (one per county/
+# geography and vintage) in parallel from a single working tree. The jobs are
+# found by the names of the archives in the data directory:
+#
+#   aff_B17024_<GEO>_<VERSION>.zip      - income_stats (see income_stats.py)
+#   <DATAID>_<GEOID>_<VER>.zip          - demographics (DATAID pop_estimate,
+#                                         pop_forecast or pop_census; see
+#                                         demographics.py)
+#
+# Each job runs in a worker process with its own scratch directory (created
+# under the output directory and removed when the job ends, whether or not it
+# failed). Its output files are written to the scratch directory and then
+# moved to the output directory, each replaced atomically, so that concurrent
+# jobs (and concurrent runs of this script) never see partially written files
+#
+# Usage:
+#
+# python afc_jobs.py [DIR] [--outdir OUTDIR] [--workers N]
+#                    [--only income_stats|demographics] [--geoids GEO=FILE ...]
+#                    [--dry-run]
+#
+# DIR and OUTDIR default to the current working directory. The geoID data file
+# of a geography defaults to <GEO>_sra_zip_zcta.txt (see income_stats.py)
+#
+################################################################################
+
+import os
+import re
+import sys
+import time
+import argparse
+import multiprocessing
+import genutils as genpy
+import income_stats as incstats
+import demographics as demog
+
+#
+# GLOBALS
+#
+
+# job kinds
+JOB_INCOME = 'income_stats'
+JOB_DEMOGRAPHICS = 'demographics'
+
+# SANDAG archives (see demographics.archiveName)
+DEMOGRAPHICS_PATTERN = re.compile(r'^(pop_estimate|pop_forecast|pop_census)_' +
+							r'(.+)_(\d+)\.zip$')
+
+# prefix of the scratch directories of the jobs
+SCRATCH_PREFIX = '.afc_scratch_'
+
+#
+# Job
+#
+# a job; the archive it processes, the parameters of its kind and the
+# directory its outputs are published to
+#
+class Job(object):
+
+	def __init__(self,name,kind,archive,params,outdir):
+		self.name = name
+		self.kind = kind
+		self.archive = archive
+		self.params = dict(params)
+		self.outdir = outdir
+
+#
+# findJobs
+#
+# returns the jobs for the archives in the specified directory, sorted by name;
+# income_stats archives of a geography without a geoID data file are skipped
+#
+def findJobs(datadir,outdir,geoids=None,kinds=None):
+
+	jobs = []
+
+	if kinds is None or JOB_INCOME in kinds:
+		for geo, version, archive in incstats.findArchives(datadir):
+			geoid_datafile = incstats.findGeoids(geo,datadir,geoids)
+			if geoid_datafile is None:
+				print("Warning: no geoID data file for " + geo + "; skipping " +
+					archive)
+				continue
+			jobs.append(Job(JOB_INCOME + "_" + geo + "_" + version,JOB_INCOME,
+					archive,{'geo': geo,'version': version,
+					'geoid_datafile': geoid_datafile},outdir))
+
+	if kinds is None or JOB_DEMOGRAPHICS in kinds:
+		for fname in os.listdir(datadir):
+			m = DEMOGRAPHICS_PATTERN.match(fname)
+			if m:
+				dataid, geoid, ver = m.groups()
+				jobs.append(Job(dataid + "_" + geoid + "_" + ver,
+						JOB_DEMOGRAPHICS,os.path.join(datadir,fname),
+						{'dataid': dataid,'geoid': geoid,'ver': ver},outdir))
+
+	return sorted(jobs,key=lambda job: job.name)
+
+#
+# runIncomeJob
+#
+# extracts income data from the job archive (see income_stats.loadIncomeData)
+# and writes it to the scratch directory; returns the names of the files
+# written
+#
+def runIncomeJob(job,scratch):
+
+	geo = job.params['geo']
+	county = incstats.ROLLUP_COUNTY if geo == 'sd_county' else geo
+
+	dfs = incstats.loadIncomeData(job.archive,job.params['geoid_datafile'],
+								county)
+	fnames = incstats.outputNames(geo,job.params['version'])
+	for df, fname in zip(dfs,fnames):
+		df.to_csv(os.path.join(scratch,fname),index=False)
+
+	return fnames
+
+#
+# runDemographicsJob
+#
+# collates the demographics data in the job archive (see
+# demographics.collate) and writes it to the scratch directory; returns the
+# names of the files written
+#
+def runDemographicsJob(job,scratch):
+
+	dataid = job.params['dataid']
+
+	# (jobs already run in worker processes; the workbooks are parsed serially)
+	df = demog.collate(job.archive,dataid,workers=1)
+	fname = dataid + "_" + job.params['geoid'] + "_" + job.params['ver'] + \
+			".csv"
+	df.to_csv(os.path.join(scratch,fname),index=False)
+
+	return [fname]
+
+# job runner per job kind
+RUNNERS = {JOB_INCOME: runIncomeJob, JOB_DEMOGRAPHICS: runDemographicsJob}
+
+#
+# runJob
+#
+# runs the specified job in its own scratch directory and publishes its
+# outputs (see genutils.publishFiles); returns the (job name, outputs, error,
+# seconds) of the run (error is None if the job succeeded)
+#
+def runJob(job):
+
+	start = time.time()
+	try:
+		with genpy.scratchDir(SCRATCH_PREFIX,job.outdir) as scratch:
+			fnames = RUNNERS[job.kind](job,scratch)
+			outputs = genpy.publishFiles(scratch,fnames,job.outdir)
+	except Exception, e:
+		return job.name, [], str(e) or repr(e), time.time() - start
+
+	return job.name, outputs, None, time.time() - start
+
+#
+# runJobs
+#
+# runs the specified jobs in a pool of worker processes; returns the results
+# of the jobs (see runJob) in the order of the jobs
+#
+def runJobs(jobs,workers=None):
+
+	if not jobs:
+		return []
+
+	if workers is None:
+		workers = multiprocessing.cpu_count()
+	workers = max(1,min(workers,len(jobs)))
+
+	if workers == 1:
+		return [runJob(job) for job in jobs]
+
+	pool = multiprocessing.Pool(processes=workers)
+	try:
+		return pool.map(runJob,jobs,chunksize=1)
+	finally:
+		pool.terminate()
+		pool.join()
+
+################################################################################
+#
+# main
+#
+def main():
+
+	parser = argparse.ArgumentParser(description="Run income_stats and " +
+				"demographics jobs for all archives in a directory in parallel")
+	parser.add_argument('datadir',nargs='?',default=os.getcwd(),
+				help="directory containing the archives")
+	parser.add_argument('--outdir',default=None,
+				help="directory to write the outputs to (defaults to DIR)")
+	parser.add_argument('--workers',type=int,default=None,
+				help="number of worker processes")
+	parser.add_argument('--only',choices=[JOB_INCOME,JOB_DEMOGRAPHICS],
+				default=None,help="run jobs of this kind only")
+	parser.add_argument('--geoids',action='append',default=[],
+				metavar='GEO=FILE',help="geoID data file for a geography " +
+				"(may be repeated)")
+	parser.add_argument('--dry-run',action='store_true',
+				help="list the jobs that would be run")
+	args = parser.parse_args()
+
+	outdir = args.datadir if args.outdir is None else args.outdir
+	if not os.path.isdir(outdir):
+		try:
+			os.makedirs(outdir)
+		except OSError:
+			# created concurrently by another run
+			if not os.path.isdir(outdir):
+				raise
+
+	geoids = dict(arg.split("=",1) for arg in args.geoids)
+	kinds = None if args.only is None else [args.only]
+	jobs = findJobs(args.datadir,os.path.abspath(outdir),geoids,kinds)
+	if not jobs:
+		print("Error: no archives found in " + args.datadir)
+		exit(1)
+
+	if args.dry_run:
+		for job in jobs:
+			print("job: " + job.name + " (" + job.archive + ")")
+		return
+
+	failed = 0
+	for name, outputs, error, seconds in runJobs(jobs,args.workers):
+		if error is not None:
+			failed += 1
+			print("Error: job " + name + " failed: " + error)
+			continue
+		print("job: " + name + " (%.1fs)" % seconds)
+		for outfile in outputs:
+			print("output: " + outfile)
+
+	if failed:
+		print("Error: " + str(failed) + " of " + str(len(jobs)) +
+			" jobs failed")
+		exit(1)
+# end: main
+
+if __name__ == "__main__":
+	main()
+else:
+	# do nothing
+	pass
@@ -0,0 +1,183 @@
+#! /usr/bin/env python
+
+################################################################################
+#
+# afc_loadtest.py
+#
+# Script to measure the latency of AFC data set queries (see afc_server.py),
+# either over HTTP against a running server or in-process against a loaded
+# table. A mix of row lookups (by SRA, Region, Zipcode, ZCTA), rollups and
+# top-k queries is issued and the latency percentiles (p50, p90, p99, max)
+# and throughput are reported as JSON
+#
+# Usage:
+#
+# python afc_loadtest.py [--url http://127.0.0.1:8080] [--requests N]
+#                        [--concurrency N]
+# python afc_loadtest.py --inprocess afc_<version>.csv [--requests N]
+#
+################################################################################
+
+import sys
+import json
+import time
+import random
+import urllib
+import httplib
+import urlparse
+import argparse
+import threading
+import numpy as np
+import afc_aggregate as afc
+import afc_server as server
+
+#
+# GLOBALS
+#
+
+REQUESTS = 10000
+CONCURRENCY = 4
+
+#
+# createQueries
+#
+# returns a list of (path, params) queries for the specified rows (list of
+# dicts, as returned by /rows) in random order
+#
+def createQueries(rows,n,seed=0):
+
+	rng = random.Random(seed)
+
+	sras = sorted(set(row[afc.OUT_COL_SRA] for row in rows))
+	regions = sorted(set(row[afc.OUT_COL_Region].strip() for row in rows))
+	zipcodes = sorted(set(row[afc.OUT_COL_Zipcode].strip() for row in rows))
+	zctas = sorted(set(row[afc.OUT_COL_ZCTA].strip() for row in rows))
+	cols = [col for col in afc.ROLLUP_COLS if col in rows[0]]
+
+	def query():
+		kind = rng.random()
+		if kind < 0.3:
+			return '/rows',{afc.OUT_COL_SRA: rng.choice(sras)}
+		if kind < 0.5:
+			return '/rows',{afc.OUT_COL_Zipcode: rng.choice(zipcodes)}
+		if kind < 0.6:
+			return '/rows',{afc.OUT_COL_ZCTA: rng.choice(zctas)}
+		if kind < 0.7:
+			return '/rows',{afc.OUT_COL_Region: rng.choice(regions),
+							'cols': ",".join(cols[:3])}
+		if kind < 0.85:
+			return '/rollup',{'level': rng.choice(['SRA','Region','County'])}
+		return '/topk',{'col': rng.choice(cols),'k': rng.choice([5,10,20]),
+						'level': rng.choice([server.TOPK_SRA,
+											server.TOPK_ZIPCODE])}
+
+	return [query() for i in range(n)]
+
+#
+# summarize
+#
+# returns the latency percentiles (in ms) and throughput for the specified
+# latencies (in seconds) measured over elapsed seconds
+#
+def summarize(latencies,elapsed,errors=0):
+
+	ms = np.array(latencies) * 1000.0
+	return {'requests': len(latencies),
+			'errors': errors,
+			'elapsed_s': round(elapsed,3),
+			'throughput_rps': round(len(latencies) / elapsed,1),
+			'p50_ms': round(np.percentile(ms,50),4),
+			'p90_ms': round(np.percentile(ms,90),4),
+			'p99_ms': round(np.percentile(ms,99),4),
+			'max_ms': round(ms.max(),4)}
+
+#
+# runInProcess
+#
+# measures the latency of queries answered directly by an in-memory table
+#
+def runInProcess(datafile,n):
+
+	table = server.AFCTable(datafile)
+	rows = [json.loads(row) for row in table.json]
+	queries = createQueries(rows,n)
+
+	latencies = []
+	start = time.time()
+	for path, params in queries:
+		params = dict((k,[str(v)]) for k, v in params.iteritems())
+		t = time.time()
+		table.query(path,params)
+		latencies.append(time.time() - t)
+
+	return summarize(latencies,time.time() - start)
+
+#
+# runHTTP
+#
+# measures the latency of queries sent to the server at the specified url by
+# concurrency clients (each using a keep-alive connection)
+#
+def runHTTP(url,n,concurrency):
+
+	url = urlparse.urlparse(url)
+
+	conn = httplib.HTTPConnection(url.hostname,url.port)
+	conn.request('GET','/rows')
+	rows = json.loads(conn.getresponse().read())
+	conn.close()
+
+	queries = createQueries(rows,n)
+	chunks = [queries[i::concurrency] for i in range(concurrency)]
+	latencies = [[] for i in range(concurrency)]
+	errors = [0] * concurrency
+
+	def client(i):
+		conn = httplib.HTTPConnection(url.hostname,url.port)
+		for path, params in chunks[i]:
+			t = time.time()
+			conn.request('GET',path + "?" + urllib.urlencode(params))
+			response = conn.getresponse()
+			response.read()
+			latencies[i].append(time.time() - t)
+			if response.status != 200:
+				errors[i] += 1
+		conn.close()
+
+	threads = [threading.Thread(target=client,args=(i,))
+				for i in range(concurrency)]
+	start = time.time()
+	for thread in threads:
+		thread.start()
+	for thread in threads:
+		thread.join()
+
+	return summarize(sum(latencies,[]),time.time() - start,sum(errors))
+
+################################################################################
+#
+# main
+#
+def main():
+
+	parser = argparse.ArgumentParser(description="Measure AFC query latency")
+	parser.add_argument('--url',default='http://127.0.0.1:%d' % server.PORT)
+	parser.add_argument('--inprocess',default=None,
+				help="AFC data file to query in-process (no server)")
+	parser.add_argument('--requests',type=int,default=REQUESTS)
+	parser.add_argument('--concurrency',type=int,default=CONCURRENCY)
+	args = parser.parse_args()
+
+	if args.inprocess is not None:
+		result = runInProcess(args.inprocess,args.requests)
+	else:
+		result = runHTTP(args.url,args.requests,max(1,args.concurrency))
+
+	print(json.dumps(result,indent=2,sort_keys=True))
+# end: main
+
+if __name__ == "__main__":
+	main()
+else:
+	# do nothing
+	pass
@@ -0,0 +1,274 @@
+#! /usr/bin/env python
+
+################################################################################
+#
+# afc_rcfe_check.py
+#
+# Script to check the (grouped) RCFE list parser of afc_aggregate.py
+# (parseRCFEList and aggregateRCFEs) against the original row by row version,
+# which is kept here as the reference. The two are compared on the SD county
+# RCFE list in the data directory and on a synthetic statewide RCFE list (see
+# afc_synthetic.py), both for all facilities and for SD county only, and the
+# time taken by each is reported. Exits with status 1 if any check fails
+#
+# Note: the original version counts no facilities at all if any zipcode in the
+# list is not numeric (e.g.: "92683   0"; the zipcode col is then read as text)
+# while parseRCFEList only skips that facility, so the two only match on lists
+# with numeric zipcodes
+#
+# Usage:
+#
+# python afc_rcfe_check.py [DIR] [--facilities N] [--sras N]
+#
+# DIR (defaults to the current working directory) contains the SD county geo
+# crosswalk and RCFE list (see afc_aggregate.DATAFILES); the SD check is
+# skipped if they are missing
+#
+################################################################################
+
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import pandas as pd
+import genutils as genpy
+import sdpyutils as sdpy
+import afc_aggregate as afc
+import afc_synthetic as synth
+
+#
+# GLOBALS
+#
+
+# facility statuses counted (in the order of the output cols)
+STATUSES = ['LICENSED','PENDING']
+
+# county of the synthetic geography (see afc_synthetic.writeRCFEList)
+SYNTHETIC_COUNTY = 'SAN DIEGO'
+
+# synthetic statewide RCFE list
+DATAFILE_SYNTHETIC_RCFE = 'rcfe_ca_synthetic.csv'
+
+#
+# aggregateRCFEsLegacy
+#
+# the original (row by row) aggregation of the RCFE list; returns a dict of
+# [licensed count, licensed beds, pending count, pending beds] per zipcode
+#
+def aggregateRCFEsLegacy(csvdata,county=None):
+
+	rcfe_dict = {}
+	for index,row in csvdata.iterrows():
+
+		if county is not None and row[afc.RCFE_FACCOUNTY] != county:
+			continue
+
+		zipcode = row[afc.RCFE_FACZIP]; capacity = row[afc.RCFE_FACCAP]
+		status = row[afc.RCFE_FACSTATUS]
+
+		if zipcode in rcfe_dict:
+			if status == 'LICENSED':
+				rcfe_dict[zipcode][0] += 1
+				rcfe_dict[zipcode][1] += capacity
+			elif status == 'PENDING':
+				rcfe_dict[zipcode][2] += 1
+				rcfe_dict[zipcode][3] += capacity
+			else: pass
+		else:
+			if status == 'LICENSED':
+				rcfe_dict[zipcode] = [1,capacity,0,0]
+			elif status == 'PENDING':
+				rcfe_dict[zipcode] = [0,0,1,capacity]
+			else: pass
+
+	return rcfe_dict
+
+#
+# parseRCFEListLegacy
+#
+# the original (row by row) version of afc_aggregate.parseRCFEList
+#
+def parseRCFEListLegacy(zipdf,datafile,county=None):
+
+	usecols = [afc.RCFE_FACZIP,afc.RCFE_FACCAP,afc.RCFE_FACSTATUS]
+	if county is not None:
+		usecols.append(afc.RCFE_FACCOUNTY)
+
+	csvdata = pd.read_csv(datafile,skipinitialspace=True,usecols=usecols)
+	rcfe_dict = aggregateRCFEsLegacy(csvdata,county)
+
+	data = []
+	for zipcode in zipdf:
+		if int(zipcode) in rcfe_dict:
+			data.append(rcfe_dict[int(zipcode)])
+		else:
+			data.append([0,0,0,0])
+
+	out_cols = [afc.OUT_COL_NumRCFELicensed,afc.OUT_COL_NumRCFEBedsLicensed,
+				afc.OUT_COL_NumRCFEPending,afc.OUT_COL_NumRCFEBedsPending]
+	df = pd.DataFrame(columns=out_cols,data=data)
+	return df
+
+#
+# compareValues
+#
+# returns the number of rows in which the values of the data frames differ
+# (None if their cols or shapes differ)
+#
+def compareValues(df,df_legacy):
+
+	if df.columns.tolist() != df_legacy.columns.tolist() or \
+		df.shape != df_legacy.shape:
+		return None
+
+	return int((df.values.astype(np.float64) !=
+				df_legacy.values.astype(np.float64)).any(axis=1).sum())
+
+#
+# report
+#
+# prints the outcome of a check; returns True if it passed
+#
+def report(name,diff):
+
+	if diff == 0:
+		print("ok: " + name)
+		return True
+
+	if diff is None:
+		print("Error: " + name + ": cols or shape differ")
+	else:
+		print("Error: " + name + ": " + str(diff) + " row(s) differ")
+	return False
+
+#
+# checkAggregates
+#
+# checks afc_aggregate.aggregateRCFEs against the original aggregation over
+# all zipcodes in the RCFE list; returns True if they match
+#
+def checkAggregates(datafile,county=None):
+
+	csvdata = pd.read_csv(datafile,skipinitialspace=True)
+	rcfe_dict = aggregateRCFEsLegacy(csvdata,county)
+
+	if county is not None:
+		csvdata = csvdata[csvdata[afc.RCFE_FACCOUNTY] == county]
+	df_agg = afc.aggregateRCFEs(csvdata,STATUSES,afc.RCFE_FACZIP,
+						afc.RCFE_FACCAP,afc.RCFE_FACSTATUS)
+
+	zipcodes = sorted(rcfe_dict.keys())
+	df_legacy = pd.DataFrame(columns=df_agg.columns,
+						data=[rcfe_dict[z] for z in zipcodes])
+	diff = compareValues(df_agg.reindex(zipcodes).fillna(0).reset_index(
+						drop=True),df_legacy)
+	if diff is not None and len(df_agg.index) != len(zipcodes):
+		diff = None
+
+	return report("aggregateRCFEs[" + os.path.basename(datafile) +
+				("" if county is None else ", " + county) + "]",diff)
+
+#
+# checkRCFEList
+#
+# checks afc_aggregate.parseRCFEList against the original version for the
+# specified zipcodes and RCFE list and prints the time taken by each; returns
+# True if they match
+#
+def checkRCFEList(zipdf,datafile,county=None):
+
+	start = time.time()
+	df_legacy = parseRCFEListLegacy(zipdf,datafile,county)
+	legacySecs = time.time() - start
+
+	start = time.time()
+	df = afc.parseRCFEList(zipdf,datafile,county)
+	secs = time.time() - start
+
+	print("parseRCFEListLegacy: %.4fs parseRCFEList: %.4fs" % (legacySecs,
+			secs))
+
+	return report("parseRCFEList[" + os.path.basename(datafile) +
+				("" if county is None else ", " + county) + "]",
+				compareValues(df,df_legacy))
+
+#
+# checkSD
+#
+# runs the checks on the SD county geo crosswalk and RCFE list in datadir;
+# returns True if they pass (or the data files are missing)
+#
+def checkSD(datadir):
+
+	geoids = os.path.join(datadir,afc.DATAFILES['geoids'])
+	datafile = os.path.join(datadir,afc.DATAFILES['rcfe'])
+	if not os.path.exists(geoids) or not os.path.exists(datafile):
+		print("Warning: SD county data files not found in " + datadir +
+			"; skipping")
+		return True
+
+	df_geoids = sdpy.createGeoidsData(geoids)
+
+	results = [checkAggregates(datafile),
+			checkRCFEList(df_geoids[afc.OUT_COL_Zipcode],datafile)]
+	return all(results)
+
+#
+# checkStatewide
+#
+# runs the checks on a synthetic statewide RCFE list (all counties, statuses
+# and facilities in the synthetic geography) with and without the county
+# filter; returns True if they pass
+#
+def checkStatewide(sras,facilities):
+
+	rng = np.random.RandomState(0)
+	geo = synth.createGeography(sras,synth.SCALES['state']['zips_per_sra'])
+
+	with genpy.scratchDir('afc_rcfe_check_') as scratch:
+		geoids = os.path.join(scratch,sdpy.DATAFILE_SD_GEOIDS)
+		datafile = os.path.join(scratch,DATAFILE_SYNTHETIC_RCFE)
+		synth.writeGeoids(geoids,geo)
+		synth.writeRCFEList(datafile,geo,facilities,rng)
+
+		zipdf = sdpy.createGeoidsData(geoids)[afc.OUT_COL_Zipcode]
+
+		results = []
+		for county in [None,SYNTHETIC_COUNTY]:
+			results.append(checkAggregates(datafile,county))
+			results.append(checkRCFEList(zipdf,datafile,county))
+
+	return all(results)
+
+################################################################################
+#
+# main
+#
+def main():
+
+	parser = argparse.ArgumentParser(description="Check the grouped RCFE " +
+				"list parser against the original row by row version")
+	parser.add_argument('datadir',nargs='?',default=os.getcwd(),
+				help="directory containing the SD county data files")
+	parser.add_argument('--sras',type=int,
+				default=synth.SCALES['state']['sras'],
+				help="number of SRAs of the synthetic statewide geography")
+	parser.add_argument('--facilities',type=int,
+				default=synth.SCALES['state']['facilities'],
+				help="number of facilities in the synthetic statewide list")
+	args = parser.parse_args()
+
+	results = [checkSD(args.datadir),
+			checkStatewide(args.sras,args.facilities)]
+
+	if not all(results):
+		print("Error: the RCFE list parser differs from the original version")
+		exit(1)
+# end: main
+
+if __name__ == "__main__":
+	main()
+else:
+	# do nothing
+	pass
@@ -0,0 +1,434 @@
+#! /usr/bin/env python
+
+################################################################################
+#
+# afc_server.py
+#
+# Script to serve the aggregated AFC data set (afc_<version>.csv, see
+# afc_aggregate.py) over HTTP as JSON. The data set is loaded into memory
+# once and indexed on SRA, Region, Zipcode and ZCTA; when a newer version of
+# the data set lands (or the served file is modified) it is loaded and
+# swapped in atomically, i.e.: a request is answered from either the old or
+# the new version, never from a mix of both
+#
+# Endpoints (all GET):
+#
+# /status                           - served version, file and row count
+# /rows?SRA=..&Region=..&Zipcode=..&ZCTA=..[&cols=c1,c2]
+#                                   - rows matching all specified filters
+# /rollup?level=SRA|Region|County[&name=..]
+#                                   - counts rolled up to the specified level
+# /topk?col=..[&k=10][&level=sra|zipcode][&order=desc|asc]
+#                                   - SRA aggregate (or zipcode) rows with the
+#                                     k highest (or lowest) values of col 
+#                                     (rows without a value are left out)
+#
+# Usage:
+#
+# python afc_server.py [--port 8080] [--dir DIR | --file FILE] [--poll SECS]
+#
+# Dependencies:
+#
+# Data files must be present in the current working directory (or DIR)
+#
+################################################################################
+
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import threading
+import urlparse
+import BaseHTTPServer
+import SocketServer
+import numpy as np
+import pandas as pd
+import sdpyutils as sdpy
+import afc_aggregate as afc
+
+#
+# GLOBALS
+#
+
+# default port and interval (in seconds) between checks for new versions
+PORT = 8080
+POLL_INTERVAL = 5.0
+
+# served data files; afc_<version>.csv (the latest version is served)
+DATAFILE_PATTERN = re.compile(r'^afc_(\d+)\.csv$')
+
+# indexed cols
+INDEX_COLS = [afc.OUT_COL_SRA,afc.OUT_COL_Region,afc.OUT_COL_Zipcode,
+			afc.OUT_COL_ZCTA]
+# indexed cols holding zipcodes (looked up as integers)
+ZIPCODE_COLS = [afc.OUT_COL_Zipcode,afc.OUT_COL_ZCTA]
+
+# top-k levels and default k
+TOPK_SRA = 'sra'
+TOPK_ZIPCODE = 'zipcode'
+TOPK_DEFAULT = 10
+
+#
+# toJSON
+#
+# returns the JSON representation of the specified value (numpy scalars are
+# converted to python values and NaNs to null)
+#
+def toJSON(value):
+
+	def default(obj):
+		if isinstance(obj,np.generic):
+			return obj.item()
+		raise TypeError(repr(obj) + " is not JSON serializable")
+
+	return json.dumps(value,default=default)
+
+#
+# toRecords
+#
+# returns the rows of the specified data frame as a list of dicts (NaNs are
+# converted to None)
+#
+def toRecords(df):
+
+	records = []
+	cols = df.columns.tolist()
+	for row in df.itertuples(index=False):
+		records.append(dict((col,None if (isinstance(v,float) and v != v)
+								else v) for col, v in zip(cols,row)))
+
+	return records
+
+#
+# AFCTable
+#
+# an in-memory, indexed version of an AFC data set; immutable once loaded
+#
+class AFCTable(object):
+
+	def __init__(self,datafile):
+
+		self.datafile = datafile
+		self.mtime = os.path.getmtime(datafile)
+		m = DATAFILE_PATTERN.match(os.path.basename(datafile))
+		self.version = m.group(1) if m else None
+		self.loaded_at = time.strftime('%Y-%m-%dT%H:%M:%S')
+
+		# geo IDs are kept as written (e.g.: zipcodes with leading spaces)
+		self.df = pd.read_csv(datafile,dtype=dict((col,str)
+								for col in INDEX_COLS))
+		self.cols = self.df.columns.tolist()
+
+		# each row pre-serialized so that responses are joined, not encoded
+		self.records = toRecords(self.df)
+		self.json = [toJSON(record) for record in self.records]
+
+		# postings (row positions) per value of each indexed col
+		self.index = {}
+		for col in INDEX_COLS:
+			keys = self.df[col].str.strip()
+			if col in ZIPCODE_COLS:
+				keys = pd.Series(sdpy.codeZipcodes(self.df[col]))
+			postings = {}
+			for pos, key in enumerate(keys):
+				postings.setdefault(key,[]).append(pos)
+			self.index[col] = dict((key,np.array(pos))
+								for key, pos in postings.iteritems())
+
+		self.aggRows = np.where(sdpy.codeZipcodes(self.df[afc.OUT_COL_Zipcode])
+								== 0)[0]
+		self.zipRows = np.where(sdpy.codeZipcodes(self.df[afc.OUT_COL_Zipcode])
+								!= 0)[0]
+
+		# rollup records (and their JSON) per level
+		self.rollups = {}
+		rollup_df = afc.createRollups(self.df)
+		for level, level_df in rollup_df.groupby(sdpy.ROLLUP_COL_Level,
+												sort=False):
+			records = toRecords(level_df)
+			self.rollups[level] = (records,[toJSON(r) for r in records])
+
+		# top-k orderings are computed on first use (per col and level)
+		self.orders = {}
+
+	#
+	# lookup
+	#
+	# returns the positions of the rows matching all the specified (col,
+	# value) filters
+	#
+	def lookup(self,filters):
+
+		positions = None
+		for col, value in filters:
+			key = value.strip()
+			if col in ZIPCODE_COLS:
+				# same coding as sdpy.codeZipcodes (without the per call
+				# overhead of a pandas conversion)
+				key = int(key) if key.isdigit() else -1
+			rows = self.index[col].get(key,np.array([],dtype=np.int64))
+			positions = rows if positions is None else \
+						np.intersect1d(positions,rows)
+
+		if positions is None:
+			positions = np.arange(len(self.records))
+
+		return positions
+
+	#
+	# rows
+	#
+	# returns the JSON array of the specified rows (restricted to the
+	# specified cols, if any)
+	#
+	def rows(self,positions,cols=None):
+
+		if not cols:
+			return "[" + ",".join(self.json[pos] for pos in positions) + "]"
+
+		return toJSON([dict((col,self.records[pos][col]) for col in cols)
+					for pos in positions])
+
+	#
+	# order
+	#
+	# returns the positions of the rows of the specified level (TOPK_*)
+	# sorted by col in descending order; rows without a value (non-numeric
+	# values and derived fields that could not be computed, see 
+	# afc_aggregate.DERIVED_NA) are not ranked
+	#
+	def order(self,col,level):
+
+		key = (col,level)
+		if key not in self.orders:
+			rows = self.aggRows if level == TOPK_SRA else self.zipRows
+			values = pd.to_numeric(self.df[col].iloc[rows],errors='coerce')
+			values = values.values
+			ranked = ~np.isnan(values)
+			if col in afc.DERIVED_COLS:
+				ranked &= values != afc.DERIVED_NA
+			rows = rows[ranked]; values = values[ranked]
+			# stable sort so that ties keep the order of the data set
+			self.orders[key] = rows[np.argsort(-values,kind='mergesort')]
+
+		return self.orders[key]
+
+	#
+	# query
+	#
+	# answers the query for the specified path and parameters; returns the
+	# (status, JSON body) of the response
+	#
+	def query(self,path,params):
+
+		def param(name,default=None):
+			return params[name][0] if name in params else default
+
+		if path == '/status':
+			return 200, toJSON({'version': self.version,
+								'file': self.datafile,
+								'rows': len(self.records),
+								'loaded_at': self.loaded_at})
+
+		if path == '/rows':
+			cols = [c for c in param('cols','').split(",") if c]
+			unknown = [c for c in cols if c not in self.cols]
+			if unknown:
+				return 400, toJSON({'error': "unknown cols: " +
+									", ".join(unknown)})
+			filters = [(col,param(col)) for col in INDEX_COLS
+						if param(col) is not None]
+			return 200, self.rows(self.lookup(filters),cols)
+
+		if path == '/rollup':
+			level = param('level',sdpy.LEVEL_SRA)
+			if level not in self.rollups:
+				return 400, toJSON({'error': "unknown level: " + level})
+			records, rollups = self.rollups[level]
+			name = param('name')
+			if name is not None:
+				rollups = [rollups[i] for i, r in enumerate(records)
+							if r[level] == name]
+			return 200, "[" + ",".join(rollups) + "]"
+
+		if path == '/topk':
+			col = param('col')
+			level = param('level',TOPK_SRA)
+			if col not in self.cols or col in INDEX_COLS:
+				return 400, toJSON({'error': "unknown col: " + str(col)})
+			if level not in [TOPK_SRA,TOPK_ZIPCODE]:
+				return 400, toJSON({'error': "unknown level: " + level})
+			try:
+				k = int(param('k',TOPK_DEFAULT))
+			except ValueError:
+				return 400, toJSON({'error': "k must be an integer"})
+			positions = self.order(col,level)
+			if param('order','desc') == 'asc':
+				positions = positions[::-1]
+			return 200, self.rows(positions[:max(0,k)])
+
+		return 404, toJSON({'error': "unknown path: " + path})
+
+#
+# findLatest
+#
+# returns the latest version of the AFC data set in the specified directory
+# (None if there is none)
+#
+def findLatest(datadir):
+
+	versions = []
+	for fname in os.listdir(datadir):
+		m = DATAFILE_PATTERN.match(fname)
+		if m:
+			versions.append((m.group(1),fname))
+
+	if not versions:
+		return None
+
+	return os.path.join(datadir,max(versions)[1])
+
+#
+# TableHolder
+#
+# holds the served table and swaps in new versions; since the table is
+# replaced by a single reference assignment (and tables are immutable),
+# requests always see a complete version
+#
+class TableHolder(object):
+
+	def __init__(self,datadir=None,datafile=None):
+		self.datadir = datadir
+		self.datafile = datafile
+		self.table = None
+		self.reload()
+
+	def target(self):
+		if self.datafile is not None:
+			return self.datafile
+		return findLatest(self.datadir)
+
+	#
+	# reload
+	#
+	# loads the target data file if it differs from (or is newer than) the
+	# served one; a version that fails to load is skipped and the served one
+	# kept
+	#
+	def reload(self):
+
+		datafile = self.target()
+		if datafile is None:
+			return False
+
+		table = self.table
+		if table is not None and table.datafile == datafile and \
+			table.mtime == os.path.getmtime(datafile):
+			return False
+
+		try:
+			newTable = AFCTable(datafile)
+		except Exception, e:
+			print("Error: Failed to load " + datafile + ": " + str(e))
+			return False
+
+		self.table = newTable
+		print("serving: " + datafile)
+		return True
+
+	def watch(self,interval):
+
+		def poll():
+			while True:
+				time.sleep(interval)
+				try:
+					self.reload()
+				except Exception, e:
+					print("Error: " + str(e))
+
+		thread = threading.Thread(target=poll)
+		thread.daemon = True
+		thread.start()
+
+#
+# AFCRequestHandler
+#
+class AFCRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+	# keep-alive connections (responses always have a content length); the 
+	# response is written in a single send (buffered and without Nagle's 
+	# algorithm delaying it)
+	protocol_version = 'HTTP/1.1'
+	wbufsize = -1
+	disable_nagle_algorithm = True
+
+	def do_GET(self):
+
+		url = urlparse.urlparse(self.path)
+		table = self.server.holder.table
+		if table is None:
+			status, body = 503, toJSON({'error': "no data set loaded"})
+		else:
+			try:
+				status, body = table.query(url.path,urlparse.parse_qs(url.query))
+			except Exception, e:
+				status, body = 500, toJSON({'error': str(e)})
+
+		self.send_response(status)
+		self.send_header('Content-Type','application/json')
+		self.send_header('Content-Length',str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def log_message(self,format,*args):
+		# do not log every request
+		pass
+
+class AFCServer(SocketServer.ThreadingMixIn,BaseHTTPServer.HTTPServer):
+	daemon_threads = True
+	allow_reuse_address = True
+
+	def __init__(self,address,holder):
+		BaseHTTPServer.HTTPServer.__init__(self,address,AFCRequestHandler)
+		self.holder = holder
+
+################################################################################
+#
+# main
+#
+def main():
+
+	parser = argparse.ArgumentParser(description="Serve the AFC data set " +
+				"as JSON over HTTP")
+	parser.add_argument('--port',type=int,default=PORT)
+	parser.add_argument('--host',default='127.0.0.1')
+	parser.add_argument('--dir',default=os.getcwd(),
+				help="directory to serve the latest afc_<version>.csv from")
+	parser.add_argument('--file',default=None,
+				help="serve (and reload) this data file only")
+	parser.add_argument('--poll',type=float,default=POLL_INTERVAL,
+				help="seconds between checks for new versions")
+	args = parser.parse_args()
+
+	holder = TableHolder(args.dir,args.file)
+	if holder.table is None:
+		print("Error: no AFC data set found")
+		exit(1)
+	holder.watch(args.poll)
+
+	server = AFCServer((args.host,args.port),holder)
+	print("listening on: http://%s:%d" % (args.host,args.port))
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		pass
+	server.server_close()
+# end: main
+
+if __name__ == "__main__":
+	main()
+else:
+	# do nothing
+	pass
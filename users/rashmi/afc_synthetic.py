@@ -0,0 +1,342 @@
+#! /usr/bin/env python
+
+################################################################################
+#
+# afc_synthetic.py
+#
+# Script to generate synthetic data files with the same layout as the data
+# files used by the AFC scripts (geo crosswalk, CDSS RCFE list, ALWP list,
+# SANDAG/HHSA population tables, ACS B17024 and B19049 tables) at a
+# configurable scale; used to benchmark the AFC scripts (see afc_benchmark.py)
+#
+# Usage:
+#
+# python afc_synthetic.py OUTDIR [--scale county|state|national]
+#                               [--sras N] [--zips-per-sra N] [--facilities N]
+#
+################################################################################
+
+import os
+import sys
+import csv
+import argparse
+import numpy as np
+import pandas as pd
+from zipfile import ZipFile, ZIP_DEFLATED
+from collections import OrderedDict
+import sdpyutils as sdpy
+import afc_aggregate as afc
+import income_stats as incstats
+
+#
+# GLOBALS
+#
+
+# preset scales; number of SRAs, zipcodes per SRA and RCFE list rows
+SCALES = OrderedDict([
+	# a single county (SD county has 41 SRAs)
+	('county', {'sras': 41, 'zips_per_sra': 3, 'facilities': 3000}),
+	# all CA counties (every facility type and status)
+	('state', {'sras': 600, 'zips_per_sra': 3, 'facilities': 100000}),
+	# national ZCTA set (~33k ZCTAs)
+	('national', {'sras': 8300, 'zips_per_sra': 4, 'facilities': 500000})
+])
+
+# number of SRAs per region
+SRAS_PER_REGION = 8
+
+# first synthetic zipcode
+FIRST_ZIPCODE = 60000
+
+# CDSS facility statuses and (relative) frequencies
+FACILITY_STATUSES = ['LICENSED','PENDING','CLOSED','UNLICENSED','ON PROBATION']
+FACILITY_STATUS_P = [0.62,0.06,0.28,0.035,0.005]
+
+# CDSS facility list fields
+FACILITY_FIELDS = ['Facility Type','Facility Number','Facility Name',
+	'Facility Zip','County Name','Facility Capacity','Facility Status']
+
+# ACS B17024 age groups and income to poverty level ratio bands
+B17024_AGE_GROUPS = ['Under 6 years','6 to 11 years','12 to 17 years',
+	'18 to 24 years','25 to 34 years','35 to 44 years','45 to 54 years',
+	'55 to 64 years','65 to 74 years','75 years and over']
+B17024_RATIOS = ['Under .50','.50 to .74','.75 to .99','1.00 to 1.24',
+	'1.25 to 1.49','1.50 to 1.74','1.75 to 1.84','1.85 to 1.99','2.00 to 2.99',
+	'3.00 to 3.99','4.00 to 4.99','5.00 and over']
+
+# SANDAG ethnicity cols (see demographics.py)
+RACE_COLS = ['Two or More','Other','Pacific Islander','Asian',
+	'American Indian','Black','White','Hispanic']
+
+#
+# formatCounts
+#
+# formats counts with thousands separators (as in the SD HHSA data files)
+#
+def formatCounts(values):
+	return ['{:,}'.format(int(v)) for v in values]
+
+#
+# createGeography
+#
+# returns the synthetic geography as a list of (SRA, Region, zipcodes) tuples
+#
+def createGeography(sras,zipsPerSRA):
+
+	geo = []
+	zipcode = FIRST_ZIPCODE
+	for i in range(sras):
+		zipcodes = [str(zipcode + j) for j in range(zipsPerSRA)]
+		zipcode += zipsPerSRA
+		geo.append(('SRA %05d' % i,'Region %03d' % (i // SRAS_PER_REGION),
+					zipcodes))
+
+	return geo
+
+#
+# writeGeoids
+#
+# writes the geo crosswalk (same layout as sd_county_sra_zip_zcta.txt)
+#
+def writeGeoids(fname,geo):
+
+	with open(fname,'w') as f:
+		writer = csv.writer(f,delimiter='\t',lineterminator='\n')
+		writer.writerow(['Sub Regional Area (SRA)','Region',
+						'Enclosing Zip Code(s)','Enclosing ZCTA(s)'])
+		for sra, region, zipcodes in geo:
+			writer.writerow([sra,region,", ".join(zipcodes),", ".join(zipcodes)])
+
+#
+# writeRCFEList
+#
+# writes the CDSS RCFE list (all counties; facilities in the synthetic
+# geography are in county 'SAN DIEGO')
+#
+def writeRCFEList(fname,geo,facilities,rng):
+
+	zipcodes = np.array([int(z) for sra, region, zips in geo for z in zips])
+
+	df = pd.DataFrame(OrderedDict([
+		('Facility Type',['RCFE'] * facilities),
+		('Facility Number',np.arange(facilities) + 100000000),
+		('Facility Name',['FACILITY %d' % i for i in range(facilities)]),
+		('Facility Zip',rng.choice(zipcodes,facilities)),
+		('County Name',rng.choice(['SAN DIEGO','LOS ANGELES','ORANGE'],
+								facilities,p=[0.5,0.3,0.2])),
+		('Facility Capacity',rng.randint(4,200,facilities)),
+		('Facility Status',rng.choice(FACILITY_STATUSES,facilities,
+								p=FACILITY_STATUS_P))]))
+	df.to_csv(fname,index=False)
+
+#
+# writeALWPList
+#
+# writes the list of RCFEs in the ALWP program
+#
+def writeALWPList(fname,geo,rng):
+
+	zipcodes = [z for sra, region, zips in geo for z in zips]
+	n = max(1,len(zipcodes) // 2)
+	pd.DataFrame({'Zip Code': rng.choice(zipcodes,n)}).to_csv(fname,
+																index=False)
+
+#
+# writeHHSAPopulation / writeADODPopulation
+#
+# write the SD HHSA population (55 and over) and ADOD population tables; both
+# have a title row and comma formatted counts
+#
+def writeHHSAPopulation(fname,geo,rng):
+
+	with open(fname,'w') as f:
+		f.write('Population 55 and Over by SRA\n')
+		writer = csv.writer(f,lineterminator='\n')
+		writer.writerow(['SRA','55-64','65-74','75-84','85 and Over',
+						'55 and Over'])
+		for sra, region, zipcodes in geo:
+			pop = rng.randint(100,10000,4)
+			writer.writerow([sra] + formatCounts(pop) + formatCounts([pop.sum()]))
+
+def writeADODPopulation(fname,geo,rng):
+
+	with open(fname,'w') as f:
+		f.write('ADOD Population 55 and Over by SRA\n')
+		writer = csv.writer(f,lineterminator='\n')
+		writer.writerow(['SRA','2012','2030'])
+		for sra, region, zipcodes in geo:
+			writer.writerow([sra] + formatCounts(rng.randint(50,4000,2)))
+
+#
+# writeLowIncomePopulation
+#
+# writes the low income population table (as created by income_stats.py)
+#
+def writeLowIncomePopulation(fname,geo,rng):
+
+	rows = []
+	for sra, region, zipcodes in geo:
+		for zipcode in zipcodes + ['00000']:
+			li = rng.randint(0,1000,3)
+			rows.append([sra,region,zipcode,zipcode] + list(li) +
+						[li.sum(),li[1:].sum()])
+
+	pd.DataFrame(columns=['SRA','Region','Zipcode','ZCTA',
+		'55 to 64 (Low Income)','65 to 74 (Low Income)',
+		'75 and over (Low Income)','55 and Over (Low Income)',
+		'65 and Over (Low Income)'],data=rows).to_csv(fname,index=False)
+
+#
+# writeSANDAGPopulation
+#
+# writes the SANDAG population estimate (as created by demographics.py)
+#
+def writeSANDAGPopulation(fname,geo,year,rng):
+
+	age_cols = ['80+','70-79','60-69','50-59','40-49','30-39','20-29','10-19',
+				'Under 10']
+
+	rows = []
+	for sra, region, zipcodes in geo:
+		for sex in ['Male','Female','Total']:
+			rows.append([sra,year,sex] + list(rng.randint(0,5000,len(age_cols))) +
+						list(rng.randint(0,5000,len(RACE_COLS))))
+
+	pd.DataFrame(columns=['SRA','YEAR','TYPE'] + age_cols + RACE_COLS,
+				data=rows).to_csv(fname,index=False)
+
+#
+# writeMedianHHIncome
+#
+# writes the ACS B19049 (median household income by age) table; includes the
+# ACS annotations used for top-coded and missing values
+#
+def writeMedianHHIncome(fname,geo,rng):
+
+	with open(fname,'w') as f:
+		writer = csv.writer(f,lineterminator='\n')
+		writer.writerow(['GEO.id','GEO.id2','GEO.display-label','HD01_VD02',
+						'HD01_VD06'])
+		writer.writerow(['Id','Id2','Geography',
+			'Median household income in the past 12 months; Total:',
+			'Median household income in the past 12 months; ' +
+			'Householder 65 years and over'])
+		for sra, region, zipcodes in geo:
+			for zipcode in zipcodes:
+				over65 = rng.choice(['250,000+','-',str(rng.randint(20000,90000))],
+									p=[0.05,0.05,0.9])
+				writer.writerow(['8600000US' + zipcode,zipcode,'ZCTA5 ' + zipcode,
+								rng.randint(20000,150000),over65])
+
+#
+# createB17024Fields
+#
+# returns the ACS B17024 metadata (field ids and labels) as a list of pairs
+#
+def createB17024Fields():
+
+	fields = [('GEO.id','Id'),('GEO.id2','Id2'),('GEO.display-label','Geography')]
+
+	labels = ['Total:']
+	for age in B17024_AGE_GROUPS:
+		labels.append(age + ':')
+		labels.extend([age + ': - ' + ratio for ratio in B17024_RATIOS])
+
+	for i, label in enumerate(labels):
+		fields.append(('HD01_VD%02d' % (i + 1),'Estimate; ' + label))
+		fields.append(('HD02_VD%02d' % (i + 1),'Margin of Error; ' + label))
+
+	return fields
+
+#
+# writeB17024
+#
+# writes the ACS B17024 (age by ratio of income to poverty level) archive with
+# the same layout as the American FactFinder download (metadata and data file)
+#
+def writeB17024(fname,geo,rng):
+
+	fields = createB17024Fields()
+	ids = [fid for fid, label in fields]
+	nvalues = len(fields) - 3
+
+	zipcodes = [z for sra, region, zips in geo for z in zips]
+	values = rng.randint(0,500,(len(zipcodes),nvalues))
+
+	prefix = os.path.splitext(os.path.basename(fname))[0]
+	metadata = "\n".join(fid + ',"' + label + '"' for fid, label in fields)
+
+	df = pd.DataFrame(columns=ids[3:],data=values)
+	df.insert(0,'GEO.display-label',['ZCTA5 ' + z for z in zipcodes])
+	df.insert(0,'GEO.id2',zipcodes)
+	df.insert(0,'GEO.id',['8600000US' + z for z in zipcodes])
+	labels = pd.DataFrame([[label for fid, label in fields]],columns=ids)
+	data = pd.concat([labels,df],axis=0).to_csv(index=False)
+
+	with ZipFile(fname,'w',ZIP_DEFLATED) as zipf:
+		zipf.writestr(prefix + '_metadata.csv',metadata + "\n")
+		zipf.writestr(prefix + '_with_ann.csv',data)
+
+#
+# generate
+#
+# generates all data files (named as expected by the AFC scripts) for the
+# specified scale under outdir; returns the synthetic geography
+#
+def generate(outdir,sras,zipsPerSRA,facilities,seed=0):
+
+	rng = np.random.RandomState(seed)
+
+	if not os.path.exists(outdir):
+		os.makedirs(outdir)
+
+	def path(fname):
+		return os.path.join(outdir,fname)
+
+	geo = createGeography(sras,zipsPerSRA)
+
+	writeGeoids(path(sdpy.DATAFILE_SD_GEOIDS),geo)
+	writeRCFEList(path(afc.DATAFILE_SD_RCFE),geo,facilities,rng)
+	writeALWPList(path(afc.DATAFILE_SD_RCFE_IN_ALWP),geo,rng)
+	writeHHSAPopulation(path(afc.DATAFILE_SD_2012_POP_55_OVER),geo,rng)
+	writeHHSAPopulation(path(afc.DATAFILE_SD_2030_POP_55_OVER),geo,rng)
+	writeADODPopulation(path(afc.DATAFILE_SD_ADOD_POP_55_OVER),geo,rng)
+	writeLowIncomePopulation(path(afc.DATAFILE_SD_2012_LOW_INCOME_POP_55_OVER),
+							geo,rng)
+	writeSANDAGPopulation(path(afc.DATAFILE_SD_2012_POP),geo,2012,rng)
+	writeMedianHHIncome(path(afc.DATAFILE_SD_2012_MEDIAN_HH_INCOME),geo,rng)
+	writeB17024(path(incstats.DATAZIP),geo,rng)
+
+	return geo
+
+################################################################################
+#
+# main
+#
+def main():
+
+	parser = argparse.ArgumentParser(description="Generate synthetic AFC " +
+				"data files")
+	parser.add_argument('outdir',help="directory to write the data files to")
+	parser.add_argument('--scale',choices=list(SCALES.keys()),default='county')
+	parser.add_argument('--sras',type=int,default=None)
+	parser.add_argument('--zips-per-sra',type=int,default=None)
+	parser.add_argument('--facilities',type=int,default=None)
+	parser.add_argument('--seed',type=int,default=0)
+	args = parser.parse_args()
+
+	scale = dict(SCALES[args.scale])
+	for key in ['sras','zips_per_sra','facilities']:
+		if getattr(args,key) is not None:
+			scale[key] = getattr(args,key)
+
+	generate(args.outdir,scale['sras'],scale['zips_per_sra'],
+			scale['facilities'],args.seed)
+	print("output: " + args.outdir)
+# end: main
+
+if __name__ == "__main__":
+	main()
+else:
+	# do nothing
+	pass
@@ -0,0 +1,182 @@
+#! /usr/bin/env python
+
+#
+# allocutils.py
+#
+# Script with utility functions for moving data between geographies (e.g.:
+# zipcode/ZCTA/census tract to SRA) using sparse allocation matrices
+#
+# A crosswalk between a source and a target geography is held as a sparse
+# (targets x sources) matrix of weights; allocating a data frame of measures
+# (a row per source geo ID, any number of numeric cols) to the target
+# geography is a single sparse matrix product. Weights may be fractional
+# (e.g.: HUD zip to tract residential address ratios) so that sources that
+# overlap several targets are apportioned rather than counted in each of them
+#
+# The engine is standalone: the AFC scripts (afc_aggregate.py, sdpyutils.py)
+# do not use it and keep their own crosswalk aggregation; it is exercised by
+# afc_benchmark.py only
+#
+# Dependencies:
+#
+# scipy (imported on first use so that importing this module does not need it)
+#
+
+import os
+import sys
+import numpy as np
+import pandas as pd
+import genutils as genpy
+import sdpyutils as sdpy
+import instrutils as instrpy
+
+sparse = genpy.lazyImport('scipy.sparse')
+
+# HUD USPS zip to tract crosswalk col names (see packages/packagelist.txt)
+HUD_COL_ZIP = 'zip'
+HUD_COL_TRACT = 'tract'
+HUD_COL_RES_RATIO = 'res_ratio'
+HUD_COL_TOT_RATIO = 'tot_ratio'
+
+#
+# AllocationMatrix
+#
+# sparse (targets x sources) weight matrix; the value of a source is added to
+# each target in proportion to the weight of the (target, source) entry
+#
+class AllocationMatrix(object):
+
+	def __init__(self,sources,targets,matrix):
+		self.sources = pd.Index(sources)
+		self.targets = pd.Index(targets)
+		self.matrix = sparse.csr_matrix(matrix)
+
+	#
+	# normalized
+	#
+	# returns a copy with the weights of each source scaled to add up to 1
+	# (i.e.: sources are apportioned among their targets); sources without
+	# weights are left as is
+	#
+	def normalized(self):
+
+		totals = np.asarray(self.matrix.sum(axis=0)).ravel()
+		scale = np.zeros(len(totals))
+		scale[totals != 0] = 1.0 / totals[totals != 0]
+
+		return AllocationMatrix(self.sources,self.targets,
+							self.matrix.dot(sparse.diags(scale)))
+
+	#
+	# allocate
+	#
+	# allocates the specified data frame (indexed by source geo ID; sources
+	# not in the matrix are ignored and missing/NaN values count as 0) to the
+	# target geography and returns the result indexed by target geo ID
+	#
+	@instrpy.instrument('allocutils.allocate')
+	def allocate(self,df,cols=None):
+
+		if cols is None:
+			cols = df.columns.tolist()
+
+		values = df[cols][~df.index.duplicated(keep='last')]
+		values = values.reindex(self.sources).apply(pd.to_numeric,
+											errors='coerce').fillna(0)
+
+		data = self.matrix.dot(values.values.astype(np.float64))
+
+		return pd.DataFrame(index=self.targets,columns=cols,data=data)
+
+	#
+	# compose
+	#
+	# returns the matrix allocating the sources of this matrix directly to the
+	# targets of other (whose sources are the targets of this matrix), e.g.:
+	# tract -> zipcode followed by zipcode -> SRA
+	#
+	def compose(self,other):
+
+		idx = other.sources.get_indexer(self.targets)
+		rows = np.where(idx >= 0)[0]
+
+		# maps the targets of this matrix onto the sources of other
+		link = sparse.csr_matrix((np.ones(len(rows)),(idx[rows],rows)),
+							shape=(len(other.sources),len(self.targets)))
+
+		return AllocationMatrix(self.sources,other.targets,
+							other.matrix.dot(link).dot(self.matrix))
+
+#
+# createAllocationMatrix
+#
+# creates an allocation matrix from (source, target, weight) triples; weights
+# default to 1 and duplicate pairs are added up. If normalize is set, the
+# weights of each source are scaled to add up to 1
+#
+def createAllocationMatrix(sources,targets,weights=None,normalize=False):
+
+	sources = pd.Series(sources).values
+	targets = pd.Series(targets).values
+	if weights is None:
+		weights = np.ones(len(sources))
+	weights = np.asarray(weights,dtype=np.float64)
+
+	srcIndex = pd.Index(pd.unique(sources))
+	tgtIndex = pd.Index(pd.unique(targets))
+
+	matrix = sparse.coo_matrix((weights,(tgtIndex.get_indexer(targets),
+							srcIndex.get_indexer(sources))),
+							shape=(len(tgtIndex),len(srcIndex))).tocsr()
+	matrix.sum_duplicates()
+
+	alloc = AllocationMatrix(srcIndex,tgtIndex,matrix)
+
+	return alloc.normalized() if normalize else alloc
+
+#
+# createCrosswalkMatrix
+#
+# creates the zipcode (or ZCTA, if by is 'zcta') to SRA allocation matrix for
+# the specified geoID data file; zipcodes are integers (see
+# sdpyutils.codeZipcodes). Zipcodes listed under more than one SRA are split
+# evenly among them if normalize is set and added to each of them otherwise
+#
+def createCrosswalkMatrix(geoid_datafile=None,by='zipcode',normalize=True):
+
+	xwalk = sdpy.getCrosswalk(geoid_datafile)
+	members = xwalk.sra_zctas if by == 'zcta' else xwalk.sra_zipcodes
+
+	sources = []; targets = []
+	for sra in xwalk.sras:
+		for member in members[sra]:
+			if member > 0:
+				sources.append(member)
+				targets.append(sra)
+
+	return createAllocationMatrix(sources,targets,normalize=normalize)
+
+#
+# loadAllocationMatrix
+#
+# creates an allocation matrix from the specified CSV file with source, target
+# and weight cols (e.g.: the HUD zip to tract crosswalk, see HUD_COL_*); col
+# names are matched case-insensitively
+#
+def loadAllocationMatrix(datafile,sourceCol,targetCol,weightCol=None,
+						normalize=False):
+
+	# geo IDs are read as strings and coded as integers (leading zeros and
+	# whitespace are dropped)
+	csvdata = pd.read_csv(datafile,skipinitialspace=True,dtype=str)
+	csvdata.columns = [col.lower() for col in csvdata.columns]
+	print("parsing data file: " + datafile)
+
+	sources = sdpy.codeZipcodes(csvdata[sourceCol.lower()])
+	targets = sdpy.codeZipcodes(csvdata[targetCol.lower()])
+	weights = None
+	if weightCol is not None:
+		weights = pd.to_numeric(csvdata[weightCol.lower()],
+							errors='coerce').fillna(0).values
+
+	return createAllocationMatrix(sources,targets,weights,normalize)
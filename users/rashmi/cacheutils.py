@@ -0,0 +1,315 @@
+#! /usr/bin/env python
+
+#
+# cacheutils.py
+#
+# Script with utility functions for caching parsed intermediary data on disk
+#
+# Parsed data frames are keyed by the content hash of the data file they were
+# parsed from, the parser (including the source of the scripts it is defined
+# in and uses) and the parameters passed to it. Entries are stored
+# as pickled data frames (i.e.: binary column blocks rather than CSV text) and
+# the total size of the cache is bounded by evicting least recently used
+# entries
+#
+
+import os
+import sys
+import types
+import hashlib
+import tempfile
+import pandas as pd
+import genutils as genpy
+
+# current working directory
+CWD = os.getcwd()
+
+# default cache location and size bound (in bytes)
+CACHEDIR = os.path.join(CWD,".afc_cache")
+CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+# file extension for cache entries
+CACHE_EXT = ".pkl"
+
+# block size used when hashing data files
+HASH_BLOCK_SIZE = 1024 * 1024
+
+# version of the cache entries; bump to invalidate all entries (e.g.: when 
+# parsing changes in a way the source digests of the scripts do not capture,
+# such as a new pandas version)
+CACHE_VERSION = 1
+
+# directory containing the scripts (parsers and their helpers)
+SCRIPTDIR = os.path.dirname(os.path.abspath(__file__))
+
+# source files of the scripts used by each module, keyed by module name
+_SOURCES = {}
+
+#
+# fileDigest
+#
+# returns the (sha1) hex digest of the contents of the specified file
+#
+def fileDigest(fname):
+
+	h = hashlib.sha1()
+	with open(fname,'rb') as f:
+		for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+			h.update(block)
+
+	return h.hexdigest()
+
+#
+# updateDigest
+#
+# adds the specified parameter to the hash object; data frames and series are
+# hashed by content, everything else by its representation
+#
+def updateDigest(h,param):
+
+	if isinstance(param,(pd.DataFrame,pd.Series)):
+		h.update(repr(param.shape).encode('utf-8'))
+		if isinstance(param,pd.DataFrame):
+			h.update(repr(param.columns.tolist()).encode('utf-8'))
+		else:
+			h.update(repr(param.name).encode('utf-8'))
+		h.update(pd.util.hash_pandas_object(param,index=True).values.tobytes())
+	else:
+		h.update(repr(param).encode('utf-8'))
+
+#
+# scriptSource
+#
+# returns the source file of the specified module if it is one of the scripts
+# (i.e.: in SCRIPTDIR) and None otherwise; lazily imported scripts (see 
+# genutils.lazyImport) are imported
+#
+def scriptSource(module):
+
+	if isinstance(module,genpy.LazyModule):
+		if not os.path.exists(os.path.join(SCRIPTDIR,module._name + ".py")):
+			return None
+		module = module._load()
+
+	fname = getattr(module,'__file__',None)
+	if fname is None:
+		return None
+
+	# (by name; relative module paths do not survive a change of directory)
+	fname = os.path.join(SCRIPTDIR,os.path.splitext(
+						os.path.basename(fname))[0] + ".py")
+
+	return fname if os.path.exists(fname) else None
+
+#
+# scriptSources
+#
+# returns the source files of the scripts the specified module is defined in
+# and uses (i.e.: the scripts it imports, recursively)
+#
+def scriptSources(moduleName):
+
+	if moduleName in _SOURCES:
+		return _SOURCES[moduleName]
+
+	sources = set()
+	pending = [sys.modules[moduleName]] if moduleName in sys.modules else []
+	while pending:
+		module = pending.pop()
+		fname = scriptSource(module)
+		if fname is None or fname in sources:
+			continue
+		sources.add(fname)
+		if isinstance(module,genpy.LazyModule):
+			module = module._load()
+		for value in list(vars(module).values()):
+			if isinstance(value,(types.ModuleType,genpy.LazyModule)):
+				pending.append(value)
+
+	_SOURCES[moduleName] = sorted(sources)
+
+	return _SOURCES[moduleName]
+
+#
+# funcDigest
+#
+# returns a hex digest identifying the specified function (name and code) and
+# the source of the scripts it is defined in and uses (see scriptSources) so 
+# that cache entries are invalidated when a parser or any of its helpers 
+# changes; for instrumented functions (see instrutils.instrument) the wrapped
+# function is used
+#
+def funcDigest(func):
+
+	func = getattr(func,'__wrapped__',func)
+
+	h = hashlib.sha1()
+	h.update(str(CACHE_VERSION).encode('utf-8'))
+	h.update((func.__module__ + "." + func.__name__).encode('utf-8'))
+	updateCodeDigest(h,func.__code__)
+	for fname in scriptSources(func.__module__):
+		h.update(fileDigest(fname).encode('utf-8'))
+
+	return h.hexdigest()
+
+#
+# updateCodeDigest
+#
+# adds the specified code object to the hash object (recursing into nested 
+# code objects such as lambdas, whose repr includes their memory address)
+#
+def updateCodeDigest(h,code):
+
+	h.update(code.co_code)
+	for const in code.co_consts:
+		if hasattr(const,'co_code'):
+			updateCodeDigest(h,const)
+		else:
+			h.update(repr(const).encode('utf-8'))
+
+#
+# ParseCache
+#
+# size-bounded, content-addressed on-disk cache of parser results
+#
+class ParseCache(object):
+
+	def __init__(self,cachedir=None,max_bytes=None):
+		self.cachedir = CACHEDIR if cachedir is None else cachedir
+		self.max_bytes = CACHE_MAX_BYTES if max_bytes is None else max_bytes
+
+	#
+	# key
+	#
+	# returns the cache key for calling func with the specified args, where
+	# datafile is the file parsed by func (keyed by content, not by path)
+	#
+	def key(self,datafile,func,args):
+
+		h = hashlib.sha1()
+		h.update(fileDigest(datafile).encode('utf-8'))
+		h.update(funcDigest(func).encode('utf-8'))
+		for arg in args:
+			if arg is datafile:
+				continue
+			updateDigest(h,arg)
+
+		return h.hexdigest()
+
+	def path(self,key):
+		return os.path.join(self.cachedir,key + CACHE_EXT)
+
+	#
+	# get
+	#
+	# returns the data frame cached under the specified key (or None if there
+	# is no such entry) and marks the entry as recently used
+	#
+	def get(self,key):
+
+		fname = self.path(key)
+		if not os.path.exists(fname):
+			return None
+
+		try:
+			df = pd.read_pickle(fname)
+			os.utime(fname,None)
+		except Exception:
+			# evicted concurrently or unreadable; treat as a cache miss
+			return None
+
+		return df
+
+	#
+	# put
+	#
+	# stores the data frame under the specified key and evicts least recently
+	# used entries if the cache exceeds its size bound
+	#
+	def put(self,key,df):
+
+		if not os.path.exists(self.cachedir):
+			try:
+				os.makedirs(self.cachedir)
+			except OSError:
+				# created concurrently by another process
+				if not os.path.isdir(self.cachedir):
+					raise
+
+		# write to a temp file and rename so that concurrent readers never see
+		# a partially written entry
+		fd, tmpname = tempfile.mkstemp(dir=self.cachedir,suffix=".tmp")
+		os.close(fd)
+		try:
+			df.to_pickle(tmpname)
+			os.rename(tmpname,self.path(key))
+		except:
+			if os.path.exists(tmpname):
+				os.remove(tmpname)
+			raise
+
+		self.evict()
+
+	#
+	# evict
+	#
+	# removes least recently used entries until the cache is within its size
+	# bound
+	#
+	def evict(self):
+
+		entries = []
+		for fname in os.listdir(self.cachedir):
+			if not fname.endswith(CACHE_EXT):
+				continue
+			try:
+				st = os.stat(os.path.join(self.cachedir,fname))
+			except OSError:
+				continue
+			entries.append((st.st_mtime,st.st_size,fname))
+
+		total = sum(size for mtime, size, fname in entries)
+		for mtime, size, fname in sorted(entries):
+			if total <= self.max_bytes:
+				break
+			try:
+				os.remove(os.path.join(self.cachedir,fname))
+			except OSError:
+				# already evicted by another process
+				pass
+			total -= size
+
+	#
+	# call
+	#
+	# returns the result of func(*args), where datafile is the file parsed by
+	# func, from the cache if available and otherwise calls func and caches
+	# the result
+	#
+	def call(self,datafile,func,*args):
+
+		key = self.key(datafile,func,args)
+
+		df = self.get(key)
+		if df is not None:
+			print("using cached data for: " + datafile)
+			return df
+
+		df = func(*args)
+		self.put(key,df)
+
+		return df
+
+	#
+	# clear
+	#
+	# removes all entries from the cache
+	#
+	def clear(self):
+
+		if not os.path.exists(self.cachedir):
+			return
+
+		for fname in os.listdir(self.cachedir):
+			if fname.endswith(CACHE_EXT):
+				os.remove(os.path.join(self.cachedir,fname))
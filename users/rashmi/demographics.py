@@ -5,37 +5,46 @@
 #
 # Script to read in multiple excel files with demographics information
 # specific to an SRA (Sub-Regional Area) and collate them into a single 
-# CSV file representing demographics for the entire county
+# CSV file representing demographics for the entire county. The Excel files
+# are read directly from the archive (nothing is extracted to disk)
+#
+# Usage:
+#
+# python demographics.py [DATAID VER [OUT_CSV]] [--store] [--year YEAR]
+#                        [--long LONG_CSV]
+#
+# DATAID and VER select the archive to collate (defaults to the values below) 
+# and OUT_CSV overrides the name of the output file
+#
+# With --store, all years of the archive are parsed once into a long format
+# store (a row per SRA, year, sex, age band and ethnicity; see createStore)
+# that is cached (keyed by the contents of the archive, see cacheutils) and 
+# the output is reshaped from the store; YEAR selects the year to output (and
+# defaults to the year of DATAID) and LONG_CSV names a file to write the store
+# to
+#
+# Importing the script has no side effects (nothing is parsed or written); 
+# collate(archive) returns the collated data as a data frame
 #
 
 import os
 import sys
-import shutil
-import pandas as pd
-import numpy as np
-from zipfile import ZipFile
+import argparse
+import multiprocessing
+from collections import OrderedDict
+import genutils as genpy
+import instrutils as instrpy
+
+# heavy modules are imported on first use (see genutils.lazyImport) so that
+# importing this script (e.g.: to embed the collation in a service) is fast
+pd = genpy.lazyImport('pandas')
+np = genpy.lazyImport('numpy')
+cachepy = genpy.lazyImport('cacheutils')
+schemapy = genpy.lazyImport('schemautils')
 
-# Create a temp directory (under the current working directory for data 
-# downloads
-CLEANUP = False
-
-cwd = os.getcwd()
-tmpdir = os.path.join(cwd,"tmp")
-
-#print tmpdir
-
-if not os.path.exists(tmpdir):
-	os.makedirs(tmpdir)	
-	CLEANUP = True	
 #
-# Removes the temp directory and its contents
+# GLOBALS
 #
-def cleanup():
-	# Cleanup the temp directory only if we created it here
-	if CLEANUP:
-		if os.path.exists(tmpdir):
-			shutil.rmtree("tmp")
-	
 
 # FIXME: Add support for downloading archives from the cloud 
 # For now, assume archives are present in current working dir
@@ -50,22 +59,20 @@ GEOID="sd"
 VER="02062017"
 EXT="zip"
 
-# data file(s)
-datafile = DATAID + "_" + GEOID + "_" + VER + "." + EXT
-datadir = os.path.join(tmpdir,DATAID)
+# year of the data to collate per DATAID (see defaultYear)
+YEARS = {"pop_forecast": 2030, "pop_estimate": 2012, "pop_census": 2010}
 
-try:
+# number of worker processes parsing the SRA specific Excel files
+WORKERS = multiprocessing.cpu_count()
 
-	zipf = ZipFile(os.path.join(cwd,datafile),'r')
-	zipf.extractall(tmpdir)
-	zipf.close()
-	print("datafile: " + datafile)
-except:
-	e = sys.exc_info()[0]
-	print("Error: Failed to extract data archive")
-	print("Error: " + str(e))
-	cleanup()
-	exit()
+# sheets of the SRA specific Excel files
+AGE_SHEET = "Age"
+RACE_SHEET = "Ethnicity"
+
+# long format store cols; all but the last are the key. Age rows hold the
+# STORE_ALL ethnicity and ethnicity rows the STORE_ALL sex and age band
+STORE_COLS = ['SRA','YEAR','SEX','AGE','ETHNICITY','POPULATION']
+STORE_ALL = 'Total'
 
 # col names to use in the collated data
 AGE_COLS = ['SRA','YEAR','TYPE','80+','70-79','60-69','50-59','40-49',
@@ -73,17 +80,33 @@ AGE_COLS = ['SRA','YEAR','TYPE','80+','70-79','60-69','50-59','40-49',
 RACE_COLS = ['Two or More','Other','Pacific Islander','Asian',
              'American Indian','Black','White','Hispanic']
 
+#
+# openWorkbook
+#
+# opens the specified Excel file (a member of archive, if specified); the
+# workbook is read (and decompressed) once and can be parsed any number of 
+# times
+#
+def openWorkbook(fname,archive=None):
+
+	if isinstance(fname,pd.ExcelFile):
+		return fname
+
+	with genpy.openDataFile(fname,archive) as f:
+		return pd.ExcelFile(f)
+
 #
 # parseRace
 #
 # Takes an SRA specific Excel file, parses it to find ethnicity data specific 
 # to desired year. Further, it converts the data into wide format (from a long 
-# one) and outputs the result in a data-frame
+# one) and outputs the result in a data-frame. fname may be an open workbook
+# (see openWorkbook); if archive is specified, fname is read from the archive
 #
-def parseRace(fname,year):
-        SHEET = "Ethnicity"
-	xl = pd.ExcelFile(fname)
-        df = xl.parse(SHEET)
+@instrpy.instrument()
+def parseRace(fname,year,archive=None):
+	xl = openWorkbook(fname,archive)
+        df = xl.parse(RACE_SHEET)
 
         sra = df.ix[0,'SRA']
 	#print("Parsing Race data for SRA: " + sra + "\n")
@@ -113,13 +136,14 @@ def parseRace(fname,year):
 #
 # Takes an SRA specific Excel file, parses it to find agre-group data specific
 # to desired year. Further, it converts the data into wide format (from a long 
-# one) and outputs the result in a data-frame
+# one) and outputs the result in a data-frame. fname may be an open workbook
+# (see openWorkbook); if archive is specified, fname is read from the archive
 #
-def parseAge(fname,year):
+@instrpy.instrument()
+def parseAge(fname,year,archive=None):
 
-	SHEET = "Age"
-	xl = pd.ExcelFile(fname)
-	df = xl.parse(SHEET)
+	xl = openWorkbook(fname,archive)
+	df = xl.parse(AGE_SHEET)
 
 	sra = df.ix[0,'SRA']
 	#print("Parsing Age data for SRA: " + sra + "\n")
@@ -148,64 +172,307 @@ def parseAge(fname,year):
 	#print newdf.head()
 	return newdf
 
+#
+# parseWorkbook
+#
+# opens an SRA specific Excel file once and parses its age (and, if withRace 
+# is set, ethnicity) data; task is a tuple of file name, year, archive and 
+# withRace. Returns the (age, race) data frames (race is None unless withRace 
+# is set)
+#
+@instrpy.instrument()
+def parseWorkbook(task):
+
+	fname, year, archive, withRace = task
+
+	xl = openWorkbook(fname,archive)
+	df_age = parseAge(xl,year)
+	df_race = parseRace(xl,year) if withRace else None
 
-# output file(s)
-OUT_CSV=DATAID + "_" + GEOID + "_" + VER + "." + 'csv'
+	return df_age, df_race
 
 #
-# Iterate through extracted files and collate data
+# parseWorkbooks
 #
+# parses the specified workbooks (see parseWorkbook) in a pool of worker 
+# processes and returns the results sorted by SRA (i.e.: independent of the 
+# order of the files in the archive and of the order the workers finish in)
+#
+def parseWorkbooks(tasks,workers=None,func=None):
+
+	if func is None:
+		func = parseWorkbook
+	if workers is None:
+		workers = WORKERS
+	workers = max(1,min(workers,len(tasks)))
+
+	if workers == 1:
+		results = [func(task) for task in tasks]
+	else:
+		pool = multiprocessing.Pool(processes=workers)
+		try:
+			results = pool.map(func,tasks)
+		finally:
+			pool.terminate()
+			pool.join()
+
+	def sra(result):
+		df = result[0] if isinstance(result,tuple) else result
+		return str(df['SRA'].iloc[0])
+
+	# (stable sort: files of the same SRA keep the archive order)
+	return sorted(results,key=sra)
+
+#
+# parseWorkbookLong
+#
+# opens an SRA specific Excel file once and returns the data of all its years
+# in long format (see STORE_COLS); task is a tuple of file name and archive
+#
+@instrpy.instrument()
+def parseWorkbookLong(task):
+
+	fname, archive = task
 
-df_full = pd.DataFrame()
-df_age_concat_list = []; df_race_concat_list = []
+	xl = openWorkbook(fname,archive)
 
-try:
-	for f in os.listdir(datadir):
-		if f.endswith(".xlsx"):
-			#print(f)
+	df = xl.parse(AGE_SHEET)
+	frames = [pd.DataFrame(OrderedDict([('SRA',df['SRA']),
+					('YEAR',df['YEAR']),('SEX',df['SEX']),
+					('AGE',df['Group - 10 Year']),('ETHNICITY',STORE_ALL),
+					('POPULATION',df['POPULATION'])]))]
 
-			# subset it to select only years we care about
-			year = 2010
-			if DATAID == "pop_forecast":
-				year = 2030
-			elif DATAID == "pop_estimate":
-				#year = 2015
-				year = 2012
-			else: #DATAID == "pop_census"
-				year = 2010
+	if RACE_SHEET in xl.sheet_names:
+		df = xl.parse(RACE_SHEET)
+		frames.append(pd.DataFrame(OrderedDict([('SRA',df['SRA']),
+					('YEAR',df['YEAR']),('SEX',STORE_ALL),('AGE',STORE_ALL),
+					('ETHNICITY',df['ETHNICITY']),
+					('POPULATION',df['POPULATION'])])))
 
-			df_age = parseAge(os.path.join(datadir,f),year)
-			#print(df_age.head())
+	return pd.concat(frames,axis=0,ignore_index=True)
 
-			df_age_concat_list.append(df_age)
+#
+# createStore
+#
+# parses all years of the specified SRA specific Excel files (members of
+# archive) into a single long format data frame (see STORE_COLS) sorted by 
+# SRA; key cols are categoricals (in the order the values appear in the Excel
+# files), YEAR is an int16 and POPULATION the smallest safe integer type
+#
+@instrpy.instrument()
+def createStore(archive,members):
+
+	results = parseWorkbooks([(f,archive) for f in members],
+							func=parseWorkbookLong)
+	store = pd.concat(results,axis=0,ignore_index=True)
+
+	for col in ['SRA','SEX','AGE','ETHNICITY']:
+		values = store[col].astype(str)
+		store[col] = pd.Categorical(values,categories=pd.unique(values))
+	store['YEAR'] = store['YEAR'].astype(np.int16)
+	store['POPULATION'] = schemapy.toCounts(store['POPULATION'])
 
-			# parse ethnicity for current year estimate
-			if DATAID == "pop_estimate":
-				df_race = parseRace(os.path.join(datadir,f),year)
-				#print(df_race.head())
-				df_race_concat_list.append(df_race)
-		else:
+	return store
+
+#
+# loadStore
+#
+# returns the long format store of the specified archive (see createStore) 
+# from the parse cache, creating (and caching) it if the archive has not been
+# parsed yet
+#
+def loadStore(archive,members,cache=None):
+
+	if cache is None:
+		cache = cachepy.ParseCache()
+
+	return cache.call(archive,createStore,archive,members)
+
+#
+# queryStore
+#
+# returns the rows of the store for the specified year(s) and SRA(s) (all if 
+# None)
+#
+def queryStore(store,year=None,sra=None):
+
+	rows = np.ones(len(store.index),bool)
+	for col, value in [('YEAR',year),('SRA',sra)]:
+		if value is None:
 			continue
-except:
-	e = sys.exc_info()[0]
-	print("Error: Failed to create data CSV")
-	print("Error: " + str(e))
-	cleanup()
-	exit()
-
-# collate the data and write it out to a CSV file
-
-if DATAID == "pop_estimate":
-	df1 = pd.concat(df_age_concat_list,axis=0)
-	df2 = pd.concat(df_race_concat_list,axis=0)
-	df_full = pd.concat([df1,df2],axis=1)
-else:
-	df_full = pd.concat(df_age_concat_list,axis=0)
+		values = value if isinstance(value,(list,tuple,set)) else [value]
+		rows &= store[col].isin(list(values)).values
+
+	return store[rows]
 
-if os.path.exists(os.path.join(cwd,OUT_CSV)):
-	os.remove(os.path.join(cwd,OUT_CSV))
+#
+# toWide
+#
+# reshapes the data of the specified year in the store into the collated 
+# (wide) format, i.e.: a Male, Female and Total row per SRA with a col per age
+# band (see AGE_COLS) and, if withRace is set, per ethnicity (see RACE_COLS;
+# totals only)
+#
+def toWide(store,year,withRace=False):
+
+	df = queryStore(store,year)
+	df = pd.DataFrame({col: df[col].astype(str) if col != 'POPULATION' 
+					else df[col] for col in STORE_COLS})[STORE_COLS]
+	sras = sorted(pd.unique(df['SRA']))
+
+	# age bands in the order of the Excel files
+	bands = [age for age in store['AGE'].cat.categories if age != STORE_ALL]
+	ages = df[(df['ETHNICITY'] == STORE_ALL) & (df['SEX'] != STORE_ALL)]
+	ages = ages.set_index(['SEX','SRA','AGE'])['POPULATION'].unstack('AGE')
+	ages = ages.reindex(columns=bands)
+
+	frames = []
+	for sex in ['Male','Female']:
+		frames.append(ages.loc[sex].reindex(sras).values)
+	frames.append(frames[0] + frames[1])
+
+	data = np.stack(frames,axis=1).reshape(len(sras) * 3,len(bands))
+	wide = pd.DataFrame(columns=AGE_COLS[3:],data=data)
+	wide.insert(0,'TYPE',['Male','Female','Total'] * len(sras))
+	wide.insert(0,'YEAR',year)
+	wide.insert(0,'SRA',np.repeat(sras,3))
+
+	if withRace:
+		groups = [eth for eth in store['ETHNICITY'].cat.categories 
+				if eth != STORE_ALL]
+		races = df[df['ETHNICITY'] != STORE_ALL]
+		races = races.set_index(['SRA','ETHNICITY'])['POPULATION'].unstack(
+							'ETHNICITY').reindex(index=sras,columns=groups)
+		data = np.zeros((len(sras) * 3,len(groups)),races.values.dtype)
+		data[2::3] = races.values
+		wide = pd.concat([wide,pd.DataFrame(columns=RACE_COLS,data=data)],
+						axis=1)
+
+	return wide
 
-df_full.to_csv(OUT_CSV, index=False)
-print("output: " + OUT_CSV) 
+#
+# archiveName
+#
+# returns the file name of the SANDAG archive with the specified data ID and 
+# version, e.g.: pop_estimate_sd_02062017.zip
+#
+def archiveName(dataid=DATAID,ver=VER,geoid=GEOID):
+	return dataid + "_" + geoid + "_" + ver + "." + EXT
 
-cleanup()
+#
+# findWorkbooks
+#
+# returns the SRA specific Excel files in the specified archive (members under
+# <dataid>/)
+#
+@instrpy.instrument('demographics.extract')
+def findWorkbooks(archive,dataid=DATAID):
+	return genpy.findZipMembers(archive,".xlsx",dataid + "/")
+
+#
+# defaultYear
+#
+# returns the year of the data collated for the specified data ID (ethnicity
+# is collated for the current year estimate only)
+#
+def defaultYear(dataid):
+	return YEARS.get(dataid,YEARS["pop_census"])
+
+#
+# collate
+#
+# parses the SRA specific Excel files in the specified archive (in parallel) 
+# and returns the data of the specified year (defaults to that of dataid) in 
+# the collated (wide) format; ethnicity is included for the population 
+# estimates. If store is set, all years are parsed into the (cached) long 
+# format store and the data is reshaped from it (see loadStore)
+#
+def collate(archive,dataid=DATAID,year=None,store=False,workers=None,
+			members=None):
+
+	if members is None:
+		members = findWorkbooks(archive,dataid)
+	if year is None:
+		year = defaultYear(dataid)
+	withRace = dataid == "pop_estimate"
+
+	if store:
+		return toWide(loadStore(archive,members),year,withRace)
+
+	results = parseWorkbooks([(f,year,archive,withRace) for f in members],
+							workers)
+
+	df_full = pd.concat([df_age for df_age, df_race in results],axis=0)
+	if withRace:
+		df_race = pd.concat([df_race for df_age, df_race in results],axis=0)
+		df_full = pd.concat([df_full,df_race],axis=1)
+
+	return df_full
+
+################################################################################
+#
+# main
+#
+def main():
+
+	parser = argparse.ArgumentParser(description="Collate SANDAG " +
+				"demographics data per SRA")
+	parser.add_argument('args',nargs='*',metavar='DATAID VER [OUT_CSV]')
+	parser.add_argument('--store',action='store_true',
+				help="parse all years into a (cached) long format store")
+	parser.add_argument('--year',type=int,default=None,
+				help="year to output (store mode)")
+	parser.add_argument('--long',default=None,metavar='LONG_CSV',
+				help="write the long format store to LONG_CSV (store mode)")
+	args = parser.parse_args()
+
+	dataid = DATAID; ver = VER
+	if len(args.args) > 1:
+		dataid = args.args[0]
+		ver = args.args[1]
+
+	# data file(s)
+	datafile = archiveName(dataid,ver)
+	archive = os.path.join(os.getcwd(),datafile)
+
+	# output file(s)
+	outfile = dataid + "_" + GEOID + "_" + ver + "." + 'csv'
+	if len(args.args) > 2:
+		outfile = args.args[2]
+
+	try:
+		members = findWorkbooks(archive,dataid)
+		print("datafile: " + datafile)
+	except:
+		e = sys.exc_info()[0]
+		print("Error: Failed to read data archive")
+		print("Error: " + str(e))
+		exit(1)
+
+	try:
+		if args.store and args.long is not None:
+			loadStore(archive,members).to_csv(args.long,index=False)
+			print("output: " + args.long)
+		df_full = collate(archive,dataid,args.year,args.store,
+						members=members)
+	except:
+		e = sys.exc_info()[0]
+		print("Error: Failed to create data CSV")
+		print("Error: " + str(e))
+		exit(1)
+
+	# write the collated data out to a CSV file
+	with instrpy.stage('demographics.collate') as stage:
+		if os.path.exists(outfile):
+			os.remove(outfile)
+
+		df_full.to_csv(outfile, index=False)
+		stage.rows_out = len(df_full.index)
+	print("output: " + outfile)
+# end: main
+
+if __name__ == "__main__":
+	main()
+else:
+	# do nothing
+	pass
@@ -9,10 +9,65 @@
 import os
 import sys
 import re
+import shutil
+import resource
+import tempfile
+import importlib
+from zipfile import ZipFile
+from contextlib import contextmanager
+
+#
+# LazyModule
+#
+# stand-in for a module that is imported on first use (i.e.: the first time
+# one of its attributes is accessed), so that importing a script does not pay
+# for heavy imports (pandas, numpy etc.) it may never use
+#
+class LazyModule(object):
+
+	def __init__(self,name):
+		self.__dict__['_name'] = name
+		self.__dict__['_module'] = None
+
+	def _load(self):
+		if self._module is None:
+			self.__dict__['_module'] = importlib.import_module(self._name)
+		return self._module
+
+	def __getattr__(self,attr):
+		return getattr(self._load(),attr)
+
+	def __repr__(self):
+		return "<lazy module '" + self._name + "'>"
+
+#
+# lazyImport
+#
+# returns the specified module if it has already been imported and a 
+# LazyModule for it otherwise
+#
+def lazyImport(name):
+
+	if name in sys.modules:
+		return sys.modules[name]
+
+	return LazyModule(name)
+
+np = lazyImport('numpy')
+pd = lazyImport('pandas')
 
 # current working directory
 CWD = os.getcwd()
 
+# annotations used (e.g.: by ACS) in place of values that are missing or not
+# applicable
+NUMERIC_NA = ['','-','(X)','N','**','***','*****','nan']
+
+# numbers with optional annotations, e.g.: "1,234", "<5" (suppressed count), 
+# "250,000+" and "2,500-" (top and bottom coded ACS medians)
+NUMERIC_REGEX = r'^(?P<prefix>[<>]?)(?P<number>[-+]?(?:\d+\.?\d*|\.\d+))' + \
+				r'(?P<suffix>[-+]?)$'
+
 #
 # to_stringnum
 #
@@ -40,3 +95,138 @@ def to_stringnum(targetString,errors='raise'):
 			pass
 
 	return '0' if result == '' else result			
+
+#
+# cleanNumeric
+#
+# converts the specified values (a col of numbers as parsed from a data file)
+# to numbers using vectorized string operations; returns (values, mask) where
+# values is a float array and mask flags the cells whose value is imputed:
+#
+# "1,234"              -> 1234
+# "250,000+", ">100"   -> 250000, 100 (top coded; imputed)
+# "2,500-"             -> 2500 (bottom coded; imputed)
+# "<5"                 -> 2.5, the midpoint of [0,5) (suppressed; imputed), or
+#                         NaN if suppressed is None
+# "-", "(X)", "" etc.  -> NaN (see NUMERIC_NA; not imputed)
+#
+# values that cannot be parsed are NaN (and not flagged) if errors is 'coerce'
+# and raise a ValueError otherwise
+#
+def cleanNumeric(values,suppressed='midpoint',errors='coerce'):
+
+	values = pd.Series(values)
+	if values.dtype.name == 'category':
+		# clean the distinct values only
+		result, mask = cleanNumeric(values.cat.categories.values.astype(object),
+									suppressed,errors)
+		codes = values.cat.codes.values
+		return np.append(result,np.nan)[codes], np.append(mask,False)[codes]
+
+	if values.dtype != object:
+		return values.values.astype(np.float64), np.zeros(len(values),bool)
+
+	text = values.astype(str).str.strip().str.replace(",","")
+	parts = text.str.extract(NUMERIC_REGEX,expand=True)
+
+	result = parts['number'].astype(np.float64).values
+	lower = (parts['prefix'] == '<').values
+	mask = lower | (parts['prefix'] == '>').values | \
+			parts['suffix'].fillna('').str.len().values.astype(bool)
+
+	if suppressed == 'midpoint':
+		result[lower] = result[lower] / 2.0
+	else:
+		result[lower] = np.nan
+
+	invalid = np.isnan(result) & ~lower & ~text.isin(NUMERIC_NA).values
+	if errors != 'coerce' and invalid.any():
+		raise ValueError("non-numeric values: " + 
+						", ".join(sorted(set(text[invalid]))))
+
+	return result, mask
+
+#
+# findZipMembers
+#
+# returns the names of the members of the specified zip archive that start 
+# with prefix (e.g.: a directory) and end with suffix, in archive order
+#
+def findZipMembers(archive,suffix='',prefix=''):
+
+	with ZipFile(archive,'r') as zipf:
+		return [name for name in zipf.namelist() 
+				if name.startswith(prefix) and name.endswith(suffix)]
+
+#
+# openDataFile
+#
+# context manager for reading the specified data file with pandas; yields the
+# file name as is or, if archive is specified, the archive member of that name
+# as a stream (i.e.: nothing is extracted to disk)
+#
+@contextmanager
+def openDataFile(datafile,archive=None):
+
+	if archive is None:
+		yield datafile
+		return
+
+	with ZipFile(archive,'r') as zipf:
+		f = zipf.open(datafile)
+		try:
+			yield f
+		finally:
+			f.close()
+
+#
+# scratchDir
+#
+# context manager for a scratch directory private to the caller; yields the 
+# path of a newly created, uniquely named directory (under parent, defaults to
+# the system temp directory) that is removed with all its contents when the 
+# with block exits, whether or not it raised
+#
+@contextmanager
+def scratchDir(prefix='afc_',parent=None):
+
+	path = tempfile.mkdtemp(prefix=prefix,dir=parent)
+	try:
+		yield path
+	finally:
+		shutil.rmtree(path,ignore_errors=True)
+
+#
+# publishFiles
+#
+# moves the specified files from the scratch directory to outdir and returns
+# their new paths; each file is replaced atomically (i.e.: readers see either
+# the previous or the complete new version) provided the scratch directory is
+# on the same file system as outdir (e.g.: created under it)
+#
+def publishFiles(scratch,fnames,outdir):
+
+	outputs = []
+	for fname in fnames:
+		outfile = os.path.join(outdir,fname)
+		os.rename(os.path.join(scratch,fname),outfile)
+		outputs.append(outfile)
+
+	return outputs
+
+#
+# peakRSS
+#
+# returns the peak resident set size (in MB) of the current process or, if 
+# children is set, of the largest of its terminated (and waited for) child 
+# processes
+#
+def peakRSS(children=False):
+
+	who = resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF
+	maxrss = resource.getrusage(who).ru_maxrss
+
+	# ru_maxrss is in bytes on OS X and in kilobytes elsewhere
+	if sys.platform == 'darwin':
+		return maxrss / (1024.0 * 1024.0)
+	return maxrss / 1024.0
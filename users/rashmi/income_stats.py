@@ -6,7 +6,10 @@
 #
 # Script to extract income information specific to individuals 55 and older from  
 # the ACS archive containing it and to output the same on a per SRA and zipcode
-# basis for the SD county 
+# basis for the SD county. Besides the low income (under 200% of the poverty
+# level) counts, the counts under every income to poverty level ratio 
+# threshold (.50, .75, ..., 2.00, ..., 5.00) are output per zipcode and SRA and
+# rolled up per SRA, region and county
 # 
 # Dependencies:
 #
@@ -14,19 +17,39 @@
 #
 # Usage:
 #
-# python income_stats.py
+# python income_stats.py [VERSION]
+# python income_stats.py --batch DIR [--geoids GEO=FILE ...] [--workers N]
+#
+# VERSION defaults to 2015 and selects the ACS archive (aff_B17024_sd_county_
+# <VERSION>.zip) to extract data from; the metadata and data files are read
+# directly from the archive
+#
+# In batch mode, all archives in DIR (aff_B17024_<GEO>_<VERSION>.zip, i.e.: 
+# any number of years and geographies) are processed in a pool of worker 
+# processes and written to a single CSV file per output, with Geography and 
+# Year cols identifying each partition. The geoID data file of a geography 
+# defaults to <GEO>_sra_zip_zcta.txt
+#
+# Importing the script has no side effects; loadIncomeData(archive) returns 
+# the extracted data as data frames (nothing is written)
 #
 
 import sys
 import os
-import shutil
 import re
-import pandas as pd 
-import numpy as np 
 import pprint
-from zipfile import ZipFile
+import argparse
+import multiprocessing
 from collections import defaultdict, OrderedDict
-import sdpyutils as sdpy  
+import genutils as genpy
+import instrutils as instrpy
+
+# heavy modules are imported on first use (see genutils.lazyImport) so that
+# importing this script (e.g.: to embed the extraction in a service) is fast
+pd = genpy.lazyImport('pandas')
+np = genpy.lazyImport('numpy')
+acspy = genpy.lazyImport('acsutils')
+sdpy = genpy.lazyImport('sdpyutils')
 
 #
 # GLOBALS 
@@ -34,34 +57,78 @@ import sdpyutils as sdpy
 
 # current working directory
 CWD = os.getcwd()
-TMPDIR = os.path.join(CWD,"tmp")
 
 # data file(s)
 VERSION = "2015"
 DATAZIP = "aff_B17024_sd_county_" + VERSION + ".zip"
 
+# data files of the batch mode: aff_B17024_<geography>_<version>.zip archives
+# and the geoID data file of each geography
+ARCHIVE_PATTERN = re.compile(r'^aff_B17024_(.+)_(\d{4})\.zip$')
+GEOIDS_PATTERN = "{geo}_sra_zip_zcta.txt"
+
+# lower bound of the age groups to extract income estimates for
+MIN_AGE = 55
+
+# income to poverty level ratio under which individuals are low income (i.e.:
+# 200% of the federal poverty level)
+LOW_INCOME_THRESHOLD = 2.0
+
+# county name of the county level rollups (SD county archives)
+ROLLUP_COUNTY = 'San Diego'
+
 # output file(s)
 OUT_CSV1 = "B17024_estimates_sd_county_55_over_" + VERSION + ".csv"
 OUT_CSV2 = "low_income_data_sd_county_" + VERSION + ".csv"
+OUT_CSV3 = "poverty_thresholds_sd_county_55_over_" + VERSION + ".csv"
+OUT_CSV4 = "poverty_thresholds_rollups_sd_county_55_over_" + VERSION + ".csv"
+
+# output file(s) of the batch mode and their partition cols
+OUT_BATCH_CSV1 = "B17024_estimates_55_over.csv"
+OUT_BATCH_CSV2 = "low_income_data.csv"
+OUT_BATCH_CSV3 = "poverty_thresholds_55_over.csv"
+OUT_BATCH_CSV4 = "poverty_thresholds_rollups_55_over.csv"
+OUT_COL_Geography = 'Geography'
+OUT_COL_Year = 'Year'
+
+#
+# outputNames
+#
+# returns the names of the output files (see OUT_CSV{1,2,3,4}) for the 
+# specified geography and version
+#
+def outputNames(geo,version):
+
+	return ["B17024_estimates_" + geo + "_55_over_" + version + ".csv",
+			"low_income_data_" + geo + "_" + version + ".csv",
+			"poverty_thresholds_" + geo + "_55_over_" + version + ".csv",
+			"poverty_thresholds_rollups_" + geo + "_55_over_" + version + 
+			".csv"]
 
 #
-# Removes the temp directory and its contents
+# setVersion
 #
-def cleanup(doCleanup):
-	# Cleanup the temp directory only if we created it here
-	if doCleanup:
-		if os.path.exists(TMPDIR):
-			shutil.rmtree("tmp")
-			doCleanup = False
+# sets the version (year) of the ACS archive to process and the corresponding
+# output file names
+#
+def setVersion(version):
+	global VERSION, DATAZIP, OUT_CSV1, OUT_CSV2, OUT_CSV3, OUT_CSV4
+
+	VERSION = version
+	DATAZIP = "aff_B17024_sd_county_" + VERSION + ".zip"
+	OUT_CSV1, OUT_CSV2, OUT_CSV3, OUT_CSV4 = outputNames('sd_county',VERSION)
+
 #
 # processMetaData
 #
-# extracts information from the specified metadata file and returns it as a 
-# data frame
+# extracts information from the specified metadata file (a member of archive,
+# if specified) and returns it as a data frame
 # 
-def processMetaData(metafile):
+@instrpy.instrument()
+def processMetaData(metafile,archive=None):
 
-	csvdata = pd.read_csv(metafile,header=None)
+	with genpy.openDataFile(metafile,archive) as f:
+		csvdata = pd.read_csv(f,header=None)
 	#print csvdata
 	print("parsing file: " + metafile)
 
@@ -70,8 +137,8 @@ def processMetaData(metafile):
 #
 # modifyDataLabels
 #
-# function to modify data lables for the specified target using values in 
-# dict_fields
+# function to modify data lables for the specified target using the table 
+# schema compiled from df_fields (see acsutils)
 # 
 # Returns:
 #     ratio_dict - dictionary of modified labels grouped by ratio range
@@ -81,44 +148,24 @@ def processMetaData(metafile):
 #
 def modifyDataLabels(targetLabels, df_fields):
 
-	# convert to dictionary for easier lookup
-	dict_fields = df_fields.set_index(0).T.to_dict('list')
-
-	# generate the regex instance for the specified pattern
-	prefix = " - "
-	regex = re.compile('(.*); (.*) years(.*):(.*)')
+	schema = acspy.compileSchema(df_fields).frame
 
-	# generate replacement labels for targeted labels using metadata
-	# in df_fields
+	# generate replacement labels for targeted labels using the schema
 	modifiedLabels = []
 
 	# FIX ME: need an ordered defualt dict; for now use ordered dict only
 	ratio_dict = OrderedDict(); age_dict = OrderedDict()
 
 	for name in targetLabels[1:]:
-		if name in dict_fields:
-			m = regex.match(dict_fields[name][0])
-			
-			ratioTag = ""; ageTag = ""
-			if m.group(4).startswith(prefix):
-				ratioTag = m.group(4)[len(prefix):]
-			else:
-				ratioTag = "Total"
+		if name in schema.index:
+			ratioTag = schema.at[name,'ratio']
+			ageTag = schema.at[name,'age']
 
-			ageTag = m.group(2) + m.group(3) 
-			
 			label = ratioTag + " (" + ageTag + ")"
 			#print (name + ": " + label)
 			
-			if ageTag in age_dict:
-				age_dict[ageTag].append(label)
-			else:
-				age_dict[ageTag] = [label]
-
-			if ratioTag in ratio_dict:
-				ratio_dict[ratioTag].append(label)
-			else:
-				ratio_dict[ratioTag] = [label]	
+			age_dict.setdefault(ageTag,[]).append(label)
+			ratio_dict.setdefault(ratioTag,[]).append(label)
 
 			modifiedLabels.append(label)
 		else:
@@ -127,108 +174,145 @@ def modifyDataLabels(targetLabels, df_fields):
 	return ratio_dict, age_dict, modifiedLabels		
 
 #
-# addSRAaggregates
+# computeRatioThresholds
 #
-# aggregates per zipcode/ZCTA data and populates the unique entry per SRA  with
-# the aggreagated values (in the specified data frame) and returns the modified
-# data frame
+# computes the population below every income to poverty level ratio threshold
+# for each age group in a single pass: the ratio bands of all age groups are
+# arranged as a (rows x age groups x bands) array and summed cumulatively over
+# the bands (ordered by ratio). The thresholds are the lower bounds of the
+# bands (e.g.: .50, 1.00, 1.85, 2.00, 5.00)
 # 
-# Note: this requires that data be in a specific format (see df_geoids dataframe)
-#       
-def addSRAaggregates(df,targetCols):
-	
-	for name, group in df.groupby('SRA'):
-			idx = group.last_valid_index()
-			#print df.loc[[idx]]
+# Returns:
+#     ages - age groups
+# thresholds - ratio thresholds
+#   counts - (rows x age groups x thresholds) array of population counts
+#
+def computeRatioThresholds(df_incomes,ratio_dict,age_dict):
 
-			for col in targetCols:
-				df.set_value(idx,col,group[col].sum())
+	ages = list(age_dict.keys())
+	bands = sorted([ratio for ratio in ratio_dict 
+					if ratio != acspy.RATIO_TOTAL],key=acspy.parseRatio)
 
-	return df			
+	# ratio bands missing for an age group count as 0
+	labels = [band + " (" + age + ")" for age in ages for band in bands]
+	values = df_incomes.reindex(columns=labels).fillna(0).values
+	values = values.reshape(len(df_incomes.index),len(ages),len(bands))
+
+	# the sum up to band i is the population below the lower bound of band i+1
+	counts = np.cumsum(values,axis=2)[:,:,:-1]
+	thresholds = [acspy.parseRatio(band) for band in bands[1:]]
+
+	return ages, thresholds, counts
 
 #
 # computeLowIncomeData
 # 
-# aggregates data for all ratios below 2.00 for all age groups and returns
-# the result in a new data frame
+# aggregates data for all ratios below LOW_INCOME_THRESHOLD (2.00) for all
+# age groups and returns the result in a new data frame
 #
+@instrpy.instrument()
 def computeLowIncomeData(df_incomes,df_geoids,ratio_dict,age_dict):
 
-	# low income is defined as 200% (or below) of the federal poverty level
-	# i.e.: the income to poverty level ratio under 2.0
-	LOW_INCOME_RATIO_TRESH = "1.85 to 1.99"
-	geoCols = df_geoids.columns.tolist()
+	ages, thresholds, counts = computeRatioThresholds(df_incomes,ratio_dict,
+										age_dict)
+	cols = [age_group + " (Low Income)" for age_group in ages]
 
-	df = df_incomes.iloc[:,len(geoCols):]
-	df = df_incomes.reset_index(drop=True)
-
-	df_sum_list = []
-	cols = []
-	
-	for age_group, colnames in age_dict.iteritems():
-		#print(str(age_group) + ": " + str(colnames))
-
-		try:
-			idx = [i for i, s in enumerate(colnames) if LOW_INCOME_RATIO_TRESH in s]
-			df_sum = df[colnames[1:(idx[0]+1)]].sum(axis=1)
-			df_sum_list.append(df_sum)
-		except Exception, e:
-			df_sum = pd.DataFrame(columns=[age_group],
-						data=np.zeros(shape=(len(df_geoids.index),1)))
-			df_sum_list.append(df_sum)
-		
-		cols.append(age_group + " (Low Income)")
-
-	df1 = pd.concat(df_sum_list,axis=1)
-	df1.columns = cols
+	if LOW_INCOME_THRESHOLD in thresholds:
+		data = counts[:,:,thresholds.index(LOW_INCOME_THRESHOLD)]
+	else:
+		data = np.zeros(shape=(len(df_incomes.index),len(ages)))
+	df1 = pd.DataFrame(columns=cols,data=data)
 
 	df1["55 and Over (Low Income)"] = df1[cols].sum(axis=1)
 	df1["65 and Over (Low Income)"] = df1[cols[1:]].sum(axis=1)
 
 	li_df = pd.concat([df_geoids,df1],axis=1)
-	li_df = addSRAaggregates(li_df,df1.columns.tolist())
+	li_df = sdpy.addSRAaggregates(li_df,df1.columns.tolist())
 	
 	#print li_df
 	return li_df
 
 #
-# processData
+# computeThresholdData
+#
+# computes the population below every income to poverty level ratio threshold
+# (see computeRatioThresholds) for all age groups (as well as 55 and over and
+# 65 and over) and returns the result in a new data frame with a col per
+# threshold and age group, e.g.: "55 to 64 (Below 1.00)"
+#
+@instrpy.instrument()
+def computeThresholdData(df_incomes,df_geoids,ratio_dict,age_dict):
+
+	ages, thresholds, counts = computeRatioThresholds(df_incomes,ratio_dict,
+										age_dict)
+	ages = ages + ["55 and Over","65 and Over"]
+
+	# (rows x age groups x thresholds) -> (rows x thresholds x age groups)
+	counts = np.concatenate([counts,counts.sum(axis=1)[:,None,:],
+					counts[:,1:,:].sum(axis=1)[:,None,:]],axis=1)
+	data = counts.transpose(0,2,1).reshape(len(df_incomes.index),-1)
+	cols = [age_group + " (Below %.2f)" % threshold 
+			for threshold in thresholds for age_group in ages]
+
+	th_df = pd.concat([df_geoids,pd.DataFrame(columns=cols,data=data)],axis=1)
+	th_df = sdpy.addSRAaggregates(th_df,cols)
+
+	return th_df
+
+#
+# computeThresholdRollups
+#
+# rolls the threshold data (see computeThresholdData) up to the SRA, region
+# and county level (see sdpyutils.computeRollups)
 #
-# extracts relevant information from the specified data file and carries out
-# transformations to generate income data for age groups 55 and over as well
-# for low income individuals 55 and over on a per ZCTA basis
+def computeThresholdRollups(th_df,county):
+
+	geoCols = [sdpy.OUT_COL_SRA,sdpy.OUT_COL_Region,sdpy.OUT_COL_Zipcode,
+				sdpy.OUT_COL_ZCTA]
+	cols = [col for col in th_df.columns if col not in geoCols]
+
+	return sdpy.computeRollups(th_df,cols,county=county)
+
+#
+# extractData
+#
+# extracts relevant information from the specified data file (a member of
+# archive, if specified) and carries out transformations to generate income 
+# data for age groups 55 and over as well for low income individuals 55 and 
+# over on a per ZCTA basis, for the geography of the specified geoID data file
+# (defaults to SD county)
 # 
-# results are written to CSV files specified by OUT_CSV{1,2}
+# Returns:
+#     out_df - income estimates for age groups 55 and over
+#      li_df - low income population counts
+#      th_df - population counts below each ratio threshold
 #
-def processData(df_fields,datafile):
+def extractData(df_fields,datafile,archive=None,geoid_datafile=None):
 
-	# index of GEO.id2 which contains ZCTA as numbers
-    COL_ZCTA_IDX = 1
+	# GEO.id2 contains ZCTA as numbers
     COL_ZCTA = 'GEO.id2'
-    # this is the first field that holds income info for 55+ age groups
-    START_COL = 'HD01_VD93'
-
-    # extract only data for income estimates for 55 and over categories
-    startIndex = df_fields[df_fields[0] == START_COL].index.tolist()[0]
-    endIndex = len(df_fields) - 1
-    # print("si: " + str(startIndex) + " ei: " + str(endIndex))
 
-    l = df_fields[0].tolist()
-    # we skip over cols that contain margins of error (i.e.: every other col)
-    cols = [l[COL_ZCTA_IDX]] + l[startIndex:endIndex:2]
+    # extract only data for income estimates for 55 and over categories (margins
+    # of error are skipped)
+    schema = acspy.compileSchema(df_fields)
+    cols = [COL_ZCTA] + schema.select(kind=acspy.KIND_ESTIMATE,
+                                      age_min=lambda age: age >= MIN_AGE)
 
-    csvdata = pd.read_csv(datafile,skipinitialspace=True,usecols=cols)
+    with genpy.openDataFile(datafile,archive) as f:
+        csvdata = pd.read_csv(f,skipinitialspace=True,usecols=cols)
     #print csvdata.head()
     print("parsing data file: " + datafile)
         
-    df_geoids = sdpy.createGeoidsData()
+    df_geoids = sdpy.createGeoidsData(geoid_datafile)
     geoCols = df_geoids.columns.tolist()
 
     # add single level col headers with age and ratio tags
     ratio_dict, age_dict, modifiedCols = modifyDataLabels(cols,df_fields)
 
     out_df = pd.merge(left=df_geoids,right=csvdata[1:],left_on='ZCTA',
-    				right_on=COL_ZCTA,how='left').fillna(0)
+    				right_on=COL_ZCTA,how='left')
+    # (only the merged cols are filled; geoID cols are categoricals)
+    out_df = out_df.fillna(dict.fromkeys(csvdata.columns,0))
     out_df.drop(COL_ZCTA,axis=1,inplace=True)
     out_df.columns = geoCols + modifiedCols
     
@@ -237,58 +321,228 @@ def processData(df_fields,datafile):
     out_df.columns = geoCols + modifiedCols
 
     li_df = computeLowIncomeData(tmp_df,df_geoids,ratio_dict,age_dict)
+    th_df = computeThresholdData(tmp_df,df_geoids,ratio_dict,age_dict)
+
+    out_df = sdpy.addSRAaggregates(out_df,modifiedCols)
+
+    return out_df, li_df, th_df
+
+#
+# processData
+#
+# extracts income data from the specified data file (see extractData)
+# 
+# results are written to CSV files specified by OUT_CSV{1,2,3,4}
+#
+@instrpy.instrument()
+def processData(df_fields,datafile,archive=None):
+
+    out_df, li_df, th_df = extractData(df_fields,datafile,archive)
 
     #print li_df.head()
     li_df.to_csv(OUT_CSV2, index=False)
     print("output: " + OUT_CSV2)
-
-    out_df = addSRAaggregates(out_df,modifiedCols)
     
     #print out_df.head()
     out_df.to_csv(OUT_CSV1, index=False)
     print("output: " + OUT_CSV1)
-    
+
+    th_df.to_csv(OUT_CSV3, index=False)
+    print("output: " + OUT_CSV3)
+
+    computeThresholdRollups(th_df,ROLLUP_COUNTY).to_csv(OUT_CSV4, index=False)
+    print("output: " + OUT_CSV4)
+
+#
+# findArchives
+#
+# returns the ACS B17024 archives in the specified directory as a list of 
+# (geography, version, archive) tuples, sorted by geography and version
+#
+def findArchives(datadir):
+
+	archives = []
+	for fname in os.listdir(datadir):
+		m = ARCHIVE_PATTERN.match(fname)
+		if m:
+			archives.append((m.group(1),m.group(2),
+							os.path.join(datadir,fname)))
+
+	return sorted(archives)
+
+#
+# findGeoids
+#
+# returns the geoID data file for the specified geography; either the one
+# specified in geoids (geography -> file) or <geography>_sra_zip_zcta.txt in 
+# the current working directory or datadir (None if there is none)
+#
+def findGeoids(geo,datadir,geoids=None):
+
+	if geoids and geo in geoids:
+		return geoids[geo]
+
+	for d in [CWD,datadir]:
+		geoid_datafile = os.path.join(d,GEOIDS_PATTERN.format(geo=geo))
+		if os.path.exists(geoid_datafile):
+			return geoid_datafile
+
+	return None
+
+#
+# readArchive
+#
+# returns the (metadata file, data file, metadata) of the specified archive
+#
+def readArchive(archive):
+
+	metadataFile = genpy.findZipMembers(archive,"metadata.csv")[0]
+	dataFile = genpy.findZipMembers(archive,"ann.csv")[0]
+
+	return metadataFile, dataFile, processMetaData(metadataFile,archive)
+
+#
+# loadIncomeData
+#
+# extracts income data from the specified ACS B17024 archive (see extractData)
+# for the geography of the specified geoID data file (defaults to SD county) 
+# without writing any files
+#
+# Returns:
+#     out_df - income estimates for age groups 55 and over
+#      li_df - low income population counts
+#      th_df - population counts below each ratio threshold
+#    rollups - th_df rolled up per SRA, region and county
+#
+def loadIncomeData(archive,geoid_datafile=None,county=ROLLUP_COUNTY):
+
+	metadataFile, dataFile, df_fields = readArchive(archive)
+	out_df, li_df, th_df = extractData(df_fields,dataFile,archive,
+								geoid_datafile)
+
+	return out_df, li_df, th_df, computeThresholdRollups(th_df,county)
+
+#
+# processArchive
+#
+# extracts income data from an archive (see extractData); task is a tuple of 
+# geography, version, archive, geoID data file, data file and metadata. Run by
+# the workers of the batch mode (see processBatch); returns the data with the
+# geography and version as partition cols
+#
+@instrpy.instrument()
+def processArchive(task):
+
+	geo, version, archive, geoid_datafile, dataFile, df_fields = task
+
+	out_df, li_df, th_df = extractData(df_fields,dataFile,archive,
+								geoid_datafile)
+	dfs = [out_df,li_df,th_df,computeThresholdRollups(th_df,geo)]
+
+	partition = [(OUT_COL_Geography,geo),(OUT_COL_Year,version)]
+	for df in dfs:
+		for pos, (col, value) in enumerate(partition):
+			df.insert(pos,col,value)
+
+	return dfs
+
+#
+# processBatch
+#
+# extracts income data from all ACS B17024 archives in the specified directory
+# (all years and geographies) in a pool of workers and writes them to a single
+# CSV file per output (see OUT_BATCH_CSV{1,2,3,4}), partitioned by geography and
+# year (in that order)
+#
+# The table schemas and the geo crosswalks are compiled before the workers 
+# are started so that all workers share them rather than compile their own
+#
+def processBatch(datadir,geoids=None,workers=None,outdir=None):
+
+	tasks = []
+	for geo, version, archive in findArchives(datadir):
+		geoid_datafile = findGeoids(geo,datadir,geoids)
+		if geoid_datafile is None:
+			print("Warning: no geoID data file for " + geo + "; skipping " +
+				archive)
+			continue
+		metadataFile, dataFile, df_fields = readArchive(archive)
+		acspy.compileSchema(df_fields)
+		sdpy.getCrosswalk(geoid_datafile)
+		tasks.append((geo,version,archive,geoid_datafile,dataFile,df_fields))
+
+	if not tasks:
+		print("Error: no ACS archives found in " + datadir)
+		return None
+
+	if workers is None:
+		workers = multiprocessing.cpu_count()
+	workers = max(1,min(workers,len(tasks)))
+
+	if workers == 1:
+		results = [processArchive(task) for task in tasks]
+	else:
+		pool = multiprocessing.Pool(processes=workers)
+		try:
+			results = pool.map(processArchive,tasks)
+		finally:
+			pool.terminate()
+			pool.join()
+
+	if outdir is None:
+		outdir = CWD
+
+	outputs = []
+	for i, fname in enumerate([OUT_BATCH_CSV1,OUT_BATCH_CSV2,OUT_BATCH_CSV3,
+							OUT_BATCH_CSV4]):
+		outfile = os.path.join(outdir,fname)
+		pd.concat([result[i] for result in results],axis=0,
+				sort=False).to_csv(outfile,index=False)
+		print("output: " + outfile)
+		outputs.append(outfile)
+
+	return outputs
+	
 ################################################################################
 # 
 # main
 #
 def main():
 
-	# indicates whether to cleanup before exiting the script
-	doCleanup = False
-	metadataFile = '';	dataFile = ''
-
-	if not os.path.exists(TMPDIR):
-		os.makedirs(TMPDIR)	
-		doCleanup = True	
-
-	# unzip the archive
+	parser = argparse.ArgumentParser(description="Extract income data for " +
+				"individuals 55 and older from ACS B17024 archives")
+	parser.add_argument('version',nargs='?',default=VERSION,
+				help="version (year) of the SD county archive to process")
+	parser.add_argument('--batch',default=None,metavar='DIR',
+				help="process all archives in DIR (all years and geographies)")
+	parser.add_argument('--geoids',action='append',default=[],
+				metavar='GEO=FILE',help="geoID data file for a geography " +
+				"(batch mode; may be repeated)")
+	parser.add_argument('--workers',type=int,default=None,
+				help="number of worker processes (batch mode)")
+	args = parser.parse_args()
+
+	if args.batch is not None:
+		geoids = dict(arg.split("=",1) for arg in args.geoids)
+		if processBatch(args.batch,geoids,args.workers) is None:
+			exit(1)
+		return
+
+	setVersion(args.version)
+
+	# read the metadata and data files directly from the archive
 	try:
-		zipf = ZipFile(os.path.join(CWD,DATAZIP),'r')
-		zipf.extractall(TMPDIR)
-		zipf.close()
-
-		for file in os.listdir(TMPDIR):
-			if file.endswith("metadata.csv"):
-				metadataFile = file
-			elif file.endswith("ann.csv"):
-				dataFile = file
-			else:
-				continue 
+		archive = os.path.join(CWD,DATAZIP)
+		metadataFile, dataFile, df_fields = readArchive(archive)
 		#print("metadata file: " + metadataFile + " data file: " + dataFile)
 
-		df_fields = processMetaData(os.path.join(TMPDIR,metadataFile))
-
-		processData(df_fields, os.path.join(TMPDIR,dataFile))
+		processData(df_fields,dataFile,archive)
 
 	except:
 		e = sys.exc_info()[0]
-		print("Error: Failed to extract data archive")
+		print("Error: Failed to read data archive")
 		print("Error: " + str(e))
-		cleanup(doCleanup)
-		exit()
-
-	cleanup(doCleanup)	
+		exit(1)
 # end: main
 
 if __name__ == "__main__":
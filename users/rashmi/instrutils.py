@@ -0,0 +1,243 @@
+#! /usr/bin/env python
+
+#
+# instrutils.py
+#
+# Script with utility functions for instrumenting the stages (parsers and
+# aggregation steps) of the AFC scripts
+#
+# For each stage, the wall time, CPU time, input/output row counts and the
+# memory high-water mark of the process are recorded. Records are kept in
+# RECORDS and, if the AFC_METRICS environment variable is set, appended as JSON
+# lines to the file it names ('-' for stderr). If AFC_PROFILE is set to a stage
+# name (shell-style wildcards are allowed), matching stages are run under
+# cProfile and the profile is dumped to <stage>.<pid>.prof in AFC_PROFILE_DIR
+# (defaults to the current working directory)
+#
+# Note: CPU time and peak memory are process-wide; for stages run in threads
+# (see afc_aggregate.runParseTasks) they include the work of other threads
+#
+# Peak memory is not sampled per stage: process_peak_rss_mb is the peak
+# resident set size of the process so far (ru_maxrss, see genutils.peakRSS)
+# when the stage ends, which may have been reached by an earlier stage.
+# process_peak_rss_growth_mb is how much the stage raised that high-water
+# mark; it is 0 for a stage that stayed below the peak of earlier stages no
+# matter how much memory it used
+#
+
+import os
+import sys
+import time
+import json
+import fnmatch
+import threading
+import functools
+import cProfile
+import resource
+import genutils as genpy
+
+# environment variables controlling the output
+ENV_METRICS = 'AFC_METRICS'
+ENV_PROFILE = 'AFC_PROFILE'
+ENV_PROFILE_DIR = 'AFC_PROFILE_DIR'
+
+# records of the stages run in this process (in order of completion)
+RECORDS = []
+
+# stack of the stages being run (per thread)
+_local = threading.local()
+_lock = threading.Lock()
+
+#
+# cpuTime
+#
+# returns the user + system CPU time (in seconds) used by this process
+#
+def cpuTime():
+
+	usage = resource.getrusage(resource.RUSAGE_SELF)
+	return usage.ru_utime + usage.ru_stime
+
+#
+# countRows
+#
+# returns the number of rows in the specified value if it is a data frame or
+# series (or the total for a list/tuple of them) and None otherwise
+#
+def countRows(value):
+
+	if isinstance(value,(list,tuple)):
+		counts = [countRows(v) for v in value]
+		counts = [c for c in counts if c is not None]
+		return sum(counts) if counts else None
+
+	if hasattr(value,'index') and hasattr(value,'ndim'):
+		return len(value.index)
+
+	return None
+
+#
+# emit
+#
+# records the stage record and writes it to the metrics output (if any)
+#
+def emit(record):
+
+	with _lock:
+		RECORDS.append(record)
+
+		out = os.environ.get(ENV_METRICS)
+		if not out:
+			return
+
+		line = json.dumps(record,sort_keys=True) + "\n"
+		if out == '-':
+			sys.stderr.write(line)
+		else:
+			# appended as single writes so that records of concurrent
+			# processes do not interleave
+			with open(out,'a') as f:
+				f.write(line)
+
+#
+# profilePath
+#
+# returns the profile output file for the specified stage if it should be
+# profiled (see AFC_PROFILE) and None otherwise
+#
+def profilePath(name):
+
+	pattern = os.environ.get(ENV_PROFILE)
+	if not pattern or not fnmatch.fnmatch(name,pattern):
+		return None
+
+	outdir = os.environ.get(ENV_PROFILE_DIR,os.getcwd())
+	fname = name.replace(os.sep,'_') + "." + str(os.getpid()) + ".prof"
+
+	return os.path.join(outdir,fname)
+
+#
+# moduleName
+#
+# returns the name of the module defining func (the script name rather than
+# __main__ for functions defined in the script being run)
+#
+def moduleName(func):
+
+	module = sys.modules.get(func.__module__)
+	fname = getattr(module,'__file__',None)
+	if fname is None:
+		return func.__module__
+
+	return os.path.splitext(os.path.basename(fname))[0]
+
+#
+# Stage
+#
+# context manager instrumenting a block of code as the named stage; rows_in
+# and rows_out can be set on it while the stage runs
+#
+class Stage(object):
+
+	def __init__(self,name,rows_in=None):
+		self.name = name
+		self.rows_in = rows_in
+		self.rows_out = None
+		self.profiler = None
+
+	def __enter__(self):
+		stack = getattr(_local,'stack',None)
+		if stack is None:
+			stack = _local.stack = []
+		self.parent = stack[-1].name if stack else None
+		stack.append(self)
+
+		self.rss_start = genpy.peakRSS()
+		self.cpu_start = cpuTime()
+		self.wall_start = time.time()
+
+		self.profile_path = profilePath(self.name)
+		if self.profile_path is not None:
+			self.profiler = cProfile.Profile()
+			self.profiler.enable()
+
+		return self
+
+	def __exit__(self,exc_type,exc_value,tb):
+		wall = time.time() - self.wall_start
+		cpu = cpuTime() - self.cpu_start
+
+		if self.profiler is not None:
+			self.profiler.disable()
+			self.profiler.dump_stats(self.profile_path)
+
+		_local.stack.pop()
+
+		peak = genpy.peakRSS()
+		record = {'stage': self.name,
+				'parent': self.parent,
+				'pid': os.getpid(),
+				'wall_s': round(wall,6),
+				'cpu_s': round(cpu,6),
+				'rows_in': self.rows_in,
+				'rows_out': self.rows_out,
+				'process_peak_rss_mb': round(peak,1),
+				'process_peak_rss_growth_mb': round(peak - self.rss_start,1),
+				'status': 'ok' if exc_type is None else 'error'}
+		if exc_type is not None:
+			record['error'] = exc_type.__name__ + ": " + str(exc_value)
+		if self.profiler is not None:
+			record['profile'] = self.profile_path
+
+		emit(record)
+
+		# never swallow exceptions
+		return False
+
+#
+# stage
+#
+# returns a context manager instrumenting a block of code as the named stage
+#
+def stage(name,rows_in=None):
+	return Stage(name,rows_in)
+
+#
+# instrument
+#
+# decorator instrumenting a function as a stage (named <module>.<function>
+# unless specified); input rows are counted over the data frame/series
+# arguments and output rows over the result
+#
+def instrument(name=None):
+
+	def decorator(func):
+		stageName = name
+		if stageName is None:
+			stageName = moduleName(func) + "." + func.__name__
+
+		@functools.wraps(func)
+		def wrapper(*args,**kwargs):
+			with Stage(stageName,countRows(list(args) +
+								list(kwargs.values()))) as s:
+				result = func(*args,**kwargs)
+				s.rows_out = countRows(result)
+			return result
+
+		# the wrapped function (see cacheutils.funcDigest)
+		wrapper.__wrapped__ = func
+
+		return wrapper
+
+	return decorator
+
+#
+# writeRecords
+#
+# writes the records of the stages run in this process to the specified file
+# as a JSON list
+#
+def writeRecords(fname):
+
+	with open(fname,'w') as f:
+		json.dump(RECORDS,f,indent=2,sort_keys=True)
@@ -0,0 +1,345 @@
+#! /usr/bin/env python
+
+################################################################################
+#
+# pipeline.py
+#
+# Script to build the AFC data set by running the scripts that create the
+# intermediary data files (income_stats.py, demographics.py) and the script
+# that aggregates them (afc_aggregate.py) as stages of a dependency graph.
+#
+# Stages are linked through their input and output files. A stage is only
+# rebuilt if the content of any of its inputs or of its script (or of any of
+# the local scripts it imports) changed since it was last built (or any of its
+# outputs is missing) and stages that do not depend on each other are run
+# concurrently. A stage only counts as built if its script exits with status 0
+# and (re)creates all of its outputs.
+#
+# Usage:
+#
+# python pipeline.py [--force] [--dry-run] [--processes N]
+#
+# Dependencies:
+#
+# Data files must be present in the current working directory
+#
+################################################################################
+
+import os
+import sys
+import json
+import hashlib
+import argparse
+import importlib
+import subprocess
+from multiprocessing.pool import ThreadPool
+from collections import OrderedDict
+import cacheutils as cachepy
+
+#
+# GLOBALS
+#
+
+# current working directory
+CWD = os.getcwd()
+
+# directory containing the pipeline scripts
+SCRIPTDIR = os.path.dirname(os.path.abspath(__file__))
+
+# file recording the input digests of the last successful build of each stage
+STATEFILE = '.pipeline_state.json'
+
+# extension of the outputs of a stage while it is run (see runStage)
+PREV_EXT = '.prev'
+
+#
+# Stage
+#
+# a pipeline stage; a script (run with the specified arguments from the
+# current working directory), the files it reads and the files it writes
+#
+class Stage(object):
+
+	def __init__(self,name,script,args,inputs,outputs):
+		self.name = name
+		self.script = script
+		self.args = list(args)
+		self.inputs = list(inputs)
+		self.outputs = list(outputs)
+
+	def command(self):
+		return [sys.executable,os.path.join(SCRIPTDIR,self.script)] + self.args
+
+#
+# createStages
+#
+# returns the stages that build the AFC data set for SD county
+#
+def createStages():
+
+	import afc_aggregate as afc
+
+	stages = []
+
+	# low income population per SRA/zipcode from the ACS B17024 archives
+	for version in ['2012','2015']:
+		stages.append(Stage('income_stats_' + version,'income_stats.py',
+			[version],
+			inputs=['aff_B17024_sd_county_' + version + '.zip',
+					afc.DATAFILE_SD_GEOIDS],
+			outputs=['B17024_estimates_sd_county_55_over_' + version + '.csv',
+					'low_income_data_sd_county_' + version + '.csv',
+					'poverty_thresholds_sd_county_55_over_' + version + '.csv',
+					'poverty_thresholds_rollups_sd_county_55_over_' + version +
+					'.csv']))
+
+	# population estimates (2012) and forecasts (2030) per SRA from the SANDAG
+	# archives
+	stages.append(Stage('demographics_pop_estimate','demographics.py',
+		['pop_estimate','02062017',afc.DATAFILE_SD_2012_POP],
+		inputs=['pop_estimate_sd_02062017.zip'],
+		outputs=[afc.DATAFILE_SD_2012_POP]))
+	stages.append(Stage('demographics_pop_forecast','demographics.py',
+		['pop_forecast','01112017'],
+		inputs=['pop_forecast_sd_01112017.zip'],
+		outputs=['pop_forecast_sd_01112017.csv']))
+
+	# aggregated AFC data set
+	stages.append(Stage('afc_aggregate','afc_aggregate.py',[],
+		inputs=sorted(set(afc.DATAFILES.values())),
+		outputs=[afc.OUT_CSV]))
+
+	return stages
+
+#
+# createLevels
+#
+# orders the stages topologically and returns them as a list of levels, where
+# stages in a level only depend on stages in earlier levels
+#
+def createLevels(stages):
+
+	producers = {}
+	for stage in stages:
+		for fname in stage.outputs:
+			if fname in producers:
+				raise ValueError("output " + fname + " is produced by stages " +
+						producers[fname].name + " and " + stage.name)
+			producers[fname] = stage
+
+	deps = OrderedDict()
+	for stage in stages:
+		deps[stage.name] = set(producers[fname].name for fname in stage.inputs
+							if fname in producers)
+
+	levels = []
+	done = set()
+	remaining = list(stages)
+	while remaining:
+		level = [stage for stage in remaining if deps[stage.name] <= done]
+		if not level:
+			raise ValueError("dependency cycle between stages: " +
+					", ".join(stage.name for stage in remaining))
+		levels.append(level)
+		done.update(stage.name for stage in level)
+		remaining = [stage for stage in remaining if stage not in level]
+
+	return levels
+
+#
+# loadState / saveState
+#
+# read and write the input digests recorded for the last build of each stage
+#
+def loadState():
+
+	if not os.path.exists(os.path.join(CWD,STATEFILE)):
+		return {}
+
+	with open(os.path.join(CWD,STATEFILE)) as f:
+		return json.load(f)
+
+def saveState(state):
+
+	tmpname = os.path.join(CWD,STATEFILE + ".tmp")
+	with open(tmpname,'w') as f:
+		json.dump(state,f,indent=2,sort_keys=True)
+	os.rename(tmpname,os.path.join(CWD,STATEFILE))
+
+#
+# stageDigests
+#
+# returns the content digests of the stage inputs (None for missing inputs)
+#
+def stageDigests(stage):
+
+	digests = {}
+	for fname in stage.inputs:
+		path = os.path.join(CWD,fname)
+		digests[fname] = cachepy.fileDigest(path) if os.path.exists(path) else None
+
+	return digests
+
+#
+# scriptDigest
+#
+# returns a digest of the content of the stage script and of the local scripts
+# it imports, recursively (see cacheutils.scriptSources); a stage is rebuilt
+# when any of them changes
+#
+def scriptDigest(stage):
+
+	moduleName = os.path.splitext(stage.script)[0]
+	importlib.import_module(moduleName)
+
+	h = hashlib.sha1()
+	for fname in cachepy.scriptSources(moduleName):
+		h.update((os.path.basename(fname) + ":" +
+				cachepy.fileDigest(fname)).encode('utf-8'))
+
+	return h.hexdigest()
+
+#
+# isStale
+#
+# checks whether the stage needs to be rebuilt given the digests of its
+# inputs and the recorded state of its last build
+#
+def isStale(stage,digests,state):
+
+	if stage.name not in state:
+		return True
+
+	prev = state[stage.name]
+	if prev.get('command') != stage.args or prev.get('inputs') != digests:
+		return True
+	if prev.get('script') != scriptDigest(stage):
+		return True
+
+	for fname in stage.outputs:
+		if not os.path.exists(os.path.join(CWD,fname)):
+			return True
+
+	return False
+
+#
+# runStage
+#
+# runs the specified stage; returns its return code
+#
+# The outputs of the stage are moved aside (to <output>.prev) before it is run 
+# so that only outputs written by the run count as created by it; they are 
+# removed if the stage succeeds and restored (the stage staying stale) if it
+# fails
+#
+def runStage(stage):
+
+	print("running stage: " + stage.name)
+
+	prev = []
+	for fname in stage.outputs:
+		path = os.path.join(CWD,fname)
+		if os.path.exists(path):
+			os.rename(path,path + PREV_EXT)
+			prev.append(path)
+
+	retcode = subprocess.call(stage.command(),cwd=CWD)
+
+	missing = [fname for fname in stage.outputs
+				if not os.path.exists(os.path.join(CWD,fname))]
+	if retcode == 0 and missing:
+		retcode = 1
+		print("Error: stage " + stage.name + " did not create: " +
+				", ".join(missing))
+
+	for path in prev:
+		if retcode != 0:
+			# (replaces any output partially written by the failed run)
+			os.rename(path + PREV_EXT,path)
+		else:
+			os.remove(path + PREV_EXT)
+
+	return retcode
+
+#
+# run
+#
+# runs the stale stages of the pipeline, level by level; returns True if all
+# stages are up-to-date when done
+#
+def run(stages,force=False,dryRun=False,processes=None):
+
+	state = loadState()
+	failed = set()
+
+	for level in createLevels(stages):
+
+		stale = []; digests = {}
+		for stage in level:
+			producers = [s for s in stages if set(s.outputs) & set(stage.inputs)]
+			if any(s.name in failed for s in producers):
+				print("skipping stage: " + stage.name + " (upstream failed)")
+				failed.add(stage.name)
+				continue
+
+			digests[stage.name] = stageDigests(stage)
+			if force or isStale(stage,digests[stage.name],state):
+				stale.append(stage)
+			else:
+				print("up-to-date: " + stage.name)
+
+		if not stale:
+			continue
+
+		if dryRun:
+			for stage in stale:
+				print("would run stage: " + stage.name)
+			continue
+
+		nprocs = len(stale) if processes is None else max(1,processes)
+		pool = ThreadPool(processes=min(nprocs,len(stale)))
+		try:
+			retcodes = pool.map(runStage,stale,chunksize=1)
+		finally:
+			pool.close()
+			pool.join()
+
+		for stage, retcode in zip(stale,retcodes):
+			if retcode == 0:
+				state[stage.name] = {'command': stage.args,
+									'script': scriptDigest(stage),
+									'inputs': digests[stage.name]}
+			else:
+				print("Error: stage " + stage.name + " failed")
+				failed.add(stage.name)
+				state.pop(stage.name,None)
+
+		saveState(state)
+
+	return not failed
+
+################################################################################
+#
+# main
+#
+def main():
+
+	parser = argparse.ArgumentParser(description="Build the AFC data set, " +
+				"rebuilding only the stages whose inputs changed")
+	parser.add_argument('--force',action='store_true',
+				help="rebuild all stages")
+	parser.add_argument('--dry-run',action='store_true',
+				help="list the stages that would be rebuilt")
+	parser.add_argument('--processes',type=int,default=None,
+				help="max number of stages to run concurrently")
+	args = parser.parse_args()
+
+	if not run(createStages(),args.force,args.dry_run,args.processes):
+		exit(1)
+# end: main
+
+if __name__ == "__main__":
+	main()
+else:
+	# do nothing
+	pass
@@ -0,0 +1,170 @@
+#! /usr/bin/env python
+
+#
+# schemautils.py
+#
+# Script with utility functions for holding AFC data frames in a compact,
+# typed in-memory representation
+#
+# Col types are taken from the AFC data set schema (schema.ini, as used by
+# Tableau to read the output). Text cols (SRA, Region) as well as the zipcode
+# and ZCTA cols are held as categoricals (i.e.: integer codes into the distinct
+# values) and Integer cols (counts) as the smallest integer dtype that can hold
+# the sum of all their values, so that aggregates (per SRA, Region etc.) never
+# overflow. Float cols are left as is
+#
+# Note: Integer cols with non-numeric values (e.g.: "<5" in the ADOD counts)
+# are left as is
+#
+
+import os
+import re
+import sys
+import numpy as np
+import pandas as pd
+from collections import OrderedDict
+
+# directory containing the schema file
+SCRIPTDIR = os.path.dirname(os.path.abspath(__file__))
+
+# AFC data set schema (see schema.ini)
+SCHEMAFILE = os.path.join(SCRIPTDIR,'schema.ini')
+
+# schema col types
+TYPE_TEXT = 'Text'
+TYPE_INTEGER = 'Integer'
+TYPE_FLOAT = 'Float'
+
+# Integer cols holding geo IDs rather than counts
+ZIPCODE_COLS = ['Zipcode','ZCTA']
+
+# cols added in multi-county and panel mode (not in schema.ini)
+EXTRA_COLS = OrderedDict([('County',TYPE_TEXT),('Year',TYPE_TEXT)])
+
+# set to False to keep data frames as parsed (e.g.: to compare memory use)
+ENABLED = True
+
+# regex for col definitions, e.g.: Col1="SRA" Text
+COLDEF_REGEX = re.compile(r'^Col\d+="(.*)"\s+(\w+)')
+
+# loaded schemas, keyed by schema file
+_SCHEMAS = {}
+
+#
+# loadSchema
+#
+# returns the col types defined in the specified schema file (defaults to
+# SCHEMAFILE) as an ordered dictionary (col name -> type); cols of all
+# sections are merged
+#
+def loadSchema(schemafile=None):
+
+	if schemafile is None:
+		schemafile = SCHEMAFILE
+
+	if schemafile not in _SCHEMAS:
+		schema = OrderedDict()
+		with open(schemafile) as f:
+			for line in f:
+				m = COLDEF_REGEX.match(line.strip())
+				if m:
+					schema[m.group(1)] = m.group(2)
+		for col, coltype in EXTRA_COLS.iteritems():
+			schema.setdefault(col,coltype)
+		_SCHEMAS[schemafile] = schema
+
+	return _SCHEMAS[schemafile]
+
+#
+# smallestIntDtype
+#
+# returns the smallest signed integer dtype that can hold the sum of the
+# absolute values of the specified (integer) values
+#
+def smallestIntDtype(values):
+
+	bound = np.abs(values.astype(np.int64)).sum() if len(values) else 0
+	for dtype in [np.int8,np.int16,np.int32]:
+		if bound <= np.iinfo(dtype).max:
+			return dtype
+
+	return np.int64
+
+#
+# toCounts
+#
+# returns the specified series as the smallest safe integer dtype (see
+# smallestIntDtype) or as is if it has non-integer values
+#
+def toCounts(s):
+
+	if s.dtype == object:
+		values = pd.to_numeric(s,errors='coerce')
+		if values.isnull().any():
+			return s
+		s = values
+
+	if not np.issubdtype(s.dtype,np.integer):
+		return s
+
+	return s.astype(smallestIntDtype(s.values))
+
+#
+# applySchema
+#
+# converts the cols of the data frame that are in the schema to their compact
+# types (see above), in place, and returns the data frame; cols not in the 
+# schema are left as is
+#
+def applySchema(df,schema=None):
+
+	if not ENABLED or df is None:
+		return df
+
+	if schema is None:
+		schema = loadSchema()
+
+	for col in df.columns:
+		coltype = schema.get(col)
+		if coltype == TYPE_TEXT or col in ZIPCODE_COLS:
+			if df[col].dtype.name != 'category':
+				df[col] = df[col].astype('category')
+		elif coltype == TYPE_INTEGER:
+			df[col] = toCounts(df[col])
+
+	return df
+
+#
+# memoryUsage
+#
+# returns the memory used by each col of the data frame (including the
+# objects referenced by object cols) in bytes
+#
+def memoryUsage(df):
+	return df.memory_usage(index=False,deep=True)
+
+#
+# memoryReport
+#
+# returns a report comparing the memory used by the data frame as parsed and
+# with the schema applied (per col and in total, in bytes)
+#
+def memoryReport(df,schema=None):
+
+	before = memoryUsage(df)
+	typed = applySchema(df.copy(),schema)
+	after = memoryUsage(typed)
+
+	report = OrderedDict()
+	report['rows'] = len(df.index)
+	report['before_bytes'] = int(before.sum())
+	report['after_bytes'] = int(after.sum())
+	report['ratio'] = round(float(after.sum()) / max(1,before.sum()),3)
+	report['cols'] = OrderedDict((col,OrderedDict([
+						('before_dtype',str(df[col].dtype)),
+						('after_dtype',str(typed[col].dtype)),
+						('before_bytes',int(before[col])),
+						('after_bytes',int(after[col]))]))
+						for col in df.columns)
+
+	return report
@@ -17,6 +17,8 @@ import pandas as pd
 import numpy as np
 import pprint
 import re
+import instrutils as instrpy
+import schemautils as schemapy
 
 # current working directory
 CWD = os.getcwd()
@@ -33,6 +35,17 @@ OUT_COL_SRA = 'SRA'
 OUT_COL_Region = 'Region'
 OUT_COL_Zipcode = 'Zipcode'
 OUT_COL_ZCTA = 'ZCTA'
+# multi-county data sets only
+OUT_COL_County = 'County'
+
+# rollup levels (see computeRollups)
+LEVEL_SRA = 'SRA'
+LEVEL_Region = 'Region'
+LEVEL_County = 'County'
+LEVEL_State = 'State'
+
+# rollup col names
+ROLLUP_COL_Level = 'Level'
 
 #
 # createGeoidLookup
@@ -41,6 +54,7 @@ OUT_COL_ZCTA = 'ZCTA'
 # data file if none specified as input) and returns it as a dictionary with keys
 # representing SRA and values comprising of ZCTA, Zipcode lists and Region
 # 
+@instrpy.instrument()
 def createGeoidLookup(geoid_datafile=None):
 
 	if geoid_datafile is None:
@@ -80,27 +94,51 @@ def createGeoidLookup(geoid_datafile=None):
 	return geoid_dict
 
 #
-# createGeoidsData
+# codeZipcodes
 #
-# creates a data frame with geoID information extracted from the specified file 
-# (defaults to San Diego county geoID data file if none specified)
+# converts zipcodes/ZCTAs (as strings, possibly with surrounding whitespace, or
+# numbers) to integers; the per SRA aggregate entry ('00000') maps to 0 and
+# anything that is not a zipcode to -1
 #
-def createGeoidsData(geoid_datafile=None):
+def codeZipcodes(values):
 
-	# geoid_lookup dictionary
-	geoid_dict = {}	
-	df_geoids = None
+	values = pd.Series(values)
+	if values.dtype.name == 'category':
+		# code the distinct values only
+		codes = np.append(codeZipcodes(values.cat.categories),-1)
+		return codes[values.cat.codes.values]
 
-	try:
-		if geoid_datafile is None:
-			geoid_dict = createGeoidLookup()
-		else:
-			geoid_dict = createGeoidLookup(geoid_datafile)
+	if values.dtype == object:
+		values = values.astype(str).str.strip()
+
+	codes = pd.to_numeric(values,errors='coerce')
+
+	return codes.fillna(-1).astype(np.int64).values
+
+#
+# GeoCrosswalk
+#
+# the SRA, Region, zipcode and ZCTA crosswalk parsed from the specified geoID
+# data file, with hash indexes for lookups (zipcode -> SRAs, ZCTA -> SRAs,
+# SRA -> region and SRA -> member zipcodes/ZCTAs) and integer coded arrays
+# aligned with the rows of the geoIDs data frame (see createGeoidsData)
+#
+# Note: use getCrosswalk to get a crosswalk; it is built once per process and
+# rebuilt only if the data file is modified
+#
+class GeoCrosswalk(object):
+
+	def __init__(self,geoid_datafile):
+
+		self.datafile = geoid_datafile
+		self.mtime = os.path.getmtime(geoid_datafile)
+
+		self.lookup = createGeoidLookup(geoid_datafile)
 
 		data = []
 		# iterate the dictionary and add data pertaining to the following cols
 		# SRA, Region, Zipcode, ZCTA
-		for key, val in geoid_dict.iteritems():
+		for key, val in self.lookup.iteritems():
 			for zipcode, zcta in zip(val[1],val[2]):
 				l = [key,val[0],zipcode,zcta]
 				data.append(l)
@@ -110,7 +148,98 @@ def createGeoidsData(geoid_datafile=None):
 			data.append(l)
 
 		cols = [OUT_COL_SRA,OUT_COL_Region,OUT_COL_Zipcode,OUT_COL_ZCTA]
-		df_geoids = pd.DataFrame(columns=cols,data=data)
+		self.frame = pd.DataFrame(columns=cols,data=data)
+
+		# SRAs and regions in order of appearance in the frame
+		self.sras = list(pd.unique(self.frame[OUT_COL_SRA]))
+		self.regions = list(pd.unique(self.frame[OUT_COL_Region]))
+
+		# hash indexes
+		self.sra_region = {}
+		self.sra_zipcodes = {}
+		self.sra_zctas = {}
+		self.zipcode_sras = {}
+		self.zcta_sras = {}
+		for sra, val in self.lookup.iteritems():
+			self.sra_region[sra] = val[0]
+			self.sra_zipcodes[sra] = list(codeZipcodes(val[1]))
+			self.sra_zctas[sra] = list(codeZipcodes(val[2]))
+			for zipcode in self.sra_zipcodes[sra]:
+				self.zipcode_sras.setdefault(zipcode,[]).append(sra)
+			for zcta in self.sra_zctas[sra]:
+				self.zcta_sras.setdefault(zcta,[]).append(sra)
+
+		# integer coded arrays (one entry per row of the frame)
+		self.sra_codes = pd.Index(self.sras).get_indexer(self.frame[OUT_COL_SRA])
+		self.region_codes = pd.Index(self.regions).get_indexer(
+								self.frame[OUT_COL_Region])
+		self.zipcodes = codeZipcodes(self.frame[OUT_COL_Zipcode])
+		self.zctas = codeZipcodes(self.frame[OUT_COL_ZCTA])
+		self.agg_rows = self.zipcodes == 0
+
+	#
+	# isCurrent
+	#
+	# checks whether the crosswalk reflects the current contents of its file
+	#
+	def isCurrent(self):
+		return os.path.getmtime(self.datafile) == self.mtime
+
+	#
+	# geoidsData
+	#
+	# returns (a copy of) the geoIDs data frame (SRA, Region, Zipcode, ZCTA)
+	# with an additional row per SRA ('00000') to hold aggregates
+	#
+	def geoidsData(self):
+		return self.frame.copy()
+
+	#
+	# sraCodes
+	#
+	# returns the integer codes of the specified SRAs (-1 for unknown SRAs)
+	#
+	def sraCodes(self,sras):
+		return pd.Index(self.sras).get_indexer(sras)
+
+# crosswalks built in this process, keyed by (absolute) data file path
+_CROSSWALKS = {}
+
+#
+# getCrosswalk
+#
+# returns the crosswalk for the specified geoID data file (defaults to SD 
+# county geo data file); built once per process and rebuilt if the file has 
+# been modified since
+#
+def getCrosswalk(geoid_datafile=None):
+
+	if geoid_datafile is None:
+		geoid_datafile = DATAFILE_SD_GEOIDS
+
+	key = os.path.abspath(geoid_datafile)
+	xwalk = _CROSSWALKS.get(key)
+	if xwalk is None or not xwalk.isCurrent():
+		xwalk = GeoCrosswalk(geoid_datafile)
+		_CROSSWALKS[key] = xwalk
+
+	return xwalk
+
+#
+# createGeoidsData
+#
+# creates a data frame with geoID information extracted from the specified file 
+# (defaults to San Diego county geoID data file if none specified); geoIDs are
+# held as categoricals (see schemautils)
+#
+@instrpy.instrument()
+def createGeoidsData(geoid_datafile=None):
+
+	df_geoids = None
+
+	try:
+		df_geoids = schemapy.applySchema(
+						getCrosswalk(geoid_datafile).geoidsData())
 					
 	except Exception, e:
 		exc_type, exc_obj, exc_tb = sys.exc_info()
@@ -121,6 +250,52 @@ def createGeoidsData(geoid_datafile=None):
 	#print df_geoids
 	return df_geoids
 
+#
+# joinSRAData
+#
+# returns the values (cols of df, which is indexed by SRA) for the rows of 
+# srazipdf (SRA, Zipcode) holding SRA aggregates and fill elsewhere (and for
+# SRAs not in df); joined through integer codes rather than per row lookups
+#
+def joinSRAData(srazipdf,df,cols,fill=0):
+
+	df = df[~df.index.duplicated(keep='last')]
+	idx = df.index.get_indexer(srazipdf[OUT_COL_SRA])
+	rows = (codeZipcodes(srazipdf[OUT_COL_Zipcode]) == 0) & (idx >= 0)
+
+	return joinRows(df[cols].values,idx,rows,cols,fill)
+
+#
+# joinSRAZipData
+#
+# returns the values (cols of df, which is indexed by SRA and integer 
+# zipcode) for the rows of srazipdf (SRA, Zipcode) and fill for the rows not
+# in df
+#
+def joinSRAZipData(srazipdf,df,cols,fill=0):
+
+	df = df[~df.index.duplicated(keep='last')]
+	keys = pd.MultiIndex.from_arrays([srazipdf[OUT_COL_SRA].values,
+							codeZipcodes(srazipdf[OUT_COL_Zipcode])])
+	idx = df.index.get_indexer(keys)
+	rows = idx >= 0
+
+	return joinRows(df[cols].values,idx,rows,cols,fill)
+
+#
+# joinRows
+#
+# returns a data frame with the rows of values at idx in the selected rows and
+# fill elsewhere (keeps the dtype of values)
+#
+def joinRows(values,idx,rows,cols,fill):
+
+	data = np.empty((len(idx),len(cols)),dtype=values.dtype)
+	data.fill(fill)
+	data[rows] = values[idx[rows]]
+
+	return pd.DataFrame(columns=cols,data=data)
+
 #
 # addSRAaggregates
 #
@@ -130,18 +305,21 @@ def createGeoidsData(geoid_datafile=None):
 # 
 # Note: 
 # 1. This requires that data be in a specific format (see df_geoids dataframe)
+#    i.e.: the entry holding the aggregates is the last row of each SRA
 # 2. Values in targetCols MUST be numeric since the sum operation is applied to
 #    them in this function
 #       
+@instrpy.instrument()
 def addSRAaggregates(df,targetCols):
 	
 	try:	
-		for name, group in df.groupby('SRA'):
-				idx = group.last_valid_index()
-				#print df.loc[[idx]]
+		# a single grouped sum across all target cols (rather than a sum per
+		# col per SRA)
+		aggRows = ~df.duplicated(OUT_COL_SRA,keep='last')
 
-				for col in targetCols:
-					df.set_value(idx,col,group[col].sum())
+		totals = df.groupby(OUT_COL_SRA,sort=False,
+						observed=True)[targetCols].transform('sum')
+		df.loc[aggRows,targetCols] = totals[aggRows]
 
 	except Exception, e:
 		exc_type, exc_obj, exc_tb = sys.exc_info()
@@ -151,3 +329,64 @@ def addSRAaggregates(df,targetCols):
 
 	#print df.head()	
 	return df			
+
+#
+# computeRollups
+#
+# rolls up per zipcode/ZCTA data (targetCols of the specified data frame) to 
+# every level of the geo hierarchy (SRA, Region, County and, if state is 
+# specified, statewide) and returns the rollups as a separate data frame with
+# a row per SRA, region, county (and state); the Level col marks the level of
+# each row and cols of finer levels are left empty
+#
+# SRA totals are summed over the zipcode rows (SRA aggregate rows are skipped)
+# or, if aggregated is set, taken from the SRA aggregate rows ('00000') as is
+# (e.g.: for data sets with per SRA only cols). county is the name used for 
+# the county level if the data frame has no County col (single county data)
+#
+# Note: values in targetCols MUST be numeric (NaNs are skipped)
+#
+@instrpy.instrument()
+def computeRollups(df,targetCols,county=None,state=None,aggregated=False):
+
+	hasCounty = OUT_COL_County in df.columns
+	keys = ([OUT_COL_County] if hasCounty else []) + [OUT_COL_Region,
+																OUT_COL_SRA]
+
+	aggRows = codeZipcodes(df[OUT_COL_Zipcode]) == 0
+	if aggregated:
+		sra_df = df.loc[aggRows,keys + targetCols].reset_index(drop=True)
+	else:
+		# the only pass over the zipcode rows; coarser levels are rolled up 
+		# from the SRA totals
+		sra_df = df[~aggRows].groupby(keys,sort=False,
+						observed=True)[targetCols].sum()
+		sra_df = sra_df.reset_index()
+	if not hasCounty:
+		sra_df.insert(0,OUT_COL_County,county)
+
+	region_df = sra_df.groupby([OUT_COL_County,OUT_COL_Region],sort=False,
+						observed=True)[targetCols].sum().reset_index()
+	county_df = sra_df.groupby(OUT_COL_County,sort=False,
+						observed=True)[targetCols].sum().reset_index()
+
+	levels = [(LEVEL_SRA,sra_df),(LEVEL_Region,region_df),
+			(LEVEL_County,county_df)]
+	if state is not None:
+		state_df = pd.DataFrame([sra_df[targetCols].sum()],columns=targetCols)
+		levels.append((LEVEL_State,state_df))
+
+	cols = [ROLLUP_COL_Level,LEVEL_State,OUT_COL_County,OUT_COL_Region,
+			OUT_COL_SRA] + targetCols
+
+	frames = []
+	for level, level_df in levels:
+		level_df = level_df.copy()
+		level_df[ROLLUP_COL_Level] = level
+		level_df[LEVEL_State] = state
+		frames.append(level_df.reindex(columns=cols))
+
+	rollup_df = pd.concat(frames,axis=0,ignore_index=True)
+	
+	#print rollup_df
+	return rollup_df